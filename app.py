@@ -7,6 +7,11 @@ Dashboard interativo para otimização de portfólios usando
 a Teoria Moderna do Portfólio de Markowitz.
 """
 
+import time
+import threading
+from contextlib import closing
+_INICIO_SCRIPT = time.perf_counter()  # Referência dos tempos de arranque (profiling.registar_arranque)
+
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -20,49 +25,102 @@ st.set_page_config(
 )
 
 from assets import ATIVOS_B3, SETORES, get_tickers_by_setor, get_ticker_info, get_all_tickers, get_top75_tickers
-from risk_profiles import PERFIS_RISCO, get_perfil, get_nomes_perfis, TAXA_SELIC
-from data_loader import carregar_dados_completos, baixar_dados_historicos, baixar_cdi_historico
-from optimizer import otimizar_por_perfil, gerar_fronteira_eficiente
+from risk_profiles import PERFIS_RISCO, get_perfil, get_nomes_perfis, obter_taxa_selic
+from data_loader import carregar_dados_universo, baixar_dados_historicos, baixar_cdi_historico
+from covariance import METODO_PADRAO, NOMES_ESTIMADORES
+from profiling import etapa, perfilar_memoria, registar_arranque, tempos_arranque
+from stress_test import MotorStress
+from optimizer import otimizar_por_perfil, gerar_fronteira_eficiente, gerar_nuvem_portfolios
 from visualizations import (
-    grafico_fronteira_eficiente, grafico_composicao_pizza,
-    grafico_barras_alocacao, grafico_matriz_correlacao,
+    grafico_fronteira_eficiente, grafico_superficie_fronteira, grafico_composicao_pizza,
+    grafico_barras_alocacao, grafico_matriz_correlacao, blocos_correlacao,
     grafico_evolucao_precos,
-    grafico_backtesting, grafico_drawdown, grafico_metricas_risco
+    grafico_backtesting, grafico_drawdown, grafico_metricas_risco, grafico_stress_cenarios,
+    grafico_comparacao_benchmarks, MAX_PONTOS_SERIE
 )
 from backtesting import (
-    backtesting_walk_forward, backtesting_pesos_fixos, calcular_metricas_risco_portfolio,
-    comparar_com_benchmark
+    iterar_walk_forward, concluir_walk_forward, backtesting_matricial, calcular_metricas_risco_portfolio,
+    superficie_fronteira_walk_forward,
+    comparar_com_benchmarks, acumular_cdi
 )
 
-# Taxa Selic obtida automaticamente via API do BCB (risk_profiles.py)
-taxa_selic = TAXA_SELIC
+registar_arranque("importacoes", _INICIO_SCRIPT)
+
+# Taxa Selic obtida automaticamente via API do BCB (risk_profiles.py, em cache 24h)
+taxa_selic = obter_taxa_selic()
+
+
+def backtest_oos_progressivo(chave, precos, perfil, orcamento, n_ativos_max, peso_maximo, taxa, serie_cdi,
+                             metodo_covariancia=METODO_PADRAO):
+    """
+    Walk-Forward desenhado janela a janela (barra de progresso e curva de capital parcial).
+    O resultado completo fica na sessão para os reruns com a mesma `chave`. Uma execução nova
+    ativa o evento de cancelamento da anterior, e a interrupção do script pelo Streamlit
+    (mudança de um widget) fecha o gerador: nenhuma janela é otimizada em vão.
+    """
+    guardado = st.session_state.get('walk_forward')
+    if guardado is not None and guardado['chave'] == chave:
+        return guardado['resultado']
+
+    anterior = st.session_state.get('walk_forward_cancelamento')
+    if anterior is not None:
+        anterior.set()
+    cancelamento = st.session_state['walk_forward_cancelamento'] = threading.Event()
+
+    progresso = st.progress(0.0, text="Walk-Forward: otimizando a primeira janela...")
+    grafico = st.empty()
+    janelas, curva = [], None
+    with closing(iterar_walk_forward(
+        precos, perfil, janela_treino=252 * 2, janela_teste=63, capital_inicial=orcamento,
+        taxa_livre_risco=taxa, n_ativos_max=n_ativos_max, peso_maximo=peso_maximo,
+        metodo_covariancia=metodo_covariancia, cancelamento=cancelamento
+    )) as gerador:
+        for janela in gerador:
+            janelas.append(janela)
+            curva = janela.segmento if curva is None else pd.concat([curva, janela.segmento.iloc[1:]])
+            m = janela.metricas
+            progresso.progress(janela.progresso, text=(
+                f"Walk-Forward: janela {janela.indice + 1}/{janela.n_janelas} "
+                f"({janela.data_otimizacao:%m/%Y}) | retorno {m['retorno_total']*100:.1f}%, "
+                f"drawdown maximo {m['max_drawdown']*100:.1f}%"
+            ))
+            grafico.line_chart(curva.rename("Carteira (Walk-Forward)"), height=220)
+    progresso.empty()
+    grafico.empty()
+
+    resultado = concluir_walk_forward(janelas, orcamento, taxa, serie_cdi)
+    if not cancelamento.is_set():
+        st.session_state['walk_forward'] = {'chave': chave, 'resultado': resultado}
+    return resultado
 
 
 @st.cache_data(show_spinner=False)
-def cached_backtest_oos(_precos, perfil, orcamento, n_ativos_max, peso_maximo, _taxa, _serie_cdi):
-    return backtesting_walk_forward(
+def cached_superficie_fronteira(_precos, tickers, periodo, n_ativos_max, peso_maximo, taxa,
+                                metodo_covariancia=METODO_PADRAO):
+    """Os preços não entram na chave da cache: tickers e periodo (início, fim) identificam-nos."""
+    return superficie_fronteira_walk_forward(
         precos=_precos,
-        perfil=perfil,
         janela_treino=252 * 2,
         janela_teste=63,
-        capital_inicial=orcamento,
-        taxa_livre_risco=_taxa,
-        n_ativos_max=n_ativos_max,
+        n_pontos=30,
+        taxa_livre_risco=taxa,
         peso_maximo=peso_maximo,
-        serie_cdi_diario=_serie_cdi
+        n_ativos_max=n_ativos_max,
+        metodo_covariancia=metodo_covariancia
     )
 
 
 @st.cache_data(show_spinner=False)
-def cached_backtest_is(_precos, pesos_dict, orcamento, _taxa, _serie_cdi):
-    return backtesting_pesos_fixos(
+def cached_backtest_is(_precos, carteiras, orcamento, _taxa, _serie_cdi):
+    """Backtests de pesos fixos de todas as carteiras {nome: {ticker: peso}} numa só passagem."""
+    return backtesting_matricial(
         precos=_precos,
-        pesos=pesos_dict,
+        pesos=carteiras,
         janela_rebalanceamento=63,
         capital_inicial=orcamento,
         taxa_livre_risco=_taxa,
         serie_cdi_diario=_serie_cdi
-    )
+    )['resultados']
 
 
 # ============== CSS PERSONALIZADO (TEMA ESCURO) ==============
@@ -223,11 +281,13 @@ def main():
         perfil = get_perfil(perfil_nome)
 
         # Cores e objetivos por perfil
-        cores_perfil = {"Conservador": "#00D4AA", "Moderado": "#FFB74D", "Agressivo": "#FF5252"}
+        cores_perfil = {"Conservador": "#00D4AA", "Moderado": "#FFB74D", "Agressivo": "#FF5252",
+                        "Paridade de Risco": "#B388FF"}
         objetivos_perfil = {
             "Conservador": "Minimiza Volatilidade",
             "Moderado": "Maximiza Sharpe",
-            "Agressivo": "Maximiza Retorno"
+            "Agressivo": "Maximiza Retorno",
+            "Paridade de Risco": "Iguala Contribuicoes de Risco"
         }
         cor = cores_perfil[perfil_nome]
 
@@ -308,6 +368,37 @@ def main():
                 help="Limite maximo de alocacao em um unico ativo"
             ) / 100
 
+            metodo_covariancia = st.selectbox(
+                "Estimador da covariancia:",
+                options=list(NOMES_ESTIMADORES),
+                format_func=NOMES_ESTIMADORES.get,
+                index=list(NOMES_ESTIMADORES).index(METODO_PADRAO),
+                help="Usado na otimizacao e em cada janela do Walk-Forward"
+            )
+
+            modo_compacto = st.checkbox(
+                "Modo compacto (float32)",
+                value=False,
+                help="Guarda precos e retornos em float32: metade da memoria por sessao. "
+                     "Estatisticas e otimizacao continuam em float64."
+            )
+
+            resolucao_total = st.checkbox(
+                "Graficos em resolucao total",
+                value=False,
+                help="Por omissao as series longas sao reduzidas (LTTB) a ~1500 pontos por curva, "
+                     "preservando picos e vales. Ative para enviar todos os pontos (zoom detalhado)."
+            )
+            max_pontos_graficos = None if resolucao_total else MAX_PONTOS_SERIE
+
+            st.checkbox(
+                "Perfil de memoria (tracemalloc)",
+                value=False,
+                key="perfilar_memoria",
+                help="Mede a memoria retida e de pico de cada etapa desta execucao (mais lento). "
+                     "O relatorio aparece no fim da pagina."
+            )
+
         # Info de ativos selecionados
         if setores_selecionados:
             n_disponiveis = len(get_tickers_by_setor(setores_selecionados))
@@ -338,8 +429,9 @@ def main():
         st.error("Selecione setores com pelo menos 3 ativos disponiveis.")
         return
 
-    # Carrega dados
-    dados = carregar_dados_completos(tickers, anos=periodo_anos)
+    # Carrega dados: o universo completo é processado uma vez e cada filtro é uma fatia dele
+    dados = carregar_dados_universo(tickers, anos=periodo_anos, compacto=modo_compacto,
+                                    metodo_covariancia=metodo_covariancia)
 
     if dados is None:
         st.error("Erro ao carregar dados. Verifique sua conexao.")
@@ -357,7 +449,7 @@ def main():
     st.markdown("---")
 
     # ============== OTIMIZACAO ==============
-    params_key = f"{perfil_nome}_{taxa_selic:.4f}_{peso_maximo:.2f}_{n_ativos_max}_{dados['n_ativos']}_{periodo_anos}"
+    params_key = f"{perfil_nome}_{taxa_selic:.4f}_{peso_maximo:.2f}_{n_ativos_max}_{dados['n_ativos']}_{periodo_anos}_{metodo_covariancia}_{modo_compacto}"
 
     needs_optimization = (
         otimizar or
@@ -367,30 +459,48 @@ def main():
 
     if needs_optimization:
         with st.spinner(f"Otimizando carteira ({perfil_nome})..."):
-            resultado = otimizar_por_perfil(
-                perfil=perfil_nome,
-                retornos_medios=dados['retornos_medios'],
-                matriz_cov=dados['matriz_cov'],
-                taxa_livre_risco=taxa_selic,
-                peso_maximo=peso_maximo,
-                n_ativos_max=n_ativos_max
-            )
+            with etapa("otimizacao"):
+                resultado = otimizar_por_perfil(
+                    perfil=perfil_nome,
+                    retornos_medios=dados['retornos_medios'],
+                    matriz_cov=dados['matriz_cov'],
+                    taxa_livre_risco=taxa_selic,
+                    peso_maximo=peso_maximo,
+                    n_ativos_max=n_ativos_max
+                )
 
-            fronteira = gerar_fronteira_eficiente(
-                dados['retornos_medios'],
-                dados['matriz_cov'],
-                taxa_selic,
-                n_pontos=30,
-                peso_maximo=peso_maximo,
-                n_ativos_max=n_ativos_max
-            )
+            with etapa("fronteira"):
+                fronteira, pesos_fronteira = gerar_fronteira_eficiente(
+                    dados['retornos_medios'],
+                    dados['matriz_cov'],
+                    taxa_selic,
+                    n_pontos=30,
+                    peso_maximo=peso_maximo,
+                    n_ativos_max=n_ativos_max,
+                    retornar_pesos=True
+                )
+
+            # Região viável (Monte Carlo) resumida por densidade para o gráfico
+            with etapa("nuvem"):
+                nuvem = gerar_nuvem_portfolios(
+                    dados['retornos_medios'],
+                    dados['matriz_cov'],
+                    taxa_selic,
+                    n_amostras=200_000,
+                    peso_maximo=peso_maximo,
+                    ancoras=pesos_fronteira
+                )
 
             st.session_state['resultado'] = resultado
             st.session_state['fronteira'] = fronteira
+            st.session_state['pesos_fronteira'] = pesos_fronteira
+            st.session_state['nuvem'] = nuvem
             st.session_state['params_key'] = params_key
     else:
         resultado = st.session_state['resultado']
         fronteira = st.session_state['fronteira']
+        pesos_fronteira = st.session_state['pesos_fronteira']
+        nuvem = st.session_state['nuvem']
 
     if not resultado.sucesso:
         st.warning(f"Otimizacao com aviso: {resultado.mensagem}")
@@ -450,25 +560,27 @@ def main():
     benchmark_1n = {'retorno': ret_1n_frontier, 'volatilidade': vol_1n_frontier}
 
     # Linha 1: Fronteira + Composicao
-    col1, col2 = st.columns([1.2, 1])
-
-    with col1:
-        fig_fronteira = grafico_fronteira_eficiente(
-            fronteira,
-            {'retorno': resultado.retorno_esperado, 'volatilidade': resultado.volatilidade},
-            perfil_nome,
-            taxa_selic,
-            benchmark_1n=benchmark_1n
-        )
-        st.plotly_chart(fig_fronteira, use_container_width=True)
+    with etapa("graficos_carteira"):
+        col1, col2 = st.columns([1.2, 1])
+
+        with col1:
+            fig_fronteira = grafico_fronteira_eficiente(
+                fronteira,
+                {'retorno': resultado.retorno_esperado, 'volatilidade': resultado.volatilidade},
+                perfil_nome,
+                taxa_selic,
+                benchmark_1n=benchmark_1n,
+                nuvem=nuvem
+            )
+            st.plotly_chart(fig_fronteira, use_container_width=True)
 
-    with col2:
-        fig_pizza = grafico_composicao_pizza(pesos_dict, orcamento)
-        st.plotly_chart(fig_pizza, use_container_width=True)
+        with col2:
+            fig_pizza = grafico_composicao_pizza(pesos_dict, orcamento)
+            st.plotly_chart(fig_pizza, use_container_width=True)
 
-    # Linha 2: Barras
-    fig_barras = grafico_barras_alocacao(pesos_dict, orcamento, info_tickers)
-    st.plotly_chart(fig_barras, use_container_width=True)
+        # Linha 2: Barras
+        fig_barras = grafico_barras_alocacao(pesos_dict, orcamento, info_tickers)
+        st.plotly_chart(fig_barras, use_container_width=True)
 
     st.markdown("---")
 
@@ -491,16 +603,30 @@ def main():
 
     # ============== ANALISES ADICIONAIS ==============
     with st.expander("Ver Matriz de Correlacao", expanded=False):
-        tickers_carteira = [t for t, p in pesos_dict.items() if p > 0.01]
-        if len(tickers_carteira) > 1:
-            matriz_filtrada = dados['matriz_cov'].loc[tickers_carteira, tickers_carteira]
-            fig_corr = grafico_matriz_correlacao(matriz_filtrada)
+        escopo_corr = st.radio("Ativos:", ["Carteira", "Universo analisado"], horizontal=True,
+                               key="escopo_correlacao")
+        if escopo_corr == "Carteira":
+            tickers_carteira = [t for t, p in pesos_dict.items() if p > 0.01]
+            if len(tickers_carteira) > 1:
+                matriz_filtrada = dados['matriz_cov'].loc[tickers_carteira, tickers_carteira]
+                fig_corr = grafico_matriz_correlacao(matriz_filtrada)
+                st.plotly_chart(fig_corr, use_container_width=True)
+        else:
+            # Universos grandes: vista agregada por blocos com drill-down
+            col_agr, col_bloco = st.columns(2)
+            agrupar_por = col_agr.selectbox("Agrupar por:", ["setor", "cluster"],
+                                            format_func=str.capitalize, key="agrupar_correlacao")
+            blocos = blocos_correlacao(dados['matriz_cov'], agrupar_por)
+            bloco = col_bloco.selectbox("Detalhar bloco:", ["Todos"] + list(blocos), key="bloco_correlacao")
+            fig_corr = grafico_matriz_correlacao(dados['matriz_cov'], agrupar_por=agrupar_por,
+                                                 bloco=None if bloco == "Todos" else bloco)
             st.plotly_chart(fig_corr, use_container_width=True)
 
     with st.expander("Ver Evolucao Historica dos Precos", expanded=False):
         tickers_carteira = [t for t, p in pesos_dict.items() if p > 0.02][:10]
         if tickers_carteira:
-            fig_evolucao = grafico_evolucao_precos(dados['precos'], tickers_carteira)
+            fig_evolucao = grafico_evolucao_precos(dados['precos'], tickers_carteira,
+                                                   max_pontos=max_pontos_graficos)
             st.plotly_chart(fig_evolucao, use_container_width=True)
 
     with st.expander("Ver Metricas Individuais dos Ativos", expanded=False):
@@ -521,40 +647,41 @@ def main():
         )
     )
 
-    with st.spinner('Executando backtesting...'):
+    with st.spinner('Executando backtesting...'), etapa("backtests"):
         # Busca série histórica do CDI diário para Sharpe/Sortino corretos
         serie_cdi = baixar_cdi_historico(anos=periodo_anos)
         if serie_cdi.empty:
             st.warning("CDI histórico indisponível. Sharpe/Sortino usarão Selic constante como fallback.")
 
+        # Pesos fixos da carteira otimizada e benchmark 1/N (exigido pela Q1 do TCC) numa só simulação
+        pesos_1n = {t: 1.0 / dados['n_ativos'] for t in dados['tickers']}
+        backtests_fixos = cached_backtest_is(
+            _precos=dados['precos'],
+            carteiras={'otimizada': pesos_dict, '1/N': pesos_1n},
+            orcamento=orcamento,
+            _taxa=taxa_selic,
+            _serie_cdi=serie_cdi
+        )
+        backtest_1n = backtests_fixos['1/N']
+
         if "Walk-Forward" in tipo_backtest:
             try:
-                backtest = cached_backtest_oos(
-                    _precos=dados['precos'],
+                backtest = backtest_oos_progressivo(
+                    chave=f"{params_key}_{orcamento}_{dados['periodo_fim']}",
+                    precos=dados['precos'],
                     perfil=perfil_nome,
                     orcamento=orcamento,
                     n_ativos_max=n_ativos_max,
                     peso_maximo=peso_maximo,
-                    _taxa=taxa_selic,
-                    _serie_cdi=serie_cdi
+                    taxa=taxa_selic,
+                    serie_cdi=serie_cdi,
+                    metodo_covariancia=metodo_covariancia
                 )
             except Exception as e:
                 st.error(f"Erro no Walk-Forward: {e}. Usando Pesos Fixos como fallback.")
-                backtest = cached_backtest_is(
-                    _precos=dados['precos'],
-                    pesos_dict=pesos_dict,
-                    orcamento=orcamento,
-                    _taxa=taxa_selic,
-                    _serie_cdi=serie_cdi
-                )
+                backtest = backtests_fixos['otimizada']
         else:
-            backtest = cached_backtest_is(
-                _precos=dados['precos'],
-                pesos_dict=pesos_dict,
-                orcamento=orcamento,
-                _taxa=taxa_selic,
-                _serie_cdi=serie_cdi
-            )
+            backtest = backtests_fixos['otimizada']
 
         metricas_risco = calcular_metricas_risco_portfolio(
             retornos=dados['retornos'],
@@ -562,25 +689,12 @@ def main():
             taxa_livre_risco=taxa_selic
         )
 
-        # Benchmark 1/N (carteira equiponderada) — exigido pela Q1 do TCC
-        pesos_1n = {t: 1.0 / dados['n_ativos'] for t in dados['tickers']}
-        backtest_1n = cached_backtest_is(
-            _precos=dados['precos'],
-            pesos_dict=pesos_1n,
-            orcamento=orcamento,
-            _taxa=taxa_selic,
-            _serie_cdi=serie_cdi
-        )
-
-        # Dados do Ibovespa para comparacao
+        # Indices de mercado para comparacao (Ibovespa e small caps) num so download
         try:
-            ibov = baixar_dados_historicos(['^BVSP'], anos=periodo_anos)
-            if not ibov.empty:
-                ibov_serie = ibov['^BVSP'] if '^BVSP' in ibov.columns else ibov.iloc[:, 0]
-            else:
-                ibov_serie = None
+            indices = baixar_dados_historicos(['^BVSP', 'SMAL11.SA'], anos=periodo_anos)
         except Exception:
-            ibov_serie = None
+            indices = pd.DataFrame()
+        ibov_serie = indices['^BVSP'] if '^BVSP' in indices.columns else None
 
     # Metricas de Backtesting
     col1, col2, col3, col4 = st.columns(4)
@@ -619,25 +733,71 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
-    # Grafico de Backtesting
-    col1, col2 = st.columns([1.5, 1])
+    with etapa("graficos_backtest"):
+        # Grafico de Backtesting
+        col1, col2 = st.columns([1.5, 1])
+
+        with col1:
+            fig_backtest = grafico_backtesting(
+                serie_carteira=backtest['serie_carteira'],
+                serie_benchmark=ibov_serie,
+                nome_benchmark="Ibovespa",
+                serie_1n=backtest_1n['serie_carteira'],
+                max_pontos=max_pontos_graficos
+            )
+            st.plotly_chart(fig_backtest, use_container_width=True)
 
-    with col1:
-        fig_backtest = grafico_backtesting(
-            serie_carteira=backtest['serie_carteira'],
-            serie_benchmark=ibov_serie,
-            nome_benchmark="Ibovespa",
-            serie_1n=backtest_1n['serie_carteira']
-        )
-        st.plotly_chart(fig_backtest, use_container_width=True)
+        with col2:
+            fig_risco = grafico_metricas_risco(metricas_risco)
+            st.plotly_chart(fig_risco, use_container_width=True)
 
-    with col2:
-        fig_risco = grafico_metricas_risco(metricas_risco)
-        st.plotly_chart(fig_risco, use_container_width=True)
+        # Grafico de Drawdown
+        fig_dd = grafico_drawdown(backtest['drawdown_serie'], max_pontos=max_pontos_graficos)
+        st.plotly_chart(fig_dd, use_container_width=True)
 
-    # Grafico de Drawdown
-    fig_dd = grafico_drawdown(backtest['drawdown_serie'])
-    st.plotly_chart(fig_dd, use_container_width=True)
+    with st.expander("Ver Cenarios de Stress Historicos", expanded=False):
+        with etapa("stress"):
+            motor_stress = MotorStress(dados['retornos'])
+        if not motor_stress.cenarios:
+            st.info("Nenhum cenario de crise historica cai no periodo carregado. Aumente o periodo de analise.")
+        else:
+            stress = motor_stress.avaliar(pd.DataFrame([pesos_dict, pesos_1n], index=["Carteira Otimizada", "Benchmark 1/N"]))
+            metrica_stress = st.radio("Metrica:", ["pnl", "pior_dia", "max_drawdown"], horizontal=True,
+                                      format_func={'pnl': "Retorno acumulado", 'pior_dia': "Pior dia",
+                                                   'max_drawdown': "Drawdown maximo"}.get,
+                                      key="metrica_stress")
+            st.plotly_chart(grafico_stress_cenarios(stress, metrica_stress), use_container_width=True)
+
+            # Mesmo produto matricial para todos os pontos da fronteira
+            if len(pesos_fronteira) and len(pesos_fronteira) == len(fronteira):
+                stress_fronteira = motor_stress.avaliar(
+                    pd.DataFrame(pesos_fronteira, columns=dados['retornos_medios'].index)
+                ).metrica(metrica_stress) * 100
+                st.caption(f"Ao longo dos {len(fronteira)} pontos da fronteira eficiente (%):")
+                st.dataframe(pd.DataFrame({'Pior': stress_fronteira.min(axis=1), 'Melhor': stress_fronteira.max(axis=1)})
+                             .round(2), use_container_width=True)
+            if motor_stress.parciais:
+                st.caption(f"Apenas em parte no periodo carregado: {', '.join(motor_stress.parciais)}.")
+            if motor_stress.ignorados:
+                st.caption(f"Fora do periodo carregado: {', '.join(motor_stress.ignorados)}.")
+
+    with st.expander("Ver Evolucao da Fronteira Eficiente (Walk-Forward)", expanded=False):
+        st.caption("Fronteira de cada janela de treino (2 anos), avancando um trimestre por quadro.")
+        if st.checkbox("Calcular a fronteira de todas as janelas", key="calcular_superficie"):
+            try:
+                with st.spinner('Calculando fronteiras por janela...'), etapa("superficie_fronteira"):
+                    superficie = cached_superficie_fronteira(
+                        _precos=dados['precos'],
+                        tickers=tuple(dados['tickers']),
+                        periodo=(dados['periodo_inicio'], dados['periodo_fim']),
+                        n_ativos_max=n_ativos_max,
+                        peso_maximo=peso_maximo,
+                        taxa=round(taxa_selic, 6),
+                        metodo_covariancia=metodo_covariancia
+                    )
+                st.plotly_chart(grafico_superficie_fronteira(superficie, taxa_selic), use_container_width=True)
+            except ValueError as e:
+                st.warning(f"Evolucao da fronteira indisponivel: {e}")
 
     # ============== TABELA COMPARATIVA: Otimizada vs 1/N vs Ibovespa ==============
     st.markdown("### Comparacao: Otimizada vs Benchmark 1/N")
@@ -678,6 +838,50 @@ def main():
     df_comparacao = pd.DataFrame(comparacao_data)
     st.dataframe(df_comparacao, use_container_width=True, hide_index=True)
 
+    with st.expander("Ver Comparacao com Benchmarks (Alpha, Beta, Tracking Error)", expanded=False):
+        benchmarks = {
+            'Ibovespa': ibov_serie,
+            'Small Caps (SMAL11)': indices['SMAL11.SA'] if 'SMAL11.SA' in indices.columns else None,
+            'Benchmark 1/N': backtest_1n['serie_carteira'],
+            'CDI': acumular_cdi(serie_cdi) if not serie_cdi.empty else None,
+        }
+        if st.checkbox("Incluir os outros perfis (pesos fixos, otimizados no periodo completo)",
+                       key="benchmarks_perfis"):
+            with st.spinner("Otimizando os outros perfis..."), etapa("benchmarks_perfis"):
+                carteiras_perfis = {}
+                for outro in get_nomes_perfis():
+                    if outro == perfil_nome:
+                        continue
+                    res = otimizar_por_perfil(perfil=outro, retornos_medios=dados['retornos_medios'],
+                                              matriz_cov=dados['matriz_cov'], taxa_livre_risco=taxa_selic,
+                                              peso_maximo=peso_maximo, n_ativos_max=n_ativos_max)
+                    if res.sucesso:
+                        carteiras_perfis[f"Perfil {outro}"] = {t: p for t, p in zip(res.tickers, res.pesos) if p > 0.001}
+                if carteiras_perfis:
+                    backtests_perfis = cached_backtest_is(_precos=dados['precos'], carteiras=carteiras_perfis,
+                                                          orcamento=orcamento, _taxa=taxa_selic, _serie_cdi=serie_cdi)
+                    benchmarks.update({nome: r['serie_carteira'] for nome, r in backtests_perfis.items()})
+
+        benchmarks = {nome: serie for nome, serie in benchmarks.items() if serie is not None}
+        try:
+            comparacao = comparar_com_benchmarks(backtest['serie_carteira'].rename(f"Otimizada ({perfil_nome})"),
+                                                 benchmarks, taxa_selic)
+        except ValueError as e:
+            st.warning(f"Comparacao indisponivel: {e}")
+        else:
+            st.plotly_chart(grafico_comparacao_benchmarks(comparacao, max_pontos_graficos), use_container_width=True)
+            tabela = comparacao.metricas.copy()
+            for coluna in ['retorno_anual', 'volatilidade', 'excesso_retorno', 'alpha', 'tracking_error']:
+                tabela[coluna] = tabela[coluna] * 100
+            st.dataframe(tabela.rename(columns={
+                'retorno_anual': 'Retorno Anual (%)', 'volatilidade': 'Volatilidade (%)',
+                'excesso_retorno': 'Excesso de Retorno (%)', 'alpha': 'Alpha (%)', 'beta': 'Beta',
+                'correlacao': 'Correlacao', 'tracking_error': 'Tracking Error (%)',
+                'information_ratio': 'Information Ratio'
+            }).round(3), use_container_width=True)
+            st.caption(f"Calendario comum: {comparacao.normalizados.index[0]:%d/%m/%Y} a "
+                       f"{comparacao.normalizados.index[-1]:%d/%m/%Y}. Metricas da carteira em relacao a cada benchmark.")
+
     # Interpretacao das Metricas
     with st.expander("Entenda as Metricas de Risco", expanded=False):
         st.markdown(f"""
@@ -737,5 +941,24 @@ def main():
     """, unsafe_allow_html=True)
 
 
+def mostrar_perfil_memoria(perfil) -> None:
+    """Relatorio do profiling.PerfilMemoria da execucao atual (etapas em cache aparecem quase a zero)."""
+    relatorio = perfil.relatorio()
+    if relatorio.empty:
+        return
+    with st.expander("Perfil de Memoria (tracemalloc)", expanded=True):
+        st.caption("Retido: memoria alocada na etapa que continua viva no fim. "
+                   "Pico: maximo durante a etapa, acima do nivel de entrada.")
+        st.dataframe(relatorio.round({'retido_mb': 2, 'pico_mb': 2, 'duracao_s': 3}),
+                     use_container_width=True, hide_index=True)
+        arranque = tempos_arranque()
+        if arranque:
+            st.caption("Arranque deste processo: " + ", ".join(f"{nome} {s:.2f}s" for nome, s in arranque.items()))
+
+
 if __name__ == "__main__":
-    main()
+    with perfilar_memoria(ativo=st.session_state.get("perfilar_memoria", False)) as perfil_memoria:
+        main()
+    registar_arranque("primeira_renderizacao", _INICIO_SCRIPT)
+    if perfil_memoria is not None:
+        mostrar_perfil_memoria(perfil_memoria)
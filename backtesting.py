@@ -7,18 +7,26 @@ Este módulo implementa:
 - Backtesting com janela rolante (Walk-Forward)
 - Value at Risk (VaR)
 - Conditional Value at Risk (CVaR)
-- Comparação com benchmark (Ibovespa)
+- Comparação com benchmarks (Ibovespa, small caps, 1/N, CDI) num calendário comum
 - Métricas de performance
 """
 
+import os
+import threading
 import numpy as np
 import pandas as pd
 import logging
-from typing import Tuple, Dict, Optional
-from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import ClassVar, Iterator, Tuple, Dict, List, Optional, Sequence, Union
 import risk_profiles
 import optimizer
 import data_loader
+import covariance
+from profiling import ModuloPreguicoso
+
+# Só o VaR e as métricas de risco usam o scipy.stats (~0,7 s de import a frio)
+stats = ModuloPreguicoso("scipy.stats")
 
 # Configuração de logging para debug
 logger = logging.getLogger(__name__)
@@ -246,77 +254,11 @@ def calcular_sortino(retornos: np.ndarray, taxa_livre_risco: float = None) -> fl
     return sortino
 
 
-def backtesting_pesos_fixos(
-    precos: pd.DataFrame,
-    pesos: Dict[str, float],
-    janela_rebalanceamento: int = 63,  # Trimestral (~63 dias úteis)
-    capital_inicial: float = 100000,
-    taxa_livre_risco: float = None,
-    serie_cdi_diario: pd.Series = None
-) -> Dict:
-    """
-    Realiza backtesting com rebalanceamento periódico usando pesos fixos.
-    
-    Args:
-        precos: DataFrame com preços históricos
-        pesos: Dicionário {ticker: peso}
-        janela_rebalanceamento: Dias entre rebalanceamentos
-        capital_inicial: Valor inicial investido
-        serie_cdi_diario: Série CDI diária para Sharpe/Sortino variável no tempo
-        
-    Returns:
-        Dict com resultados do backtesting
-    """
-    if taxa_livre_risco is None:
-        taxa_livre_risco = risk_profiles.TAXA_SELIC
-        
-    # Filtra apenas tickers que existem nos preços
-    tickers_validos = [t for t in pesos.keys() if t in precos.columns]
-    pesos_validos = {t: pesos[t] for t in tickers_validos}
-    
-    # Normaliza pesos
-    soma_pesos = sum(pesos_validos.values())
-    pesos_norm = {t: p / soma_pesos for t, p in pesos_validos.items()}
-    
-    # Calcula retornos diários
-    retornos = precos[tickers_validos].pct_change().dropna()
-    
-    # Simula evolução da carteira
-    valor_carteira = [capital_inicial]
-    datas = [retornos.index[0]]
-    
-    valor_atual = capital_inicial
-    dias_desde_rebalanceamento = 0
-    pesos_atuais = pesos_norm.copy()
-    
-    for i, (data, ret_dia) in enumerate(retornos.iterrows()):
-        # Calcula retorno ponderado do dia
-        retorno_carteira = sum(
-            pesos_atuais.get(t, 0) * ret_dia.get(t, 0) 
-            for t in tickers_validos
-        )
-        
-        valor_atual *= (1 + retorno_carteira)
-        valor_carteira.append(valor_atual)
-        datas.append(data)
-        
-        # Derivação do peso (drift)
-        denom = 1 + retorno_carteira
-        if denom > 0:
-            pesos_atuais = {t: pesos_atuais.get(t, 0) * (1 + ret_dia.get(t, 0)) / denom for t in tickers_validos}
-            
-        dias_desde_rebalanceamento += 1
-        
-        # Rebalanceia periodicamente
-        if dias_desde_rebalanceamento >= janela_rebalanceamento:
-            pesos_atuais = pesos_norm.copy()
-            dias_desde_rebalanceamento = 0
-    
-    # Cria série temporal
-    serie_carteira = pd.Series(valor_carteira, index=datas)
+def _metricas_serie(serie_carteira: pd.Series, capital_inicial: float, taxa_livre_risco: float,
+                    serie_cdi_diario: pd.Series = None) -> Dict:
+    """Métricas de desempenho e risco de uma curva de capital (formato de backtesting_pesos_fixos)."""
     retornos_carteira = serie_carteira.pct_change().dropna()
     
-    # Calcula métricas
     retorno_total = (serie_carteira.iloc[-1] / serie_carteira.iloc[0]) - 1
     retorno_anualizado = (1 + retorno_total) ** (252 / len(retornos_carteira)) - 1
     volatilidade = retornos_carteira.std() * np.sqrt(252)
@@ -355,25 +297,149 @@ def backtesting_pesos_fixos(
     }
 
 
-def backtesting_walk_forward(
+def backtesting_matricial(
     precos: pd.DataFrame,
-    perfil: str,
-    janela_treino: int = 252 * 2,  # 2 anos de treino
-    janela_teste: int = 63,        # 1 trimestre out-of-sample
+    pesos: Union[pd.DataFrame, Dict[str, Dict[str, float]]],
+    janela_rebalanceamento: Union[int, Sequence[Optional[int]]] = 63,
     capital_inicial: float = 100000,
     taxa_livre_risco: float = None,
-    n_ativos_max: Optional[int] = None,
-    peso_maximo: float = 0.20,
     serie_cdi_diario: pd.Series = None
 ) -> Dict:
     """
-    Realiza o VERDADEIRO backtesting Walk-Forward (Out-of-Sample).
+    Backtesting de várias carteiras de pesos fixos numa única passagem pelo histórico.
     
-    Metodologia:
-    1. Otimiza a carteira em T usando janela_treino [T - janela_treino, T]
-    2. Aplica esses pesos para os próximos dias (janela_teste) simulando a vida real
-    3. Avança o tempo em janela_teste dias (T -> T + janela_teste)
-    4. Repete o processo até o fim dos dados
+    As posições de todas as carteiras formam uma matriz (carteiras x ativos) que evolui
+    com os retornos do dia (drift); cada carteira volta aos pesos-alvo no seu próprio
+    calendário. O custo é praticamente o de uma só simulação.
+    
+    Args:
+        precos: DataFrame com preços históricos
+        pesos: DataFrame (carteiras x tickers) ou dict {nome: {ticker: peso}}
+        janela_rebalanceamento: Dias entre rebalanceamentos, um valor para todas ou um por
+                                carteira (None = buy-and-hold)
+        capital_inicial: Valor inicial investido em cada carteira
+        serie_cdi_diario: Série CDI diária para Sharpe/Sortino variável no tempo
+        
+    Returns:
+        Dict com 'series' (datas x carteiras), 'metricas' (carteiras x métricas escalares)
+        e 'resultados' ({nome: dict no formato de backtesting_pesos_fixos})
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+    
+    if isinstance(pesos, dict):
+        pesos = pd.DataFrame.from_dict(pesos, orient='index')
+    pesos = pesos.fillna(0.0)
+    
+    # Universo comum: tickers com peso em alguma carteira e que existem nos preços
+    tickers_validos = [t for t in pesos.columns if t in precos.columns and (pesos[t] != 0).any()]
+    W = pesos[tickers_validos].to_numpy(dtype=np.float64)
+    W = W / W.sum(axis=1, keepdims=True)
+    nomes = list(pesos.index)
+    k = len(nomes)
+    
+    if np.ndim(janela_rebalanceamento) == 0:
+        janela_rebalanceamento = [janela_rebalanceamento] * k
+    janelas = np.array([np.inf if j is None else j for j in janela_rebalanceamento], dtype=np.float64)
+    
+    retornos = precos[tickers_validos].pct_change().dropna()
+    R = retornos.to_numpy(dtype=np.float64)
+    
+    # Posições em valor (carteiras x ativos) e curva de capital (dias + 1 x carteiras)
+    posicoes = capital_inicial * W
+    valores = np.empty((len(R) + 1, k))
+    valores[0] = capital_inicial
+    dias_desde_rebalanceamento = np.zeros(k)
+    
+    for i in range(len(R)):
+        posicoes *= 1.0 + R[i]
+        valor_atual = posicoes.sum(axis=1)
+        valores[i + 1] = valor_atual
+        
+        # Rebalanceia as carteiras cujo calendário vence hoje
+        dias_desde_rebalanceamento += 1
+        rebalancear = dias_desde_rebalanceamento >= janelas
+        if rebalancear.any():
+            posicoes[rebalancear] = valor_atual[rebalancear, None] * W[rebalancear]
+            dias_desde_rebalanceamento[rebalancear] = 0
+    
+    # Mesmo índice de backtesting_pesos_fixos: o capital inicial fica na data do 1.º retorno
+    datas = retornos.index[:1].append(retornos.index)
+    series = pd.DataFrame(valores, index=datas, columns=nomes)
+    resultados = {nome: _metricas_serie(series[nome], capital_inicial, taxa_livre_risco, serie_cdi_diario)
+                  for nome in nomes}
+    metricas = pd.DataFrame({nome: {m: v for m, v in res.items() if isinstance(v, (int, float, np.number))}
+                             for nome, res in resultados.items()}).T
+    
+    return {'series': series, 'metricas': metricas, 'resultados': resultados}
+
+
+def backtesting_pesos_fixos(
+    precos: pd.DataFrame,
+    pesos: Dict[str, float],
+    janela_rebalanceamento: int = 63,  # Trimestral (~63 dias úteis)
+    capital_inicial: float = 100000,
+    taxa_livre_risco: float = None,
+    serie_cdi_diario: pd.Series = None
+) -> Dict:
+    """
+    Realiza backtesting com rebalanceamento periódico usando pesos fixos.
+    Caso particular de backtesting_matricial com uma só carteira.
+    
+    Args:
+        precos: DataFrame com preços históricos
+        pesos: Dicionário {ticker: peso}
+        janela_rebalanceamento: Dias entre rebalanceamentos
+        capital_inicial: Valor inicial investido
+        serie_cdi_diario: Série CDI diária para Sharpe/Sortino variável no tempo
+        
+    Returns:
+        Dict com resultados do backtesting
+    """
+    resultado = backtesting_matricial(precos, {'carteira': pesos}, janela_rebalanceamento, capital_inicial,
+                                      taxa_livre_risco, serie_cdi_diario)
+    return resultado['resultados']['carteira']
+
+
+@dataclass
+class JanelaWalkForward:
+    """Resultado de uma janela do walk-forward, emitido por iterar_walk_forward assim que termina."""
+    indice: int                   # 0..n_janelas-1
+    n_janelas: int                # Total previsto (para barras de progresso)
+    data_otimizacao: pd.Timestamp # Primeiro dia de teste; o treino usa só dias anteriores
+    pesos: pd.Series              # Pesos otimizados no início da janela
+    segmento: pd.Series           # Valor da carteira no teste, a começar no fecho anterior
+    metricas: Dict[str, float]    # Métricas acumuladas até ao fim desta janela
+    estatisticas_solver: dict     # Resoluções/iterações do solver nesta janela
+
+    @property
+    def progresso(self) -> float:
+        return (self.indice + 1) / self.n_janelas
+
+
+def iterar_walk_forward(
+    precos: pd.DataFrame,
+    perfil: str,
+    janela_treino: int = 252 * 2,
+    janela_teste: int = 63,
+    capital_inicial: float = 100000,
+    taxa_livre_risco: float = None,
+    n_ativos_max: Optional[int] = None,
+    peso_maximo: float = 0.20,
+    metodo_covariancia: str = covariance.METODO_PADRAO,
+    warm_start: bool = True,
+    cancelamento: Optional[threading.Event] = None
+) -> Iterator[JanelaWalkForward]:
+    """
+    Walk-forward em modo streaming: emite cada janela (pesos, segmento da curva de capital e
+    métricas acumuladas) assim que termina, para a interface desenhar a curva aos poucos.
+
+    Com `cancelamento`, o evento é consultado antes de cada janela; se estiver ativo a geração
+    termina sem otimizar mais janelas (as já emitidas continuam válidas). Fechar o gerador
+    (`close()` ou abandonar o ciclo) tem o mesmo efeito.
+
+    As métricas acumuladas usam a taxa livre de risco constante; as finais, com o CDI diário,
+    saem de concluir_walk_forward.
     """
     if taxa_livre_risco is None:
         taxa_livre_risco = risk_profiles.TAXA_SELIC
@@ -381,30 +447,33 @@ def backtesting_walk_forward(
     # Retornos simples para simulação de capital (compounding correto)
     retornos_simples = precos.pct_change().dropna()
     # Retornos logarítmicos para otimização (consistente com o dashboard principal)
-    retornos_log = np.log(precos / precos.shift(1)).dropna()
+    retornos_log = data_loader.calcular_retornos(precos)
 
     total_dias = len(retornos_simples)
 
     if total_dias <= janela_treino + janela_teste:
         raise ValueError("Dados insuficientes para Walk-Forward com estas janelas.")
 
-    valor_carteira = [capital_inicial]
-    datas = []
+    inicios = _janelas_walk_forward(total_dias, janela_treino, janela_teste)
+    contexto = optimizer.ContextoOtimizacao(warm_start=warm_start)
     valor_atual = capital_inicial
+    data_anterior = retornos_simples.index[janela_treino - 1]
 
-    # Prepara o primeiro dia para alinhar array
-    datas.append(retornos_simples.index[janela_treino - 1])
-
-    inicio_teste = janela_treino
+    # Acumuladores das métricas correntes (atualizados janela a janela, sem rever o passado)
+    n_dias, soma, soma_quadrados = 0, 0.0, 0.0
+    pico, max_drawdown = capital_inicial, 0.0
 
-    while inicio_teste < total_dias:
+    for indice, inicio_teste in enumerate(inicios):
+        if cancelamento is not None and cancelamento.is_set():
+            logger.info(f"Walk-forward cancelado após {indice} de {len(inicios)} janelas")
+            return
         fim_teste = min(inicio_teste + janela_teste, total_dias)
 
         # 1. Isola os dados de "treino" in-sample (log returns para otimização)
         retornos_treino = retornos_log.iloc[inicio_teste - janela_treino : inicio_teste]
 
         # 2. Otimiza apenas olhando pro passado para não ter look-ahead bias
-        ret_medios, cov_matrix = data_loader.calcular_estatisticas(retornos_treino)
+        ret_medios, cov_matrix = data_loader.calcular_estatisticas(retornos_treino, metodo_covariancia)
         
         try:
             res_opt = optimizer.otimizar_por_perfil(
@@ -413,7 +482,8 @@ def backtesting_walk_forward(
                 matriz_cov=cov_matrix,
                 taxa_livre_risco=taxa_livre_risco,
                 peso_maximo=peso_maximo,
-                n_ativos_max=n_ativos_max
+                n_ativos_max=n_ativos_max,
+                contexto=contexto
             )
             if not res_opt.sucesso:
                 pesos_opt = np.ones(len(precos.columns)) / len(precos.columns)
@@ -422,6 +492,10 @@ def backtesting_walk_forward(
         except Exception as e:
             logger.error(f"Erro no WF opt: {e}")
             pesos_opt = np.ones(len(precos.columns)) / len(precos.columns)
+        
+        estat = contexto.fechar_janela(data=retornos_simples.index[inicio_teste])
+        logger.debug(f"WF {estat['data']:%Y-%m-%d}: {estat['resolucoes']} resoluções, "
+                     f"{estat['iteracoes']} iterações do solver")
             
         pesos_dict = dict(zip(precos.columns, pesos_opt))
         
@@ -429,25 +503,69 @@ def backtesting_walk_forward(
         # Usa retornos SIMPLES para simulação de capital (compounding correto)
         retornos_teste = retornos_simples.iloc[inicio_teste : fim_teste]
         pesos_atuais = pesos_dict.copy()
+        valores, datas = [valor_atual], [data_anterior]
         
         for data, ret_dia in retornos_teste.iterrows():
             # Retorno diário da carteira Out-of-Sample
             retorno_carteira = sum(pesos_atuais.get(t, 0) * ret_dia.get(t, 0) for t in precos.columns)
             valor_atual *= (1 + retorno_carteira)
             
-            valor_carteira.append(valor_atual)
+            valores.append(valor_atual)
             datas.append(data)
             
             # Evolução orgânica (drift) dos pesos
             denom = 1 + retorno_carteira
             if denom > 0:
                 pesos_atuais = {t: pesos_atuais.get(t, 0) * (1 + ret_dia.get(t, 0)) / denom for t in precos.columns}
-        
-        # Avança a janela
-        inicio_teste = fim_teste
-        
-    serie_carteira = pd.Series(valor_carteira, index=datas)
-    # Remove duplicidade de data inicial caso exista
+
+            n_dias += 1
+            soma += retorno_carteira
+            soma_quadrados += retorno_carteira ** 2
+            pico = max(pico, valor_atual)
+            max_drawdown = min(max_drawdown, valor_atual / pico - 1)
+
+        data_anterior = datas[-1]
+        retorno_total = valor_atual / capital_inicial - 1
+        retorno_anualizado = (1 + retorno_total) ** (252 / max(n_dias, 1)) - 1
+        variancia = (soma_quadrados - soma ** 2 / n_dias) / (n_dias - 1) if n_dias > 1 else 0.0
+        volatilidade = np.sqrt(max(variancia, 0.0) * 252)
+
+        yield JanelaWalkForward(
+            indice=indice,
+            n_janelas=len(inicios),
+            data_otimizacao=retornos_simples.index[inicio_teste],
+            pesos=pd.Series(pesos_opt, index=precos.columns),
+            segmento=pd.Series(valores, index=datas),
+            metricas={
+                'capital': valor_atual,
+                'retorno_total': retorno_total,
+                'retorno_anualizado': retorno_anualizado,
+                'volatilidade': volatilidade,
+                'sharpe': (retorno_anualizado - taxa_livre_risco) / volatilidade if volatilidade > 0 else 0.0,
+                'max_drawdown': max_drawdown,
+                'n_dias': n_dias
+            },
+            estatisticas_solver=estat
+        )
+
+
+def concluir_walk_forward(
+    janelas: Sequence[JanelaWalkForward],
+    capital_inicial: float = 100000,
+    taxa_livre_risco: float = None,
+    serie_cdi_diario: pd.Series = None
+) -> Dict:
+    """
+    Junta as janelas emitidas por iterar_walk_forward no resultado de backtesting_walk_forward.
+    Aceita também as janelas de uma execução cancelada (backtest até à última janela concluída).
+    """
+    if not janelas:
+        raise ValueError("Nenhuma janela do Walk-Forward foi concluída.")
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+    serie_carteira = pd.concat([janela.segmento for janela in janelas])
+    # Remove a duplicidade das datas de ligação entre segmentos
     serie_carteira = serie_carteira.groupby(serie_carteira.index).first()
     retornos_carteira = serie_carteira.pct_change().dropna()
 
@@ -485,10 +603,153 @@ def backtesting_walk_forward(
         'cvar_95_anual': cvar_95 * np.sqrt(252),
         'n_dias': n_dias_bt,
         'periodo_inicio': serie_carteira.index[0],
-        'periodo_fim': serie_carteira.index[-1]
+        'periodo_fim': serie_carteira.index[-1],
+        'estatisticas_solver': pd.DataFrame([janela.estatisticas_solver for janela in janelas]).set_index('data')
     }
 
 
+def backtesting_walk_forward(
+    precos: pd.DataFrame,
+    perfil: str,
+    janela_treino: int = 252 * 2,  # 2 anos de treino
+    janela_teste: int = 63,        # 1 trimestre out-of-sample
+    capital_inicial: float = 100000,
+    taxa_livre_risco: float = None,
+    n_ativos_max: Optional[int] = None,
+    peso_maximo: float = 0.20,
+    serie_cdi_diario: pd.Series = None,
+    metodo_covariancia: str = covariance.METODO_PADRAO,
+    warm_start: bool = True
+) -> Dict:
+    """
+    Realiza o VERDADEIRO backtesting Walk-Forward (Out-of-Sample).
+    A covariância de cada janela de treino usa o estimador `metodo_covariancia` (covariance.py).
+    Com warm_start, cada janela parte da solução (primal e dual) da anterior; as iterações
+    do solver por janela ficam em 'estatisticas_solver'.
+    Versão bloqueante: consome iterar_walk_forward até ao fim.
+    
+    Metodologia:
+    1. Otimiza a carteira em T usando janela_treino [T - janela_treino, T]
+    2. Aplica esses pesos para os próximos dias (janela_teste) simulando a vida real
+    3. Avança o tempo em janela_teste dias (T -> T + janela_teste)
+    4. Repete o processo até o fim dos dados
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+    janelas = list(iterar_walk_forward(
+        precos, perfil, janela_treino=janela_treino, janela_teste=janela_teste,
+        capital_inicial=capital_inicial, taxa_livre_risco=taxa_livre_risco, n_ativos_max=n_ativos_max,
+        peso_maximo=peso_maximo, metodo_covariancia=metodo_covariancia, warm_start=warm_start
+    ))
+    return concluir_walk_forward(janelas, capital_inicial, taxa_livre_risco, serie_cdi_diario)
+
+
+# ============== SUPERFÍCIE DA FRONTEIRA EFICIENTE (WALK-FORWARD) ==============
+
+@dataclass
+class SuperficieFronteira:
+    """Fronteiras eficientes das janelas de treino do walk-forward, num único array compacto."""
+    datas: pd.DatetimeIndex            # Início do período de teste de cada janela
+    valores: np.ndarray                # float32 (janelas x pontos x 3); NaN onde o ponto falhou
+    estatisticas_solver: pd.DataFrame  # Resoluções/iterações por janela
+
+    CAMPOS: ClassVar[Tuple[str, ...]] = ('retorno', 'volatilidade', 'sharpe')
+
+    @property
+    def n_janelas(self) -> int:
+        return self.valores.shape[0]
+
+    def fronteira(self, janela: int) -> pd.DataFrame:
+        """Fronteira de uma janela no formato de optimizer.gerar_fronteira_eficiente."""
+        df = pd.DataFrame(self.valores[janela].astype(np.float64), columns=list(self.CAMPOS))
+        return df.dropna().reset_index(drop=True)
+
+
+def _janelas_walk_forward(total_dias: int, janela_treino: int, janela_teste: int) -> List[int]:
+    """Índices de início do período de teste de cada janela (mesma grelha do backtesting_walk_forward)."""
+    return list(range(janela_treino, total_dias, janela_teste))
+
+
+def _fronteiras_bloco(retornos_log: pd.DataFrame, inicios: List[int], janela_treino: int, n_pontos: int,
+                      taxa_livre_risco: float, peso_maximo: float, n_ativos_max: Optional[int],
+                      metodo_covariancia: str, warm_start: bool) -> Tuple[np.ndarray, List[dict]]:
+    """
+    Fronteiras de um bloco de janelas consecutivas, com um ContextoOtimizacao partilhado.
+    Função de nível de módulo para poder ser enviada ao ProcessPoolExecutor.
+    """
+    contexto = optimizer.ContextoOtimizacao(warm_start=warm_start)
+    valores = np.full((len(inicios), n_pontos, len(SuperficieFronteira.CAMPOS)), np.nan, dtype=np.float32)
+    for i, inicio in enumerate(inicios):
+        retornos_treino = retornos_log.iloc[inicio - janela_treino: inicio]
+        ret_medios, cov_matrix = data_loader.calcular_estatisticas(retornos_treino, metodo_covariancia)
+        try:
+            fronteira = optimizer.gerar_fronteira_eficiente(
+                ret_medios, cov_matrix, taxa_livre_risco, n_pontos=n_pontos, peso_maximo=peso_maximo,
+                n_ativos_max=n_ativos_max, contexto=contexto
+            )
+            if not fronteira.empty:
+                valores[i, :len(fronteira)] = fronteira[list(SuperficieFronteira.CAMPOS)].to_numpy()
+        except Exception as e:
+            logger.error(f"Erro na fronteira da janela {retornos_log.index[inicio]}: {e}")
+        contexto.fechar_janela(data=retornos_log.index[inicio])
+    return valores, contexto.historico
+
+
+def superficie_fronteira_walk_forward(
+    precos: pd.DataFrame,
+    janela_treino: int = 252 * 2,
+    janela_teste: int = 63,
+    n_pontos: int = 30,
+    taxa_livre_risco: float = None,
+    peso_maximo: float = 0.20,
+    n_ativos_max: Optional[int] = None,
+    metodo_covariancia: str = covariance.METODO_PADRAO,
+    max_workers: Optional[int] = None,
+    warm_start: bool = True
+) -> SuperficieFronteira:
+    """
+    Calcula a fronteira eficiente de cada janela de treino do walk-forward numa só passagem.
+
+    As janelas são divididas em blocos contíguos, um por processo; dentro de cada bloco as
+    fronteiras partilham os problemas compilados e o warm start (janelas vizinhas têm
+    μ e Σ próximos). Com max_workers=1 tudo corre no processo atual.
+
+    Returns:
+        SuperficieFronteira com valores (janelas x n_pontos x {retorno, volatilidade, sharpe})
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+    retornos_log = data_loader.calcular_retornos(precos)
+    inicios = _janelas_walk_forward(len(retornos_log), janela_treino, janela_teste)
+    if not inicios:
+        raise ValueError("Dados insuficientes para a superfície da fronteira com esta janela de treino.")
+
+    n_blocos = max(1, min(max_workers or os.cpu_count() or 1, len(inicios)))
+    blocos = [list(b) for b in np.array_split(inicios, n_blocos)]
+    opcoes = dict(janela_treino=janela_treino, n_pontos=n_pontos, taxa_livre_risco=taxa_livre_risco,
+                  peso_maximo=peso_maximo, n_ativos_max=n_ativos_max,
+                  metodo_covariancia=metodo_covariancia, warm_start=warm_start)
+
+    if n_blocos == 1:
+        resultados = [_fronteiras_bloco(retornos_log, inicios, **opcoes)]
+    else:
+        # Cada processo recebe só as linhas de que as suas janelas precisam
+        with ProcessPoolExecutor(max_workers=n_blocos) as pool:
+            futuros = [pool.submit(_fronteiras_bloco, retornos_log.iloc[b[0] - janela_treino: b[-1] + 1],
+                                   [i - (b[0] - janela_treino) for i in b], **opcoes)
+                       for b in blocos]
+            resultados = [f.result() for f in futuros]
+
+    historico = [registo for _, hist in resultados for registo in hist]
+    return SuperficieFronteira(
+        datas=pd.DatetimeIndex(retornos_log.index[inicios]),
+        valores=np.concatenate([valores for valores, _ in resultados]),
+        estatisticas_solver=pd.DataFrame(historico).set_index('data')
+    )
+
+
 def comparar_com_benchmark(
     serie_carteira: pd.Series,
     precos_benchmark: pd.Series,
@@ -497,6 +758,7 @@ def comparar_com_benchmark(
 ) -> Dict:
     """
     Compara performance da carteira com um benchmark.
+    Para vários benchmarks no mesmo calendário, ver comparar_com_benchmarks.
     
     Args:
         serie_carteira: Série de valores da carteira
@@ -566,6 +828,113 @@ def comparar_com_benchmark(
     }
 
 
+VOL_MINIMA_BENCHMARK = 0.01   # Volatilidade anual abaixo da qual o benchmark é tratado como sem risco
+
+
+@dataclass
+class ComparacaoBenchmarks:
+    """Carteira e benchmarks num calendário comum, com as métricas relativas por benchmark."""
+    normalizados: pd.DataFrame   # Base 100; primeira coluna = carteira
+    metricas: pd.DataFrame       # Benchmarks (linhas) x métricas (colunas)
+    retorno_carteira: float      # Retorno anualizado da carteira no calendário comum
+    volatilidade_carteira: float
+
+
+def acumular_cdi(serie_cdi_diario: pd.Series, base: float = 100.0) -> pd.Series:
+    """Índice de acumulação do CDI (base 100) a partir da taxa diária, para usar como benchmark."""
+    return (1 + serie_cdi_diario).cumprod() * base
+
+
+def comparar_com_benchmarks(
+    serie_carteira: pd.Series,
+    benchmarks: Union[Dict[str, pd.Series], pd.DataFrame],
+    taxa_livre_risco: float = None,
+    min_observacoes: int = 10
+) -> ComparacaoBenchmarks:
+    """
+    Compara a carteira com vários benchmarks de uma vez (Ibovespa, small caps, 1/N,
+    acumulação do CDI, outros perfis...).
+    
+    Todas as séries são levadas para o calendário da carteira (forward-fill: dias sem
+    negociação do benchmark contam com retorno zero) e cortadas no primeiro dia em que
+    todas têm cotação. Alpha, beta, tracking error, information ratio e correlação saem
+    de operações sobre a matriz de retornos (T x k), sem um ciclo por benchmark.
+    Benchmarks praticamente sem volatilidade (abaixo de VOL_MINIMA_BENCHMARK, ex.: CDI)
+    têm beta 0 e correlação indefinida: a covariância com eles é só ruído.
+    
+    Args:
+        serie_carteira: Série de valores da carteira
+        benchmarks: {nome: série de preços/valores} ou DataFrame (datas x benchmarks)
+        taxa_livre_risco: Taxa anual usada no alpha (CAPM)
+        min_observacoes: Mínimo de datas comuns
+        
+    Returns:
+        ComparacaoBenchmarks
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+    
+    def _sem_duplicados(dados):
+        # Séries de backtest repetem a primeira data (capital inicial); yfinance pode vir tz-aware
+        dados = dados[~dados.index.duplicated(keep='last')]
+        if dados.index.tz is not None:
+            dados = dados.tz_localize(None)
+        return dados
+    
+    carteira = _sem_duplicados(serie_carteira)
+    if isinstance(benchmarks, dict):
+        painel = pd.DataFrame({nome: _sem_duplicados(serie) for nome, serie in benchmarks.items()})
+    else:
+        painel = _sem_duplicados(benchmarks)
+    painel = painel.loc[:, painel.notna().any()].sort_index()
+    
+    painel = painel.reindex(carteira.index, method='ffill')
+    validas = painel.notna().all(axis=1).to_numpy()
+    if validas.sum() < min_observacoes:
+        raise ValueError("Dados insuficientes para comparação: poucas datas em comum com os benchmarks.")
+    inicio = int(np.argmax(validas))
+    nomes = painel.columns.tolist()
+    valores = np.column_stack([carteira.to_numpy(dtype=float), painel.to_numpy(dtype=float)])[inicio:]
+    datas = carteira.index[inicio:]
+    
+    # Retornos simples de todas as séries (coluna 0 = carteira)
+    R = valores[1:] / valores[:-1] - 1
+    t = len(R)
+    ret_total = valores[-1] / valores[0] - 1
+    ret_anual = (1 + ret_total) ** (252 / t) - 1
+    vol = R.std(axis=0, ddof=1) * np.sqrt(252)
+    
+    centrados = R - R.mean(axis=0)
+    covariancias = centrados[:, 0] @ centrados[:, 1:] / (t - 1)
+    variancias = np.einsum('ij,ij->j', centrados, centrados) / (t - 1)
+    var_bench = variancias[1:]
+    com_risco = vol[1:] >= VOL_MINIMA_BENCHMARK
+    beta = np.divide(covariancias, var_bench, out=np.zeros_like(var_bench), where=com_risco)
+    correlacao = np.full_like(var_bench, np.nan)
+    correlacao[com_risco] = covariancias[com_risco] / np.sqrt(variancias[0] * var_bench[com_risco])
+    
+    alpha = ret_anual[0] - (taxa_livre_risco + beta * (ret_anual[1:] - taxa_livre_risco))
+    tracking_error = (R[:, :1] - R[:, 1:]).std(axis=0, ddof=1) * np.sqrt(252)
+    excesso = ret_anual[0] - ret_anual[1:]
+    information_ratio = np.divide(excesso, tracking_error, out=np.zeros_like(excesso), where=tracking_error > 0)
+    
+    metricas = pd.DataFrame({
+        'retorno_anual': ret_anual[1:],
+        'volatilidade': vol[1:],
+        'excesso_retorno': excesso,
+        'alpha': alpha,
+        'beta': beta,
+        'correlacao': correlacao,
+        'tracking_error': tracking_error,
+        'information_ratio': information_ratio,
+    }, index=pd.Index(nomes, name='benchmark'))
+    
+    nome_carteira = serie_carteira.name if serie_carteira.name not in (None, *nomes) else 'Carteira'
+    normalizados = pd.DataFrame(valores / valores[0] * 100, index=datas, columns=[nome_carteira] + nomes)
+    return ComparacaoBenchmarks(normalizados=normalizados, metricas=metricas,
+                                retorno_carteira=float(ret_anual[0]), volatilidade_carteira=float(vol[0]))
+
+
 def calcular_metricas_risco_portfolio(
     retornos: pd.DataFrame,
     pesos: Dict[str, float],
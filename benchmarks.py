@@ -0,0 +1,315 @@
+"""
+benchmarks.py - Guarda de regressão de desempenho (backtesting e métricas de risco)
+TCC: Otimização de Carteiras de Investimentos
+
+Cronometra as funções de backtesting.py em dados sintéticos com semente fixa, em vários
+comprimentos de histórico e números de ativos, e compara com as referências gravadas em
+benchmarks_base.json:
+
+    python -m benchmarks                      # compara; termina com código 1 se houver regressão
+    python -m benchmarks --margem 0.3         # tolerância de tempo (30% acima da referência)
+    python -m benchmarks --filtro var         # só os casos cujo nome contém "var"
+    python -m benchmarks --atualizar          # regrava as referências (após uma mudança intencional)
+
+Um caso acima da margem de tempo é medido de novo (--tentativas) antes de falhar, para
+que um pico de carga na máquina não seja confundido com uma regressão.
+
+Por caso regista:
+- tempo_s: melhor tempo por chamada (timeit: autorange + repetições, mínimo)
+- pico_mb: pico de memória alocada durante uma chamada (tracemalloc), acima do nível de
+  entrada. Cópias extra de painéis aparecem aqui mesmo quando o tempo quase não muda.
+- blocos: blocos de memória que a chamada deixa alocados, incluindo o resultado (soma de
+  count_diff entre snapshots do tracemalloc antes e depois). Sobe com objetos Python extra
+  no resultado ou com caches que crescem a cada chamada.
+
+As referências dependem da máquina: regrave-as na máquina onde a guarda corre.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import timeit
+import tracemalloc
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SEMENTE = 42
+ARQUIVO_BASE = Path(__file__).with_name("benchmarks_base.json")
+MARGEM_TEMPO = 0.5          # Regressão: mais de 50% acima do tempo de referência
+MARGEM_MEMORIA = 0.25       # ... ou mais de 25% acima do pico de referência
+MARGEM_BLOCOS = 0.25        # ... ou mais de 25% acima dos blocos alocados de referência
+FOLGA_TEMPO_S = 50e-6       # Folgas absolutas: evitam falsos alarmes em funções de microssegundos
+FOLGA_MEMORIA_MB = 0.05
+FOLGA_BLOCOS = 50
+
+
+@dataclass
+class CasoBenchmark:
+    """Função cronometrada em cada (anos de histórico, número de ativos) de `tamanhos`."""
+    nome: str
+    preparar: Callable[[int, int], Callable[[], object]]   # (anos, n_ativos) -> chamada sem argumentos
+    tamanhos: Sequence[Tuple[int, int]]
+    repeticoes: int = 5
+
+    def chave(self, anos: int, n_ativos: int) -> str:
+        return f"{self.nome}[{anos}a x {n_ativos}]"
+
+
+# ============== DADOS SINTÉTICOS ==============
+
+def _precos(anos: int, n_ativos: int, semente: int = SEMENTE) -> pd.DataFrame:
+    import data_loader
+    return data_loader.gerar_precos_sinteticos([f"ATV{i:03d}" for i in range(n_ativos)], anos, semente)
+
+
+def _pesos(precos: pd.DataFrame, n_max: int = 10) -> Dict[str, float]:
+    """Carteira de até n_max ativos com pesos de Dirichlet (determinística)."""
+    rng = np.random.default_rng(SEMENTE)
+    escolhidos = rng.choice(precos.columns, size=min(n_max, precos.shape[1]), replace=False)
+    return dict(zip(escolhidos, rng.dirichlet(np.ones(len(escolhidos)))))
+
+
+def _serie_carteira(anos: int, n_ativos: int) -> pd.Series:
+    precos = _precos(anos, n_ativos)
+    return (precos / precos.iloc[0]).mean(axis=1) * 100_000
+
+
+def _retornos_carteira(anos: int, n_ativos: int) -> np.ndarray:
+    return _serie_carteira(anos, n_ativos).pct_change().dropna().to_numpy()
+
+
+# ============== CASOS ==============
+
+def _caso_pesos_fixos(anos: int, n_ativos: int):
+    import backtesting
+    precos = _precos(anos, n_ativos)
+    pesos = _pesos(precos)
+    return lambda: backtesting.backtesting_pesos_fixos(precos, pesos, janela_rebalanceamento=63,
+                                                       taxa_livre_risco=0.10)
+
+
+def _caso_walk_forward(anos: int, n_ativos: int):
+    import backtesting
+    precos = _precos(anos, n_ativos)
+    return lambda: backtesting.backtesting_walk_forward(precos, perfil="Conservador", taxa_livre_risco=0.10,
+                                                        n_ativos_max=10, peso_maximo=0.20)
+
+
+def _caso_drawdown(anos: int, n_ativos: int):
+    import backtesting
+    serie = _serie_carteira(anos, n_ativos)
+    return lambda: backtesting.calcular_drawdown(serie)
+
+
+def _caso_var_cornish_fisher(anos: int, n_ativos: int):
+    import backtesting
+    retornos = _retornos_carteira(anos, n_ativos)
+    return lambda: backtesting.calcular_var_cornish_fisher(retornos)
+
+
+def _caso_cvar(anos: int, n_ativos: int):
+    import backtesting
+    retornos = _retornos_carteira(anos, n_ativos)
+    return lambda: backtesting.calcular_cvar(retornos)
+
+
+def _caso_comparar_benchmark(anos: int, n_ativos: int):
+    import backtesting
+    serie = _serie_carteira(anos, n_ativos)
+    benchmark = _precos(anos, 1, semente=SEMENTE + 1).iloc[:, 0]
+    return lambda: backtesting.comparar_com_benchmark(serie, benchmark, taxa_livre_risco=0.10)
+
+
+HISTORICOS = [(2, 20), (5, 20), (10, 20)]
+
+CASOS: List[CasoBenchmark] = [
+    CasoBenchmark("backtesting_pesos_fixos", _caso_pesos_fixos, [(2, 20), (5, 75), (10, 195)]),
+    CasoBenchmark("backtesting_walk_forward", _caso_walk_forward, [(3, 20), (5, 40)], repeticoes=3),
+    CasoBenchmark("calcular_drawdown", _caso_drawdown, HISTORICOS),
+    CasoBenchmark("calcular_var_cornish_fisher", _caso_var_cornish_fisher, HISTORICOS),
+    CasoBenchmark("calcular_cvar", _caso_cvar, HISTORICOS),
+    CasoBenchmark("comparar_com_benchmark", _caso_comparar_benchmark, HISTORICOS),
+]
+
+
+# ============== MEDIÇÃO ==============
+
+def _memoria(chamada: Callable[[], object]) -> Tuple[float, int]:
+    """
+    Pico de memória (MB) alocada durante uma chamada, acima do nível de entrada, e blocos
+    que ficam alocados no fim (com o resultado ainda vivo).
+    """
+    iniciado_aqui = not tracemalloc.is_tracing()
+    if iniciado_aqui:
+        tracemalloc.start()
+    try:
+        antes_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        antes, _ = tracemalloc.get_traced_memory()
+        resultado = chamada()
+        _, pico = tracemalloc.get_traced_memory()
+        diferencas = tracemalloc.take_snapshot().compare_to(antes_snapshot, 'filename')
+        del resultado
+    finally:
+        if iniciado_aqui:
+            tracemalloc.stop()
+    blocos = sum(d.count_diff for d in diferencas)
+    return max(pico - antes, 0) / 1024 ** 2, max(blocos, 0)
+
+
+def medir(caso: CasoBenchmark, anos: int, n_ativos: int) -> dict:
+    """Tempo por chamada (mínimo das repetições), pico de memória e blocos alocados de um caso num tamanho."""
+    chamada = caso.preparar(anos, n_ativos)
+    cronometro = timeit.Timer(chamada)
+    numero, _ = cronometro.autorange()   # Também serve de aquecimento (imports, caches de compilação)
+    tempo = min(cronometro.repeat(repeat=caso.repeticoes, number=numero)) / numero
+    pico_mb, blocos = _memoria(chamada)
+    return {'caso': caso.chave(anos, n_ativos), 'tempo_s': tempo, 'pico_mb': pico_mb, 'blocos': blocos}
+
+
+def executar(filtro: Optional[str] = None) -> pd.DataFrame:
+    """Mede todos os casos (ou os que contêm `filtro`) e devolve uma linha por caso e tamanho."""
+    linhas = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")   # Avisos do cvxpy ("inaccurate") não interessam aqui
+        for caso in CASOS:
+            for anos, n_ativos in caso.tamanhos:
+                if filtro and filtro not in caso.chave(anos, n_ativos):
+                    continue
+                linhas.append(medir(caso, anos, n_ativos))
+                logger.info(f"{linhas[-1]['caso']}: {linhas[-1]['tempo_s'] * 1000:.3f} ms, "
+                            f"pico {linhas[-1]['pico_mb']:.2f} MB, {linhas[-1]['blocos']} blocos")
+    return pd.DataFrame(linhas, columns=['caso', 'tempo_s', 'pico_mb', 'blocos'])
+
+
+# ============== REFERÊNCIAS ==============
+
+def carregar_base(caminho: Path = ARQUIVO_BASE) -> dict:
+    if not caminho.exists():
+        return {}
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f).get('casos', {})
+
+
+def gravar_base(medicoes: pd.DataFrame, caminho: Path = ARQUIVO_BASE) -> None:
+    """Grava as medições como referência (junta com as existentes, para permitir --filtro)."""
+    casos = carregar_base(caminho)
+    casos.update({linha.caso: {'tempo_s': float(linha.tempo_s), 'pico_mb': float(linha.pico_mb),
+                               'blocos': int(linha.blocos)}
+                  for linha in medicoes.itertuples()})
+    conteudo = {
+        'maquina': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                    'processador': platform.processor() or platform.machine(), 'sistema': platform.system()},
+        'semente': SEMENTE,
+        'casos': dict(sorted(casos.items())),
+    }
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(conteudo, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def comparar(medicoes: pd.DataFrame, base: dict, margem_tempo: float = MARGEM_TEMPO,
+             margem_memoria: float = MARGEM_MEMORIA, margem_blocos: float = MARGEM_BLOCOS) -> pd.DataFrame:
+    """
+    Junta as medições às referências. Um caso regride quando o tempo, o pico de memória ou
+    os blocos alocados excedem a referência pela margem relativa e pela folga absoluta.
+    Casos sem referência ficam marcados como 'novo' (não falham); referências antigas sem
+    'blocos' não falham nessa métrica.
+    """
+    relatorio = medicoes.copy()
+    relatorio['tempo_base_s'] = relatorio['caso'].map(lambda c: base.get(c, {}).get('tempo_s', np.nan))
+    relatorio['pico_base_mb'] = relatorio['caso'].map(lambda c: base.get(c, {}).get('pico_mb', np.nan))
+    relatorio['blocos_base'] = relatorio['caso'].map(lambda c: base.get(c, {}).get('blocos', np.nan))
+    relatorio['razao_tempo'] = relatorio['tempo_s'] / relatorio['tempo_base_s']
+    relatorio['razao_pico'] = relatorio['pico_mb'] / relatorio['pico_base_mb']
+
+    regressoes = {
+        'tempo': ((relatorio['tempo_s'] > relatorio['tempo_base_s'] * (1 + margem_tempo))
+                  & (relatorio['tempo_s'] - relatorio['tempo_base_s'] > FOLGA_TEMPO_S)),
+        'memoria': ((relatorio['pico_mb'] > relatorio['pico_base_mb'] * (1 + margem_memoria))
+                    & (relatorio['pico_mb'] - relatorio['pico_base_mb'] > FOLGA_MEMORIA_MB)),
+        'alocacoes': ((relatorio['blocos'] > relatorio['blocos_base'] * (1 + margem_blocos))
+                      & (relatorio['blocos'] - relatorio['blocos_base'] > FOLGA_BLOCOS)),
+    }
+    metricas = pd.DataFrame(regressoes).apply(lambda linha: '+'.join(linha.index[linha]), axis=1)
+    relatorio['estado'] = np.where(relatorio['tempo_base_s'].isna(), 'novo',
+                                   np.where(metricas != '', 'REGRESSAO ' + metricas, 'ok'))
+    return relatorio
+
+
+def confirmar_regressoes(medicoes: pd.DataFrame, base: dict, margem_tempo: float = MARGEM_TEMPO,
+                         margem_memoria: float = MARGEM_MEMORIA, tentativas: int = 2,
+                         margem_blocos: float = MARGEM_BLOCOS) -> pd.DataFrame:
+    """
+    Volta a medir os casos com regressão de tempo e fica com o melhor tempo de todas as
+    medições: um pico de carga na máquina não chega para falhar a guarda, uma regressão real sim.
+    """
+    medicoes = medicoes.set_index('caso')
+    casos = {caso.chave(anos, n): (caso, anos, n) for caso in CASOS for anos, n in caso.tamanhos}
+    for _ in range(tentativas):
+        relatorio = comparar(medicoes.reset_index(), base, margem_tempo, margem_memoria, margem_blocos)
+        suspeitos = relatorio.loc[relatorio['estado'].str.contains('tempo'), 'caso']
+        if suspeitos.empty:
+            break
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for chave in suspeitos:
+                nova = medir(*casos[chave])
+                medicoes.loc[chave, 'tempo_s'] = min(medicoes.loc[chave, 'tempo_s'], nova['tempo_s'])
+                logger.info(f"{chave}: nova medição {nova['tempo_s'] * 1000:.3f} ms")
+    return comparar(medicoes.reset_index(), base, margem_tempo, margem_memoria, margem_blocos)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Guarda de regressão de desempenho do backtesting")
+    parser.add_argument("--margem", type=float, default=MARGEM_TEMPO,
+                        help="Tolerância relativa de tempo (0.5 = 50%% acima da referência)")
+    parser.add_argument("--margem-memoria", type=float, default=MARGEM_MEMORIA,
+                        help="Tolerância relativa do pico de memória")
+    parser.add_argument("--margem-alocacoes", type=float, default=MARGEM_BLOCOS,
+                        help="Tolerância relativa dos blocos de memória alocados")
+    parser.add_argument("--filtro", help="Só os casos cujo nome contém este texto")
+    parser.add_argument("--base", default=str(ARQUIVO_BASE), help="Ficheiro JSON de referências")
+    parser.add_argument("--atualizar", action="store_true", help="Regrava as referências com as medições")
+    parser.add_argument("--tentativas", type=int, default=2,
+                        help="Novas medições de um caso lento antes de o dar como regressão")
+    parser.add_argument("--saida", help="Grava o relatório em CSV")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("risk_profiles").setLevel(logging.ERROR)
+
+    medicoes = executar(args.filtro)
+    if args.atualizar:
+        gravar_base(medicoes, Path(args.base))
+        logger.info(f"{len(medicoes)} referências gravadas em {args.base}")
+        return 0
+
+    relatorio = confirmar_regressoes(medicoes, carregar_base(Path(args.base)), args.margem,
+                                     args.margem_memoria, args.tentativas, args.margem_alocacoes)
+    if args.saida:
+        relatorio.to_csv(args.saida, index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(relatorio[['caso', 'tempo_s', 'tempo_base_s', 'razao_tempo', 'pico_mb', 'pico_base_mb',
+                         'blocos', 'blocos_base', 'estado']]
+              .to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    regressoes = relatorio['estado'].str.startswith('REGRESSAO')
+    if regressoes.any():
+        logger.error(f"{int(regressoes.sum())} caso(s) acima do orçamento: "
+                     f"{', '.join(relatorio.loc[regressoes, 'caso'])}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
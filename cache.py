@@ -0,0 +1,340 @@
+"""
+cache.py - Cache com backends selecionáveis (memória LRU, disco SQLite, Streamlit)
+TCC: Otimização de Carteiras de Investimentos
+
+O decorador `cache_data` substitui st.cache_data nos módulos de dados. O backend é
+resolvido em cada chamada, pelo que o dashboard, a CLI, os jobs batch e os testes
+partilham o mesmo mecanismo:
+- "streamlit": delega para st.cache_data (apenas dentro do dashboard)
+- "memoria": LRU no processo, com TTL e limites de itens/bytes
+- "disco": SQLite local, persistente entre processos, com TTL e limite de bytes
+- "nenhum": sem cache
+- "auto" (omissão): "streamlit" dentro do dashboard, "memoria" fora dele
+
+Seleção via configurar_cache() ou pelas variáveis de ambiente CACHE_BACKEND e CACHE_DIR.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import sqlite3
+import logging
+import threading
+import functools
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from streamlit_compat import streamlit_ativo
+
+logger = logging.getLogger(__name__)
+
+BACKENDS_VALIDOS = ("auto", "streamlit", "memoria", "disco", "nenhum")
+DIRETORIO_PADRAO = Path.home() / ".cache" / "otimizador_b3"
+
+
+@dataclass
+class EstatisticasCache:
+    """Contadores de utilização de um backend."""
+    acertos: int = 0
+    falhas: int = 0
+    insercoes: int = 0
+    remocoes_lru: int = 0   # Evicções por limite de tamanho
+    expiracoes: int = 0     # Entradas descartadas por TTL
+
+    @property
+    def taxa_acerto(self) -> float:
+        total = self.acertos + self.falhas
+        return self.acertos / total if total else 0.0
+
+
+class BackendCache(ABC):
+    """
+    Interface chave/valor comum aos backends. Os valores são guardados serializados (pickle).
+
+    Os contadores de utilização ficam no atributo `estatisticas` (EstatisticasCache),
+    partilhado por todos os backends.
+    """
+
+    nome = "base"
+
+    def __init__(self):
+        self.estatisticas = EstatisticasCache()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def obter(self, chave: str) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor)."""
+
+    @abstractmethod
+    def guardar(self, chave: str, valor: Any, ttl: Optional[float] = None) -> None:
+        """Guarda o valor; expira após ttl segundos (None = sem expiração)."""
+
+    @abstractmethod
+    def remover(self, chave: str) -> None:
+        """Remove a entrada, se existir."""
+
+    @abstractmethod
+    def limpar(self, prefixo: str = "") -> None:
+        """Remove todas as entradas cuja chave começa por prefixo ("" = todas)."""
+
+
+class CacheNulo(BackendCache):
+    """Backend que nunca guarda nada (útil para medir o custo sem cache)."""
+
+    nome = "nenhum"
+
+    def obter(self, chave):
+        self.estatisticas.falhas += 1
+        return False, None
+
+    def guardar(self, chave, valor, ttl=None):
+        pass
+
+    def remover(self, chave):
+        pass
+
+    def limpar(self, prefixo=""):
+        pass
+
+
+class CacheMemoriaLRU(BackendCache):
+    """LRU em memória do processo, com TTL por entrada e limites de itens e de bytes."""
+
+    nome = "memoria"
+
+    def __init__(self, max_itens: int = 256, max_bytes: int = 512 * 1024 ** 2):
+        super().__init__()
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._dados: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                self.estatisticas.falhas += 1
+                return False, None
+            blob, expira = item
+            if expira is not None and time.time() >= expira:
+                self._descartar(chave)
+                self.estatisticas.expiracoes += 1
+                self.estatisticas.falhas += 1
+                return False, None
+            self._dados.move_to_end(chave)
+            self.estatisticas.acertos += 1
+        return True, pickle.loads(blob)
+
+    def guardar(self, chave, valor, ttl=None):
+        blob = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        expira = time.time() + ttl if ttl else None
+        with self._lock:
+            if chave in self._dados:
+                self._descartar(chave)
+            self._dados[chave] = (blob, expira)
+            self._bytes += len(blob)
+            self.estatisticas.insercoes += 1
+            while len(self._dados) > self.max_itens or self._bytes > self.max_bytes:
+                antiga = next(iter(self._dados))
+                self._descartar(antiga)
+                self.estatisticas.remocoes_lru += 1
+
+    def _descartar(self, chave):
+        blob, _ = self._dados.pop(chave)
+        self._bytes -= len(blob)
+
+    def remover(self, chave):
+        with self._lock:
+            if chave in self._dados:
+                self._descartar(chave)
+
+    def limpar(self, prefixo=""):
+        with self._lock:
+            for chave in [c for c in self._dados if c.startswith(prefixo)]:
+                self._descartar(chave)
+
+
+class CacheDisco(BackendCache):
+    """
+    Cache persistente em SQLite (um ficheiro local partilhado entre processos).
+    Evicção LRU pelo instante do último acesso quando o total excede max_bytes.
+    """
+
+    nome = "disco"
+
+    def __init__(self, diretorio: Optional[Path] = None, max_bytes: int = 2 * 1024 ** 3):
+        super().__init__()
+        self.diretorio = Path(diretorio or os.environ.get("CACHE_DIR", DIRETORIO_PADRAO))
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.caminho = self.diretorio / "cache.sqlite"
+        self.max_bytes = max_bytes
+        self._conexao = None
+        self._pid = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Uma ligação por processo (após fork a ligação herdada não é reutilizável)
+        if self._conexao is None or self._pid != os.getpid():
+            self._conexao = sqlite3.connect(self.caminho, timeout=30, check_same_thread=False)
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS cache (chave TEXT PRIMARY KEY, valor BLOB, "
+                "expira REAL, acesso REAL, tamanho INTEGER)"
+            )
+            self._pid = os.getpid()
+        return self._conexao
+
+    def obter(self, chave):
+        with self._lock:
+            con = self._conectar()
+            linha = con.execute("SELECT valor, expira FROM cache WHERE chave = ?", (chave,)).fetchone()
+            if linha is None:
+                self.estatisticas.falhas += 1
+                return False, None
+            blob, expira = linha
+            if expira is not None and time.time() >= expira:
+                con.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+                con.commit()
+                self.estatisticas.expiracoes += 1
+                self.estatisticas.falhas += 1
+                return False, None
+            con.execute("UPDATE cache SET acesso = ? WHERE chave = ?", (time.time(), chave))
+            con.commit()
+            self.estatisticas.acertos += 1
+        return True, pickle.loads(blob)
+
+    def guardar(self, chave, valor, ttl=None):
+        blob = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        agora = time.time()
+        expira = agora + ttl if ttl else None
+        with self._lock:
+            con = self._conectar()
+            con.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                        (chave, sqlite3.Binary(blob), expira, agora, len(blob)))
+            self.estatisticas.insercoes += 1
+            total = con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                antiga = con.execute("SELECT chave, tamanho FROM cache ORDER BY acesso LIMIT 1").fetchone()
+                if antiga is None or antiga[0] == chave:
+                    break
+                con.execute("DELETE FROM cache WHERE chave = ?", (antiga[0],))
+                total -= antiga[1]
+                self.estatisticas.remocoes_lru += 1
+            con.commit()
+
+    def remover(self, chave):
+        with self._lock:
+            con = self._conectar()
+            con.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+            con.commit()
+
+    def limpar(self, prefixo=""):
+        with self._lock:
+            con = self._conectar()
+            con.execute("DELETE FROM cache WHERE substr(chave, 1, ?) = ?", (len(prefixo), prefixo))
+            con.commit()
+
+
+# ============== SELEÇÃO DO BACKEND ==============
+
+_backend_configurado: Optional[str] = None
+_instancias: Dict[str, BackendCache] = {}
+
+
+def configurar_cache(backend: str = "auto", **opcoes) -> None:
+    """
+    Seleciona o backend global (ex.: configurar_cache("disco", diretorio="/tmp/cache")).
+    As opções são passadas ao construtor do backend e substituem a instância anterior.
+    """
+    global _backend_configurado
+    if backend not in BACKENDS_VALIDOS:
+        raise ValueError(f"Backend de cache inválido: {backend}. Opções: {BACKENDS_VALIDOS}")
+    _backend_configurado = backend
+    if opcoes and backend in ("memoria", "disco"):
+        _instancias[backend] = _criar_backend(backend, **opcoes)
+
+
+def _criar_backend(nome: str, **opcoes) -> BackendCache:
+    if nome == "memoria":
+        return CacheMemoriaLRU(**opcoes)
+    if nome == "disco":
+        return CacheDisco(**opcoes)
+    return CacheNulo()
+
+
+def nome_backend_ativo() -> str:
+    """Resolve 'auto' para o backend efetivo no contexto atual."""
+    nome = _backend_configurado or os.environ.get("CACHE_BACKEND", "auto")
+    if nome == "auto":
+        return "streamlit" if streamlit_ativo() else "memoria"
+    if nome == "streamlit" and not streamlit_ativo():
+        return "memoria"
+    return nome
+
+
+def obter_backend(nome: Optional[str] = None) -> BackendCache:
+    """Instância (única por processo) do backend chave/valor pedido ou ativo."""
+    nome = nome or nome_backend_ativo()
+    if nome == "streamlit":
+        # O st.cache_data só existe como decorador; o acesso direto chave/valor usa a memória
+        nome = "memoria"
+    if nome not in _instancias:
+        _instancias[nome] = _criar_backend(nome)
+    return _instancias[nome]
+
+
+def estatisticas_cache() -> Dict[str, dict]:
+    """Estatísticas de todos os backends instanciados neste processo."""
+    return {nome: dict(asdict(b.estatisticas), taxa_acerto=b.estatisticas.taxa_acerto)
+            for nome, b in _instancias.items()}
+
+
+def _chave(func: Callable, args: tuple, kwargs: dict) -> str:
+    conteudo = pickle.dumps((args, sorted(kwargs.items())), protocol=pickle.HIGHEST_PROTOCOL)
+    return f"{func.__module__}.{func.__qualname__}:{hashlib.sha256(conteudo).hexdigest()}"
+
+
+def cache_data(ttl: Optional[float] = None, backend: Optional[str] = None) -> Callable:
+    """
+    Memoriza o resultado da função no backend ativo (ou no indicado em `backend`).
+
+    Dentro do dashboard, com o backend "streamlit", delega para st.cache_data; nos
+    restantes casos usa a interface chave/valor com o mesmo TTL. A função decorada
+    expõe .clear(), como as funções do Streamlit.
+    """
+    def decorador(func: Callable) -> Callable:
+        versao_streamlit = []
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            nome = backend or nome_backend_ativo()
+            if nome == "streamlit" and streamlit_ativo():
+                if not versao_streamlit:
+                    import streamlit as st
+                    versao_streamlit.append(st.cache_data(ttl=ttl)(func))
+                return versao_streamlit[0](*args, **kwargs)
+
+            destino = obter_backend(nome)
+            chave = _chave(func, args, kwargs)
+            encontrado, valor = destino.obter(chave)
+            if encontrado:
+                return valor
+            valor = func(*args, **kwargs)
+            destino.guardar(chave, valor, ttl)
+            return valor
+
+        def clear():
+            prefixo = f"{func.__module__}.{func.__qualname__}:"
+            for instancia in _instancias.values():
+                instancia.limpar(prefixo)
+            if versao_streamlit:
+                versao_streamlit[0].clear()
+
+        wrapper.clear = clear
+        return wrapper
+    return decorador
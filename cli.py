@@ -0,0 +1,254 @@
+"""
+cli.py - Interface de linha de comando (headless, sem Streamlit)
+TCC: Otimização de Carteiras de Investimentos
+
+Executa o pipeline completo a partir de um ficheiro de configuração JSON e grava
+os resultados em disco, para uso em servidores batch:
+
+    python -m cli optimize --config config.json --saida resultados/
+    python -m cli frontier --config config.json --saida resultados/
+    python -m cli backtest --config config.json --saida resultados/
+    python -m cli arranque --saida resultados/      # tempos de import a frio do dashboard
+
+Com --perfil-memoria, cada etapa é medida com o tracemalloc (ver profiling.py) e o
+relatório é gravado em memoria.csv.
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from profiling import etapa, perfilar_memoria
+
+logger = logging.getLogger(__name__)
+
+# Valores por omissão (os mesmos do dashboard)
+CONFIG_PADRAO = {
+    "universo": "top75",          # "top75", "todos" ou lista explícita de tickers
+    "setores": [],                # Se preenchido, filtra o universo por setor
+    "anos": 5,
+    "perfil": "Moderado",
+    "peso_maximo": 0.20,
+    "n_ativos_max": 10,
+    "taxa_livre_risco": None,     # None = Selic obtida via BCB
+    "n_pontos": 30,
+    "compacto": False,            # True = preços/retornos em float32 (metade da memória)
+    "metodo_covariancia": "ledoit_wolf",  # Ver covariance.ESTIMADORES
+    "backtest": {
+        "metodo": "walk_forward",  # "walk_forward" ou "pesos_fixos"
+        "janela_treino": 252 * 2,
+        "janela_teste": 63,
+        "capital_inicial": 100000
+    }
+}
+
+
+def carregar_config(caminho: Optional[str]) -> dict:
+    """Lê o JSON de configuração e completa com os valores por omissão."""
+    config = json.loads(json.dumps(CONFIG_PADRAO))
+    if caminho:
+        with open(caminho, encoding='utf-8') as f:
+            dados = json.load(f)
+        backtest = dados.pop("backtest", {})
+        config.update(dados)
+        config["backtest"].update(backtest)
+    return config
+
+
+def resolver_tickers(config: dict) -> List[str]:
+    """Converte o universo/setores da configuração em tickers no formato yfinance."""
+    import assets
+
+    if config["setores"]:
+        return assets.get_tickers_by_setor(config["setores"])
+    universo = config["universo"]
+    if isinstance(universo, list):
+        return [t if t.endswith('.SA') or t.startswith('^') else f"{t}.SA" for t in universo]
+    if universo == "todos":
+        return assets.get_all_tickers()
+    return assets.get_top75_tickers()
+
+
+def _taxa(config: dict) -> float:
+    import risk_profiles
+    taxa = config["taxa_livre_risco"]
+    return risk_profiles.TAXA_SELIC if taxa is None else float(taxa)
+
+
+def _carregar_dados(config: dict) -> dict:
+    import data_loader
+
+    tickers = resolver_tickers(config)
+    dados = data_loader.carregar_dados_completos(tickers, anos=config["anos"], compacto=config["compacto"],
+                                                 metodo_covariancia=config["metodo_covariancia"])
+    if dados is None:
+        raise RuntimeError("Não foi possível carregar os dados históricos.")
+    logger.info(f"{dados['n_ativos']} ativos válidos ({dados['periodo_inicio']} a {dados['periodo_fim']})")
+    return dados
+
+
+def _gravar_json(caminho: Path, conteudo: dict) -> None:
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(conteudo, f, indent=2, ensure_ascii=False, default=str)
+
+
+def comando_optimize(config: dict, saida: Path) -> None:
+    """Otimiza a carteira do perfil e grava pesos.csv e resultado.json."""
+    import optimizer
+
+    dados = _carregar_dados(config)
+    taxa = _taxa(config)
+    with etapa("otimizacao"):
+        resultado = optimizer.otimizar_por_perfil(
+            perfil=config["perfil"], retornos_medios=dados['retornos_medios'], matriz_cov=dados['matriz_cov'],
+            taxa_livre_risco=taxa, peso_maximo=config["peso_maximo"], n_ativos_max=config["n_ativos_max"]
+        )
+    pesos = pd.Series(resultado.pesos, index=resultado.tickers, name='peso')
+    pesos[pesos > 0.001].sort_values(ascending=False).to_csv(saida / 'pesos.csv', index_label='ticker')
+    _gravar_json(saida / 'resultado.json', {
+        'perfil': config["perfil"],
+        'retorno_esperado': resultado.retorno_esperado,
+        'volatilidade': resultado.volatilidade,
+        'sharpe': resultado.sharpe,
+        'sucesso': resultado.sucesso,
+        'mensagem': resultado.mensagem,
+        'taxa_livre_risco': taxa,
+        'n_ativos': dados['n_ativos']
+    })
+    logger.info(f"Carteira {config['perfil']}: retorno {resultado.retorno_esperado:.2%}, "
+                f"volatilidade {resultado.volatilidade:.2%}, Sharpe {resultado.sharpe:.3f}")
+
+
+def comando_frontier(config: dict, saida: Path) -> None:
+    """Gera a fronteira eficiente e grava fronteira.csv."""
+    import optimizer
+
+    dados = _carregar_dados(config)
+    with etapa("fronteira"):
+        fronteira = optimizer.gerar_fronteira_eficiente(
+            dados['retornos_medios'], dados['matriz_cov'], _taxa(config), n_pontos=config["n_pontos"],
+            peso_maximo=config["peso_maximo"], n_ativos_max=config["n_ativos_max"]
+        )
+    fronteira.to_csv(saida / 'fronteira.csv', index=False)
+    logger.info(f"Fronteira com {len(fronteira)} pontos gravada.")
+
+
+def comando_arranque(config: dict, saida: Path) -> None:
+    """Mede o import a frio dos módulos do dashboard num processo novo e grava arranque.csv."""
+    from profiling import MODULOS_APP, resumo_importacoes, tempos_importacao
+
+    tempos = tempos_importacao(MODULOS_APP)
+    tempos.to_csv(saida / 'arranque.csv', index=False)
+    resumo = resumo_importacoes(tempos, MODULOS_APP)
+    logger.info("Import a frio (ms):\n" + resumo.round({'acumulado_ms': 1}).to_string(index=False))
+
+
+def comando_backtest(config: dict, saida: Path) -> None:
+    """Executa o backtest configurado e grava serie_carteira.csv, metricas.json e (walk-forward) iteracoes_solver.csv."""
+    import backtesting
+    import data_loader
+    import optimizer
+
+    dados = _carregar_dados(config)
+    taxa = _taxa(config)
+    cfg_bt = config["backtest"]
+    with etapa("cdi"):
+        serie_cdi = data_loader.baixar_cdi_historico(anos=config["anos"])
+
+    if cfg_bt["metodo"] == "pesos_fixos":
+        with etapa("otimizacao"):
+            resultado = optimizer.otimizar_por_perfil(
+                perfil=config["perfil"], retornos_medios=dados['retornos_medios'], matriz_cov=dados['matriz_cov'],
+                taxa_livre_risco=taxa, peso_maximo=config["peso_maximo"], n_ativos_max=config["n_ativos_max"]
+            )
+        pesos = {t: p for t, p in zip(resultado.tickers, resultado.pesos) if p > 0.001}
+        with etapa("backtest"):
+            backtest = backtesting.backtesting_pesos_fixos(
+                precos=dados['precos'], pesos=pesos, janela_rebalanceamento=cfg_bt["janela_teste"],
+                capital_inicial=cfg_bt["capital_inicial"], taxa_livre_risco=taxa, serie_cdi_diario=serie_cdi
+            )
+    else:
+        with etapa("backtest"):
+            backtest = backtesting.backtesting_walk_forward(
+                precos=dados['precos'], perfil=config["perfil"], janela_treino=cfg_bt["janela_treino"],
+                janela_teste=cfg_bt["janela_teste"], capital_inicial=cfg_bt["capital_inicial"],
+                taxa_livre_risco=taxa, n_ativos_max=config["n_ativos_max"], peso_maximo=config["peso_maximo"],
+                serie_cdi_diario=serie_cdi, metodo_covariancia=config["metodo_covariancia"]
+            )
+
+    backtest['serie_carteira'].rename('valor').to_csv(saida / 'serie_carteira.csv', index_label='data')
+    if 'estatisticas_solver' in backtest:
+        backtest['estatisticas_solver'].to_csv(saida / 'iteracoes_solver.csv', index_label='data')
+    metricas = {k: (float(v) if isinstance(v, (np.floating, float, int, np.integer)) else v)
+                for k, v in backtest.items() if not isinstance(v, (pd.Series, pd.DataFrame))}
+    metricas['metodo'] = cfg_bt["metodo"]
+    _gravar_json(saida / 'metricas.json', metricas)
+    logger.info(f"Backtest ({cfg_bt['metodo']}): retorno total {backtest['retorno_total']:.2%}, "
+                f"Sharpe {backtest['sharpe']:.3f}, drawdown máximo {backtest['max_drawdown']:.2%}")
+
+
+COMANDOS = {
+    "optimize": comando_optimize,
+    "frontier": comando_frontier,
+    "backtest": comando_backtest,
+    "arranque": comando_arranque,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Otimizador de Carteiras B3 (headless)")
+    parser.add_argument("comando", choices=sorted(COMANDOS), help="Etapa do pipeline a executar")
+    parser.add_argument("--config", help="Ficheiro JSON de configuração (opcional)")
+    parser.add_argument("--saida", default="resultados", help="Diretório onde gravar os resultados")
+    parser.add_argument("--cache", default="disco", choices=["memoria", "disco", "nenhum"],
+                        help="Backend de cache dos downloads (disco partilha resultados entre execuções)")
+    parser.add_argument("--cache-dir", help="Diretório do cache em disco (omissão: ~/.cache/otimizador_b3)")
+    parser.add_argument("--perfil-memoria", action="store_true",
+                        help="Mede memória retida e de pico por etapa (tracemalloc) e grava memoria.csv")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Logging detalhado")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    import cache
+    if args.cache == "disco" and args.cache_dir:
+        cache.configurar_cache("disco", diretorio=args.cache_dir)
+    else:
+        cache.configurar_cache(args.cache)
+
+    config = carregar_config(args.config)
+    saida = Path(args.saida)
+    saida.mkdir(parents=True, exist_ok=True)
+
+    if args.perfil_memoria:
+        # Imports pesados (cvxpy, scipy) antes de ligar o tracemalloc: não são custo do
+        # pipeline e encheriam os snapshots de cada etapa. Os módulos do pacote carregam-nos
+        # só no primeiro uso (profiling.ModuloPreguicoso), por isso são importados aqui
+        import backtesting, data_loader, optimizer  # noqa: F401
+        import cvxpy, scipy.stats  # noqa: F401
+
+    with perfilar_memoria(ativo=args.perfil_memoria) as perfil:
+        try:
+            COMANDOS[args.comando](config, saida)
+        except Exception as e:
+            logger.error(f"Falha no comando '{args.comando}': {e}")
+            return 1
+        finally:
+            for nome, est in cache.estatisticas_cache().items():
+                logger.info(f"Cache {nome}: {est['acertos']} acertos, {est['falhas']} falhas, "
+                            f"{est['remocoes_lru']} evicções, {est['expiracoes']} expirações")
+            if perfil is not None:
+                perfil.relatorio().to_csv(saida / 'memoria.csv', index=False)
+                logger.info(f"Perfil de memória por etapa:\n{perfil.resumo()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,63 +12,466 @@ Este módulo é responsável por:
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
 from datetime import datetime, timedelta
-from typing import Tuple, List, Optional
-import streamlit as st
+from typing import Callable, Dict, Tuple, List, Optional
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from streamlit_compat import spinner, erro, aviso
+from cache import cache_data, obter_backend, DIRETORIO_PADRAO
+from profiling import etapa, ModuloPreguicoso
+from assets import get_all_tickers
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import requests
 import logging
+import os
+import random
+import threading
+import time
+import zlib
 import risk_profiles
-from sklearn.covariance import LedoitWolf
+import covariance
+
+# yfinance (~0,2 s de import) só é carregado no primeiro download real
+yf = ModuloPreguicoso("yfinance")
 
 # Período de análise: 5 anos
 ANOS_HISTORICO = 5
 
-@st.cache_data(ttl=3600)  # Cache por 1 hora
-def baixar_dados_historicos(tickers: List[str], anos: int = ANOS_HISTORICO) -> pd.DataFrame:
+# ============== DOWNLOAD EM LOTES ==============
+
+TAMANHO_LOTE_DOWNLOAD = 25     # Tickers por pedido ao yfinance
+MAX_WORKERS_DOWNLOAD = 4       # Pedidos simultâneos
+TENTATIVAS_DOWNLOAD = 3        # Tentativas por lote (backoff exponencial entre elas)
+TTL_PRECOS_TICKER = 3600       # Validade do cache por ticker (segundos)
+
+# Assinatura de um fetcher: (tickers, data_inicio, data_fim) -> DataFrame de fechamentos (datas x tickers)
+Fetcher = Callable[[List[str], datetime, datetime], pd.DataFrame]
+
+
+@dataclass
+class RelatorioDownload:
+    """Resultado por ticker de um download em lotes."""
+    solicitados: int = 0
+    baixados: List[str] = field(default_factory=list)       # Obtidos da rede nesta chamada
+    do_cache: List[str] = field(default_factory=list)       # Servidos pelo cache por ticker
+    falhas: Dict[str, str] = field(default_factory=dict)    # Ticker -> motivo
+    descartados: List[str] = field(default_factory=list)    # Dados insuficientes (< 80% do período)
+    lotes: int = 0
+    tentativas: int = 0
+    duracao_s: float = 0.0
+
+    @property
+    def validos(self) -> int:
+        return len(self.baixados) + len(self.do_cache) - len(self.descartados)
+
+
+def buscar_precos_yfinance(tickers: List[str], data_inicio: datetime, data_fim: datetime) -> pd.DataFrame:
+    """
+    Fetcher padrão: um pedido yf.download para o lote (sem threads internas).
+    Em erros de rede ou limite de pedidos o yf.download não lança exceção e devolve um
+    quadro vazio (ou só NaN); esse caso é tratado como falha do lote em _baixar_lote.
+    """
+    dados = yf.download(
+        tickers,
+        start=data_inicio.strftime('%Y-%m-%d'),
+        end=data_fim.strftime('%Y-%m-%d'),
+        progress=False,
+        auto_adjust=True,
+        threads=False
+    )
+    if dados is None or dados.empty:
+        return pd.DataFrame()
+    
+    # Se só tem um ticker, yfinance pode retornar Close como Series
+    fechamentos = dados['Close']
+    if isinstance(fechamentos, pd.Series):
+        fechamentos = fechamentos.to_frame(tickers[0])
+    return fechamentos
+
+
+class FetcherSintetico:
     """
-    Baixa dados históricos de preços ajustados via yfinance.
+    Substituto local do yfinance para testes do download em lotes.
+    
+    Cada ticker tem uma série determinística (semente derivada do nome), independente
+    do lote em que é pedido. Permite simular falhas transitórias e tickers inexistentes.
     
     Args:
-        tickers: Lista de tickers (ex: ['PETR4.SA', 'VALE3.SA'])
+        falhas_transitorias: Ticker -> número de pedidos que falham antes de responder
+        tickers_inexistentes: Tickers para os quais não há dados (coluna ausente)
+        latencia: Espera (segundos) por pedido, para simular a rede
+        anos: Anos de histórico gerados
+    """
+
+    def __init__(self, falhas_transitorias: Optional[Dict[str, int]] = None,
+                 tickers_inexistentes: Tuple[str, ...] = (), latencia: float = 0.0,
+                 anos: int = ANOS_HISTORICO):
+        self.falhas_transitorias = dict(falhas_transitorias or {})
+        self.tickers_inexistentes = set(tickers_inexistentes)
+        self.latencia = latencia
+        self.anos = anos
+        self.pedidos = 0
+        self._lock = threading.Lock()
+
+    @property
+    def identidade_cache(self) -> str:
+        """Configuração que determina os dados servidos (entra na chave do cache por ticker)."""
+        return f"FetcherSintetico(anos={self.anos},inexistentes={','.join(sorted(self.tickers_inexistentes))})"
+
+    def __call__(self, tickers: List[str], data_inicio: datetime, data_fim: datetime) -> pd.DataFrame:
+        with self._lock:
+            self.pedidos += 1
+            pendentes = [t for t in tickers if self.falhas_transitorias.get(t, 0) > 0]
+            for t in pendentes:
+                self.falhas_transitorias[t] -= 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if pendentes:
+            raise ConnectionError(f"Falha simulada no lote ({', '.join(pendentes)})")
+        
+        colunas = [gerar_precos_sinteticos([t], self.anos, zlib.crc32(t.encode()))
+                   for t in tickers if t not in self.tickers_inexistentes]
+        return pd.concat(colunas, axis=1) if colunas else pd.DataFrame()
+
+
+def _identidade_fetcher(fetcher: Fetcher) -> str:
+    """
+    Identifica o fetcher na chave do cache: funções pelo nome qualificado; instâncias pela
+    sua `identidade_cache` ou, sem ela, pela própria instância (nunca partilham entradas).
+    """
+    identidade = getattr(fetcher, 'identidade_cache', None)
+    if identidade is not None:
+        return str(identidade)
+    if hasattr(fetcher, '__qualname__'):
+        return f"{fetcher.__module__}.{fetcher.__qualname__}"
+    return f"{type(fetcher).__qualname__}@{id(fetcher):x}"
+
+
+def _baixar_lote(fetcher: Fetcher, lote: List[str], data_inicio: datetime, data_fim: datetime,
+                 tentativas: int, espera_base: float) -> Tuple[pd.DataFrame, int]:
+    """
+    Executa um lote com retry e backoff exponencial (com jitter). Retorna (precos, tentativas usadas).
+    Um resultado vazio, ou só com NaN nos tickers do lote, conta como falha da tentativa.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            precos = fetcher(lote, data_inicio, data_fim)
+            if precos is None or precos.reindex(columns=lote).isna().all().all():
+                raise ConnectionError("resposta sem dados para o lote")
+            return precos, tentativa
+        except Exception as e:
+            if tentativa == tentativas:
+                raise
+            espera = espera_base * 2 ** (tentativa - 1) * (1 + random.random() * 0.5)
+            logging.warning(f"Lote {lote[0]}..{lote[-1]} falhou ({e}); nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+
+def baixar_dados_em_lotes(tickers: List[str], anos: int = ANOS_HISTORICO,
+                          fetcher: Optional[Fetcher] = None,
+                          tamanho_lote: int = TAMANHO_LOTE_DOWNLOAD,
+                          max_workers: int = MAX_WORKERS_DOWNLOAD,
+                          tentativas: int = TENTATIVAS_DOWNLOAD,
+                          espera_base: float = 1.0,
+                          usar_cache: bool = True) -> Tuple[pd.DataFrame, RelatorioDownload]:
+    """
+    Download tolerante a falhas de um universo grande de tickers.
+    
+    O universo é dividido em lotes baixados em paralelo; cada lote tem retry com backoff.
+    Cada ticker é guardado no cache (cache.py) assim que o seu lote chega, pelo que
+    universos sobrepostos (ex.: filtros de setor) reaproveitam o que já foi obtido.
+    Um lote que falha em todas as tentativas é dividido ao meio (uma tentativa por metade)
+    até isolar os tickers problemáticos, que são os únicos reportados como falha.
+    Os tickers em falta (ou só com NaN) num lote que chegou voltam à fila como um lote
+    novo, mais pequeno, em vez de serem dados logo como falhados.
+    
+    Args:
+        tickers: Lista de tickers (formato yfinance)
         anos: Quantidade de anos de histórico
+        fetcher: Função de obtenção de um lote (omissão: buscar_precos_yfinance)
+        tamanho_lote: Tickers por pedido
+        max_workers: Pedidos simultâneos
+        tentativas: Tentativas por lote
+        espera_base: Espera (segundos) antes da 2.ª tentativa; duplica a cada falha
+        usar_cache: Consulta/guarda cada ticker no backend de cache ativo
         
     Returns:
-        DataFrame com preços ajustados de fechamento
+        Tuple com (DataFrame de preços limpo, RelatorioDownload)
     """
+    fetcher = fetcher or buscar_precos_yfinance
+    inicio_relogio = time.perf_counter()
     data_fim = datetime.now()
     data_inicio = data_fim - timedelta(days=anos * 365)
+    relatorio = RelatorioDownload(solicitados=len(tickers))
     
-    try:
-        dados = yf.download(
-            tickers,
-            start=data_inicio.strftime('%Y-%m-%d'),
-            end=data_fim.strftime('%Y-%m-%d'),
-            progress=False,
-            auto_adjust=True
-        )
-        
-        # Se só tem um ticker, yfinance retorna diferente
-        if len(tickers) == 1:
-            precos = dados[['Close']].copy()
-            precos.columns = tickers
+    backend = obter_backend() if usar_cache else None
+    prefixo = f"data_loader.precos_ticker:{_identidade_fetcher(fetcher)}"
+    
+    def _chave(ticker: str) -> str:
+        return f"{prefixo}:{ticker}:{data_inicio:%Y-%m-%d}:{data_fim:%Y-%m-%d}"
+    
+    series: Dict[str, pd.Series] = {}
+    pendentes = []
+    for ticker in dict.fromkeys(tickers):
+        encontrado, serie = backend.obter(_chave(ticker)) if backend else (False, None)
+        if encontrado:
+            series[ticker] = serie
+            relatorio.do_cache.append(ticker)
         else:
-            precos = dados['Close'].copy()
-        
-        # Remove colunas com muitos NaN (ativos com dados insuficientes)
-        precos = precos.dropna(axis=1, thresh=int(len(precos) * 0.8))
-        
-        # Preenche NaN restantes com forward fill
-        precos = precos.ffill().bfill()
-        
-        return precos
+            pendentes.append(ticker)
+    
+    def _registar_lote(lote: List[str], precos_lote: pd.DataFrame) -> List[str]:
+        """Guarda cada ticker no cache assim que o lote chega. Retorna os tickers em falta."""
+        em_falta = []
+        for ticker in lote:
+            serie = precos_lote[ticker].dropna() if ticker in precos_lote.columns else None
+            if serie is None or serie.empty:
+                em_falta.append(ticker)
+                continue
+            series[ticker] = serie
+            relatorio.baixados.append(ticker)
+            if backend:
+                backend.guardar(_chave(ticker), serie, TTL_PRECOS_TICKER)
+        return em_falta
+    
+    lotes = [pendentes[i:i + tamanho_lote] for i in range(0, len(pendentes), tamanho_lote)]
+    relatorio.lotes = len(lotes)
+    
+    if lotes:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(lotes))) as executor:
+            def _submeter(lote, n_tentativas):
+                futuro = executor.submit(_baixar_lote, fetcher, lote, data_inicio, data_fim,
+                                         n_tentativas, espera_base)
+                futuros[futuro] = (lote, n_tentativas)
+            
+            futuros = {}
+            for lote in lotes:
+                _submeter(lote, tentativas)
+            
+            while futuros:
+                concluidos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    lote, n_tentativas = futuros.pop(futuro)
+                    try:
+                        precos_lote, usadas = futuro.result()
+                    except Exception as e:
+                        relatorio.tentativas += n_tentativas
+                        if len(lote) > 1:
+                            meio = len(lote) // 2
+                            _submeter(lote[:meio], 1)
+                            _submeter(lote[meio:], 1)
+                        else:
+                            relatorio.falhas[lote[0]] = f"falhou após {n_tentativas} tentativa(s): {e}"
+                        continue
+                    relatorio.tentativas += usadas
+                    em_falta = _registar_lote(lote, precos_lote)
+                    if em_falta:
+                        # Lote parcial: os que faltam formam um lote menor (o tamanho diminui
+                        # sempre, porque um lote sem nenhum dado falha em _baixar_lote)
+                        logging.warning(f"{len(em_falta)} ticker(s) sem dados no lote {lote[0]}..{lote[-1]}; "
+                                        f"a pedir de novo")
+                        _submeter(em_falta, n_tentativas)
+    
+    relatorio.duracao_s = time.perf_counter() - inicio_relogio
+    if not series:
+        return pd.DataFrame(), relatorio
+    
+    # Mantém a ordem pedida
+    precos = pd.concat([series[t].rename(t) for t in tickers if t in series], axis=1).sort_index()
+    
+    # Remove colunas com muitos NaN (ativos com dados insuficientes)
+    completos = precos.dropna(axis=1, thresh=int(len(precos) * 0.8))
+    relatorio.descartados = [t for t in precos.columns if t not in completos.columns]
+    precos = completos
+    
+    # Preenche NaN restantes com forward fill (in-place: evita duas cópias do painel)
+    precos.ffill(inplace=True)
+    precos.bfill(inplace=True)
+    
+    return precos, relatorio
+
+
+@cache_data(ttl=3600)  # Cache por 1 hora
+def baixar_dados_historicos(tickers: List[str], anos: int = ANOS_HISTORICO) -> pd.DataFrame:
+    """
+    Baixa dados históricos de preços ajustados via yfinance (em lotes paralelos).
+    
+    Tickers sem dados são reportados individualmente e não invalidam o restante universo.
+    
+    Args:
+        tickers: Lista de tickers (ex: ['PETR4.SA', 'VALE3.SA'])
+        anos: Quantidade de anos de histórico
         
+    Returns:
+        DataFrame com preços ajustados de fechamento
+    """
+    try:
+        precos, relatorio = baixar_dados_em_lotes(tickers, anos)
     except Exception as e:
-        st.error(f"Erro ao baixar dados: {e}")
+        erro(f"Erro ao baixar dados: {e}")
         return pd.DataFrame()
+    
+    logging.info(f"Download: {len(relatorio.baixados)} da rede, {len(relatorio.do_cache)} do cache, "
+                 f"{len(relatorio.falhas)} falhas em {relatorio.lotes} lotes ({relatorio.duracao_s:.1f}s)")
+    if relatorio.falhas:
+        amostra = ', '.join(t.replace('.SA', '') for t in list(relatorio.falhas)[:10])
+        extra = f" (+{len(relatorio.falhas) - 10})" if len(relatorio.falhas) > 10 else ""
+        aviso(f"{len(relatorio.falhas)} ativo(s) sem dados foram ignorados: {amostra}{extra}")
+    if precos.empty:
+        erro("Erro ao baixar dados: nenhum ativo retornou cotações.")
+    
+    return precos
+
+
+# ============== CDI (armazenamento incremental) ==============
+
+URL_SGS = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{serie}/dados"
+SERIE_CDI = 12
+INTERVALO_MINIMO_CONSULTA = 6 * 3600   # Segundos entre consultas ao BCB com o armazém em dia
+
+_sessao_http: Optional[requests.Session] = None
+_lock_sessao = threading.Lock()
+
+
+def obter_sessao_http() -> requests.Session:
+    """
+    Sessão HTTP partilhada (pool de ligações keep-alive) com retry e backoff
+    para erros transitórios do servidor (429/5xx).
+    """
+    global _sessao_http
+    with _lock_sessao:
+        if _sessao_http is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=("GET",))
+            sessao = requests.Session()
+            sessao.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+            _sessao_http = sessao
+        return _sessao_http
+
+
+def converter_serie_sgs(dados: list, nome: str = 'cdi_diario') -> pd.Series:
+    """
+    Converte a resposta JSON do SGS ([{'data': 'dd/mm/aaaa', 'valor': '0,0527'}, ...])
+    numa série em decimal, com um único pd.to_datetime de formato explícito.
+    
+    A série 12 (CDI) vem em % a.d.: 0.0527 significa 0.0527% ao dia → 0.000527 em decimal.
+    """
+    if not dados:
+        return pd.Series(dtype=float, name=nome, index=pd.DatetimeIndex([]))
+    tabela = pd.DataFrame.from_records(dados, columns=['data', 'valor'])
+    datas = pd.to_datetime(tabela['data'], format='%d/%m/%Y')
+    valores = pd.to_numeric(tabela['valor'].astype(str).str.replace(',', '.', regex=False)) / 100
+    serie = pd.Series(valores.to_numpy(), index=pd.DatetimeIndex(datas), name=nome)
+    return serie.sort_index()
+
+
+def buscar_serie_sgs(data_inicio: datetime, data_fim: datetime, serie: int = SERIE_CDI) -> list:
+    """Consulta o SGS do BCB num intervalo, pela sessão partilhada. Intervalo sem dados → lista vazia."""
+    resp = obter_sessao_http().get(
+        URL_SGS.format(serie=serie),
+        params={'formato': 'json',
+                'dataInicial': data_inicio.strftime('%d/%m/%Y'),
+                'dataFinal': data_fim.strftime('%d/%m/%Y')},
+        timeout=15
+    )
+    if resp.status_code == 404:
+        # O SGS responde 404 quando não há observações no intervalo (ex.: fim de semana)
+        return []
+    resp.raise_for_status()
+    return resp.json()
+
+
+class ArmazemCDI:
+    """
+    Série do CDI persistida em disco (CSV) e atualizada de forma incremental:
+    só as datas posteriores à última guardada (ou anteriores à primeira) são pedidas ao BCB.
+    
+    Args:
+        caminho: Ficheiro CSV (omissão: <CACHE_DIR>/cdi_sgs12.csv)
+        buscar: Função (data_inicio, data_fim) -> lista JSON do SGS (omissão: buscar_serie_sgs)
+        intervalo_minimo: Segundos durante os quais um armazém atualizado não volta a consultar o BCB
+    """
+
+    def __init__(self, caminho: Optional[Path] = None, buscar: Optional[Callable] = None,
+                 intervalo_minimo: float = INTERVALO_MINIMO_CONSULTA):
+        diretorio = Path(os.environ.get("CACHE_DIR", DIRETORIO_PADRAO))
+        self.caminho = Path(caminho) if caminho else diretorio / f"cdi_sgs{SERIE_CDI}.csv"
+        self.buscar = buscar or buscar_serie_sgs
+        self.intervalo_minimo = intervalo_minimo
+        self.consultas = 0
+        self._lock = threading.Lock()
+
+    def carregar(self) -> pd.Series:
+        """Série guardada em disco (vazia se ainda não existir ou estiver corrompida)."""
+        try:
+            tabela = pd.read_csv(self.caminho)
+            datas = pd.to_datetime(tabela['data'], format='%Y-%m-%d')
+            return pd.Series(tabela['cdi_diario'].to_numpy(), index=pd.DatetimeIndex(datas), name='cdi_diario')
+        except (FileNotFoundError, KeyError, ValueError, pd.errors.EmptyDataError):
+            return pd.Series(dtype=float, name='cdi_diario', index=pd.DatetimeIndex([]))
+
+    def _gravar(self, serie: pd.Series) -> None:
+        # Escrita atómica: ficheiro temporário + rename
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        temporario = self.caminho.with_suffix(f".{os.getpid()}.tmp")
+        serie.rename_axis('data').to_csv(temporario, date_format='%Y-%m-%d', header=True)
+        os.replace(temporario, self.caminho)
+
+    def _recente(self) -> bool:
+        try:
+            return time.time() - self.caminho.stat().st_mtime < self.intervalo_minimo
+        except FileNotFoundError:
+            return False
+
+    def obter(self, data_inicio: datetime, data_fim: datetime) -> pd.Series:
+        """
+        Série CDI entre as datas, completando o armazém com os trechos em falta.
+        Se o BCB falhar, devolve o que já estiver guardado.
+        """
+        inicio, fim = pd.Timestamp(data_inicio).normalize(), pd.Timestamp(data_fim).normalize()
+        with self._lock:
+            serie = self.carregar()
+            trechos = []
+            if serie.empty:
+                trechos.append((inicio, fim))
+            else:
+                # Folga de uma semana no início: feriados/fins de semana não geram novas consultas
+                if inicio < serie.index[0] - pd.Timedelta(days=7):
+                    trechos.append((inicio, serie.index[0] - pd.Timedelta(days=1)))
+                if serie.index[-1] < fim and not self._recente():
+                    trechos.append((serie.index[-1] + pd.Timedelta(days=1), fim))
+            
+            if trechos:
+                try:
+                    novos = []
+                    for a, b in trechos:
+                        self.consultas += 1
+                        novos.append(converter_serie_sgs(self.buscar(a.to_pydatetime(), b.to_pydatetime())))
+                    serie = pd.concat([serie] + novos)
+                    serie = serie[~serie.index.duplicated(keep='last')].sort_index()
+                    # Regrava mesmo sem dados novos: o mtime marca a última consulta
+                    self._gravar(serie)
+                except Exception as e:
+                    logging.warning(f"Falha ao atualizar CDI via BCB ({e}); usando {len(serie)} obs em disco.")
+        
+        return serie.loc[inicio:fim]
+
+
+_armazem_cdi: Optional[ArmazemCDI] = None
 
 
-@st.cache_data(ttl=86400)  # Cache de 24h
+def obter_armazem_cdi() -> ArmazemCDI:
+    """Armazém CDI do processo (criado na primeira utilização)."""
+    global _armazem_cdi
+    if _armazem_cdi is None:
+        _armazem_cdi = ArmazemCDI()
+    return _armazem_cdi
+
+
+@cache_data(ttl=86400)  # Cache de 24h
 def baixar_cdi_historico(anos: int = ANOS_HISTORICO) -> pd.Series:
     """
     Busca a série histórica do CDI diário via API do Banco Central (SGS série 12).
@@ -76,6 +479,8 @@ def baixar_cdi_historico(anos: int = ANOS_HISTORICO) -> pd.Series:
     Permite calcular o excesso de retorno do portfólio dia a dia, corrigindo
     a distorção de usar uma taxa Selic constante em backtests multi-anuais.
     Referência: https://dadosabertos.bcb.gov.br/dataset/12-taxa-de-juros---cdi
+    
+    A série fica guardada em disco (ArmazemCDI); cada atualização pede só os dias novos.
 
     Returns:
         pd.Series com a taxa CDI diária em decimal, indexada por data.
@@ -83,39 +488,43 @@ def baixar_cdi_historico(anos: int = ANOS_HISTORICO) -> pd.Series:
     data_fim = datetime.now()
     data_inicio = data_fim - timedelta(days=anos * 365 + 60)
 
-    try:
-        url = (
-            "https://api.bcb.gov.br/dados/serie/bcdata.sgs.12/dados?"
-            f"formato=json&"
-            f"dataInicial={data_inicio.strftime('%d/%m/%Y')}&"
-            f"dataFinal={data_fim.strftime('%d/%m/%Y')}"
-        )
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        dados = resp.json()
-
-        datas = []
-        taxas = []
-        for d in dados:
-            datas.append(pd.to_datetime(d['data'], dayfirst=True))
-            # SGS série 12 retorna CDI diário em % a.d.
-            # Ex: 0.0527 significa 0.0527% ao dia → 0.000527 em decimal
-            valor = float(d['valor'].replace(',', '.'))
-            taxas.append(valor / 100)
-
-        serie = pd.Series(taxas, index=pd.DatetimeIndex(datas), name='cdi_diario')
-        serie = serie.sort_index()
-
-        logging.info(
-            f"CDI histórico carregado: {len(serie)} obs "
-            f"({serie.index[0]:%Y-%m} a {serie.index[-1]:%Y-%m})"
-        )
-        return serie
-
-    except Exception as e:
-        logging.warning(f"Falha ao buscar CDI histórico via BCB: {e}")
+    serie = obter_armazem_cdi().obter(data_inicio, data_fim)
+    if serie.empty:
+        logging.warning("Falha ao buscar CDI histórico via BCB: série indisponível.")
         return pd.Series(dtype=float)
 
+    logging.info(
+        f"CDI histórico carregado: {len(serie)} obs "
+        f"({serie.index[0]:%Y-%m} a {serie.index[-1]:%Y-%m})"
+    )
+    return serie
+
+def gerar_precos_sinteticos(tickers: List[str], anos: int = ANOS_HISTORICO, semente: int = 0) -> pd.DataFrame:
+    """
+    Gera preços sintéticos determinísticos (modelo de um fator + ruído idiossincrático).
+    
+    Substituto local do yfinance para testes, benchmarks e testes de carga offline:
+    a mesma lista de tickers e semente produz sempre o mesmo painel.
+    
+    Args:
+        tickers: Lista de tickers (apenas rotulam as colunas)
+        anos: Quantidade de anos de histórico (252 pregões por ano)
+        semente: Semente do gerador aleatório
+        
+    Returns:
+        DataFrame com preços de fechamento indexado por dias úteis
+    """
+    n_dias, n_ativos = anos * 252, len(tickers)
+    rng = np.random.default_rng(semente)
+    fator = rng.normal(0.0003, 0.011, n_dias)
+    betas = rng.uniform(0.5, 1.5, n_ativos)
+    drift = rng.normal(0.0002, 0.0004, n_ativos)
+    vol_idio = rng.uniform(0.008, 0.025, n_ativos)
+    retornos = fator[:, None] * betas + drift + rng.standard_normal((n_dias, n_ativos)) * vol_idio
+    precos = rng.uniform(5, 80, n_ativos) * np.exp(np.cumsum(retornos, axis=0))
+    datas = pd.bdate_range(end=pd.Timestamp('2026-01-02'), periods=n_dias)
+    return pd.DataFrame(precos, index=datas, columns=list(tickers))
+
 def calcular_retornos(precos: pd.DataFrame) -> pd.DataFrame:
     """
     Calcula retornos logarítmicos diários.
@@ -128,35 +537,60 @@ def calcular_retornos(precos: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame com retornos logarítmicos
     """
-    retornos = np.log(precos / precos.shift(1))
-    return retornos.dropna()
+    # Calculado sobre o array: evita as cópias intermédias de shift/divisão/dropna
+    # e preserva o dtype do painel (float32 no modo compacto)
+    valores = precos.to_numpy()
+    retornos = valores[1:] / valores[:-1]
+    np.log(retornos, out=retornos)
+    linhas_validas = ~np.isnan(retornos).any(axis=1)
+    indice = precos.index[1:]
+    if not linhas_validas.all():
+        retornos, indice = retornos[linhas_validas], indice[linhas_validas]
+    return pd.DataFrame(retornos, index=indice, columns=precos.columns, copy=False)
 
-def calcular_estatisticas(retornos: pd.DataFrame) -> Tuple[pd.Series, pd.DataFrame]:
+def compactar_painel(painel: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte um painel (datas x tickers) para um único bloco float32 contíguo.
+    Metade da memória do float64; a precisão (~7 dígitos) é suficiente para preços e retornos diários.
+    """
+    valores = np.ascontiguousarray(painel.to_numpy(dtype=np.float32))
+    return pd.DataFrame(valores, index=painel.index, columns=painel.columns, copy=False)
+
+def _promover_float64(retornos: pd.DataFrame) -> pd.DataFrame:
+    """Cópia transitória em float64 para estimação (no-op se o painel já for float64)."""
+    if (retornos.dtypes == np.float64).all():
+        return retornos
+    return retornos.astype(np.float64)
+
+def calcular_estatisticas(retornos: pd.DataFrame,
+                          metodo_covariancia: str = covariance.METODO_PADRAO) -> Tuple[pd.Series, pd.DataFrame]:
     """
     Calcula retorno médio anualizado e matriz de covariância.
     
     Baseado na Teoria de Markowitz:
     - Retorno esperado: média dos retornos * 252 (dias úteis)
-    - Covariância: usando encolhimento Ledoit-Wolf para robustez * 252
+    - Covariância: estimador do registo de covariance.py (omissão: encolhimento Ledoit-Wolf) * 252
     
     Args:
         retornos: DataFrame com retornos logarítmicos
+        metodo_covariancia: Nome do estimador (ver covariance.ESTIMADORES)
         
     Returns:
         Tuple com (retornos_medios_anuais, matriz_covariancia_anual)
     """
+    # Painéis compactos (float32) são promovidos só durante a estimação
+    retornos = _promover_float64(retornos)
+    
     # 252 dias úteis por ano
     retornos_medios = retornos.mean() * 252
     
-    # Aplicação de Shrinkage (Ledoit-Wolf) na Matriz de Covariância
+    # Estimador com encolhimento (por omissão Ledoit-Wolf) na Matriz de Covariância
     # Corrige a sensibilidade ao erro de estimação da matriz amostral
+    covariance.obter_estimador(metodo_covariancia)  # Nome inválido é erro do chamador, não falha numérica
     try:
-        lw = LedoitWolf()
-        cov_estimada = lw.fit(retornos).covariance_
-        matriz_cov = pd.DataFrame(cov_estimada, index=retornos.columns, columns=retornos.columns)
+        matriz_cov = covariance.estimar_covariancia(retornos, metodo_covariancia)
     except Exception as e:
-        import logging
-        logging.warning(f"Falha ao usar Ledoit-Wolf ({e}). Usando covariância amostral.")
+        logging.warning(f"Falha ao usar estimador '{metodo_covariancia}' ({e}). Usando covariância amostral.")
         matriz_cov = retornos.cov()
         
     matriz_cov = matriz_cov * 252
@@ -177,6 +611,7 @@ def calcular_metricas_ativo(retornos: pd.DataFrame, taxa_livre_risco: float = No
     if taxa_livre_risco is None:
         taxa_livre_risco = risk_profiles.TAXA_SELIC
         
+    retornos = _promover_float64(retornos)
     retornos_anuais = retornos.mean() * 252
     volatilidade_anual = retornos.std() * np.sqrt(252)
     sharpe = (retornos_anuais - taxa_livre_risco) / volatilidade_anual
@@ -189,30 +624,58 @@ def calcular_metricas_ativo(retornos: pd.DataFrame, taxa_livre_risco: float = No
     
     return metricas.sort_values('Sharpe', ascending=False)
 
-def carregar_dados_completos(tickers: List[str], anos: int = ANOS_HISTORICO) -> Optional[dict]:
+def carregar_dados_completos(tickers: List[str], anos: int = ANOS_HISTORICO,
+                             compacto: bool = False,
+                             metodo_covariancia: str = covariance.METODO_PADRAO) -> Optional[dict]:
     """
     Pipeline completo de carregamento e processamento de dados.
     
     Args:
         tickers: Lista de tickers para análise
         anos: Quantidade de anos de histórico
+        compacto: Se True, preços e retornos ficam em float32 contíguo (metade da memória)
+        metodo_covariancia: Estimador da covariância (ver covariance.ESTIMADORES)
         
     Returns:
         Dict com todos os dados processados ou None se erro
     """
-    with st.spinner('📊 Baixando dados históricos...'):
+    with spinner('📊 Baixando dados históricos...'), etapa("download"):
         precos = baixar_dados_historicos(tickers, anos)
         
     if precos.empty:
         return None
     
+    return processar_precos(precos, compacto=compacto, metodo_covariancia=metodo_covariancia)
+
+def processar_precos(precos: pd.DataFrame, compacto: bool = False,
+                     metodo_covariancia: str = covariance.METODO_PADRAO) -> dict:
+    """
+    Calcula retornos, estatísticas e métricas a partir de um painel de preços já obtido.
+    Usado por carregar_dados_completos e por provedores de dados alternativos (ex.: sintético).
+    
+    Args:
+        precos: DataFrame com preços de fechamento (datas x tickers)
+        compacto: Armazena preços e retornos em float32 (estatísticas e solvers continuam em float64)
+        metodo_covariancia: Estimador da covariância (ver covariance.ESTIMADORES)
+        
+    Returns:
+        Dict no mesmo formato de carregar_dados_completos
+    """
     # Atualiza lista de tickers válidos (alguns podem ter sido removidos)
     tickers_validos = precos.columns.tolist()
     
-    with st.spinner('📈 Calculando retornos e estatísticas...'):
-        retornos = calcular_retornos(precos)
-        retornos_medios, matriz_cov = calcular_estatisticas(retornos)
-        metricas = calcular_metricas_ativo(retornos)
+    if compacto:
+        # O objeto em cache (float64) não é alterado: a sessão guarda apenas a versão compacta
+        with etapa("compactar"):
+            precos = compactar_painel(precos)
+    
+    with spinner('📈 Calculando retornos e estatísticas...'):
+        with etapa("retornos"):
+            retornos = calcular_retornos(precos)
+        with etapa("estatisticas"):
+            retornos_medios, matriz_cov = calcular_estatisticas(retornos, metodo_covariancia)
+        with etapa("metricas_ativos"):
+            metricas = calcular_metricas_ativo(retornos)
     
     # Cálculo de período em diferentes unidades
     n_dias = len(retornos)
@@ -231,5 +694,168 @@ def carregar_dados_completos(tickers: List[str], anos: int = ANOS_HISTORICO) ->
         'periodo_fim': precos.index[-1].strftime('%m/%Y'),
         'n_observacoes': n_dias,
         'n_meses': n_meses,
-        'n_anos': n_anos
+        'n_anos': n_anos,
+        'compacto': compacto,
+        'metodo_covariancia': metodo_covariancia
     }
+
+# ============== UNIVERSO GLOBAL (SUBCONJUNTOS POR FATIAMENTO) ==============
+
+TTL_UNIVERSO = TTL_PRECOS_TICKER   # Validade do universo processado (segundos)
+MAX_UNIVERSOS = 4                  # Combinações (anos, compacto, estimador) mantidas em memória
+
+_universos: "OrderedDict[tuple, Tuple[float, dict]]" = OrderedDict()
+_lock_universos = threading.Lock()
+_locks_carga: Dict[tuple, threading.Lock] = {}
+
+
+def obter_universo_global(anos: int = ANOS_HISTORICO, compacto: bool = False,
+                          metodo_covariancia: str = covariance.METODO_PADRAO) -> Optional[dict]:
+    """
+    Dados processados de todo o universo (assets.get_all_tickers()), calculados uma vez
+    por (anos, compacto, estimador) e partilhados pelo processo (todas as sessões).
+    
+    O objeto devolvido é partilhado: use fatiar_universo em vez de o alterar.
+    """
+    chave = (anos, compacto, metodo_covariancia)
+    with _lock_universos:
+        entrada = _universos.get(chave)
+        if entrada is not None and time.time() - entrada[0] < TTL_UNIVERSO:
+            _universos.move_to_end(chave)
+            return entrada[1]
+        lock_carga = _locks_carga.setdefault(chave, threading.Lock())
+    
+    # Um único carregamento por chave: as outras sessões esperam e usam o resultado
+    with lock_carga:
+        with _lock_universos:
+            entrada = _universos.get(chave)
+            if entrada is not None and time.time() - entrada[0] < TTL_UNIVERSO:
+                return entrada[1]
+        universo = carregar_dados_completos(get_all_tickers(), anos, compacto=compacto,
+                                            metodo_covariancia=metodo_covariancia)
+        if universo is None:
+            return None
+        with _lock_universos:
+            _universos[chave] = (time.time(), universo)
+            _universos.move_to_end(chave)
+            while len(_universos) > MAX_UNIVERSOS:
+                _universos.popitem(last=False)
+    return universo
+
+
+def limpar_universo_global() -> None:
+    """Descarta os universos em memória (o próximo pedido volta a processar os preços)."""
+    with _lock_universos:
+        _universos.clear()
+
+
+def fatiar_universo(universo: dict, tickers: List[str]) -> Optional[dict]:
+    """
+    Subconjunto do universo por indexação: colunas de preços/retornos, entradas de μ
+    e o bloco Σ[np.ix_(idx, idx)] da covariância, sem novo download nem nova estimação.
+    
+    Com o estimador amostral o resultado coincide com processar só esses tickers. Nos
+    estimadores com encolhimento a intensidade e o alvo são os estimados no universo
+    completo (mais observações por parâmetro), pelo que Σ difere ligeiramente da
+    estimada só no subconjunto. As datas são as do painel do universo.
+    
+    Args:
+        universo: Dict de obter_universo_global (ou processar_precos)
+        tickers: Tickers pedidos; os que não têm dados no universo são ignorados
+        
+    Returns:
+        Dict no mesmo formato de carregar_dados_completos, ou None se nenhum ticker tiver dados
+    """
+    with etapa("fatiar_universo"):
+        colunas = pd.Index(universo['tickers'])
+        posicoes = np.unique(colunas.get_indexer(tickers))
+        posicoes = posicoes[posicoes >= 0]
+        if len(posicoes) == 0:
+            return None
+        selecionados = colunas[posicoes]
+        
+        cov = universo['matriz_cov'].to_numpy()[np.ix_(posicoes, posicoes)]
+        metricas = universo['metricas']
+        dados = dict(universo)
+        dados.update({
+            'precos': universo['precos'].iloc[:, posicoes],
+            'retornos': universo['retornos'].iloc[:, posicoes],
+            'retornos_medios': universo['retornos_medios'].iloc[posicoes],
+            'matriz_cov': pd.DataFrame(cov, index=selecionados, columns=selecionados),
+            'metricas': metricas[metricas.index.isin(selecionados)],   # Mantém a ordenação por Sharpe
+            'tickers': selecionados.tolist(),
+            'n_ativos': len(selecionados),
+        })
+    return dados
+
+
+def carregar_dados_universo(tickers: List[str], anos: int = ANOS_HISTORICO,
+                            compacto: bool = False,
+                            metodo_covariancia: str = covariance.METODO_PADRAO) -> Optional[dict]:
+    """
+    Como carregar_dados_completos, mas servindo o pedido a partir do universo global:
+    mudar o filtro de setores ou alternar entre top 75 e todos os ativos é só uma
+    fatia (milissegundos). Tickers fora de assets.get_all_tickers() usam o caminho completo.
+    """
+    if not set(tickers) <= set(get_all_tickers()):
+        return carregar_dados_completos(tickers, anos, compacto=compacto, metodo_covariancia=metodo_covariancia)
+    universo = obter_universo_global(anos, compacto, metodo_covariancia)
+    if universo is None:
+        return None
+    return fatiar_universo(universo, tickers)
+
+
+def relatorio_precisao_compacta(precos: pd.DataFrame, perfil: str = 'Moderado',
+                                taxa_livre_risco: float = None, peso_maximo: float = 0.20,
+                                n_ativos_max: Optional[int] = None) -> pd.DataFrame:
+    """
+    Compara o modo compacto (float32) com o caminho float64 para o mesmo painel de preços.
+    
+    Reporta a memória de preços+retornos e as diferenças nas estatísticas, nos pesos
+    ótimos do perfil e nas métricas da carteira.
+    
+    Returns:
+        DataFrame indexado pela métrica, com colunas 'float64', 'float32' e 'diferenca'
+    """
+    import optimizer  # Import local: data_loader não depende do solver
+    
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+    
+    completo = processar_precos(precos)
+    compacto = processar_precos(precos, compacto=True)
+    
+    def _memoria(d):
+        return int(d['precos'].memory_usage(index=False).sum() + d['retornos'].memory_usage(index=False).sum())
+    
+    def _otimizar(d):
+        return optimizer.otimizar_por_perfil(
+            perfil=perfil, retornos_medios=d['retornos_medios'], matriz_cov=d['matriz_cov'],
+            taxa_livre_risco=taxa_livre_risco, peso_maximo=peso_maximo, n_ativos_max=n_ativos_max
+        )
+    
+    res64, res32 = _otimizar(completo), _otimizar(compacto)
+    pesos64 = pd.Series(res64.pesos, index=res64.tickers)
+    pesos32 = pd.Series(res32.pesos, index=res32.tickers).reindex(pesos64.index, fill_value=0.0)
+    
+    linhas = {
+        'Memória preços+retornos (MB)': (_memoria(completo) / 1024 ** 2, _memoria(compacto) / 1024 ** 2),
+        'Retorno esperado': (res64.retorno_esperado, res32.retorno_esperado),
+        'Volatilidade': (res64.volatilidade, res32.volatilidade),
+        'Sharpe': (res64.sharpe, res32.sharpe),
+        'Ativos na carteira': ((pesos64 > 0.001).sum(), (pesos32 > 0.001).sum()),
+    }
+    relatorio = pd.DataFrame(linhas, index=['float64', 'float32']).T.astype(float)
+    relatorio['diferenca'] = relatorio['float32'] - relatorio['float64']
+    
+    # Desvios máximos absolutos (sem valor de referência por coluna)
+    desvios = {
+        'Máx |Δ peso|': np.abs(pesos32 - pesos64).max(),
+        'Máx |Δ retorno médio|': np.abs(compacto['retornos_medios'] - completo['retornos_medios']).max(),
+        'Máx |Δ covariância|': np.abs(compacto['matriz_cov'] - completo['matriz_cov']).to_numpy().max(),
+        'Máx |Δ preço| relativo': np.abs(compacto['precos'].to_numpy(np.float64) / completo['precos'].to_numpy() - 1).max(),
+    }
+    for nome, valor in desvios.items():
+        relatorio.loc[nome] = [np.nan, np.nan, float(valor)]
+    
+    return relatorio
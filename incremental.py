@@ -0,0 +1,308 @@
+"""
+incremental.py - Atualização incremental de fim de dia (EOD)
+TCC: Otimização de Carteiras de Investimentos
+
+Quando chega um novo pregão, o pipeline completo recalcula retornos, estatísticas,
+métricas, otimização e backtest sobre todo o histórico. Este módulo mantém os
+momentos dos retornos como somas aditivas (e subtraíveis, para a janela móvel),
+pelo que cada novo dia custa O(n_ativos²) em vez de O(histórico):
+- Retornos logarítmicos num buffer circular
+- Média, covariância amostral e Ledoit-Wolf exatos a partir das somas
+- Extensão da curva de capital em um passo
+- Re-otimização apenas quando as estatísticas se afastam além de uma tolerância
+"""
+
+import numpy as np
+import pandas as pd
+import logging
+from typing import Optional, Dict
+import risk_profiles
+import optimizer
+import data_loader
+import backtesting
+
+logger = logging.getLogger(__name__)
+
+
+class MomentosIncrementais:
+    """
+    Somas de potências dos retornos que permitem recuperar exatamente a média,
+    a covariância amostral e o estimador de Ledoit-Wolf (idêntico ao sklearn)
+    sem revisitar o histórico.
+
+    Guarda apenas Σx, Σxx' e, para o Ledoit-Wolf, Σ||x||²x e Σ||x||⁴: a expansão
+    algébrica da centragem torna todas as quantidades aditivas e subtraíveis.
+    """
+
+    def __init__(self, n_ativos: int, incluir_quarto_momento: bool = True):
+        self.n_ativos = n_ativos
+        self.incluir_quarto_momento = incluir_quarto_momento
+        self.n = 0
+        self.s1 = np.zeros(n_ativos)
+        self.s11 = np.zeros((n_ativos, n_ativos))
+        self.s_norma2_x = np.zeros(n_ativos)  # Σ_t ||x_t||² x_t
+        self.s_norma4 = 0.0                   # Σ_t ||x_t||⁴
+
+    @classmethod
+    def de_retornos(cls, retornos: np.ndarray, incluir_quarto_momento: bool = True) -> "MomentosIncrementais":
+        """Inicializa as somas a partir de uma matriz (T × n) de retornos."""
+        retornos = np.atleast_2d(np.asarray(retornos, dtype=float))
+        momentos = cls(retornos.shape[1], incluir_quarto_momento)
+        momentos.adicionar(retornos)
+        return momentos
+
+    def _acumular(self, x: np.ndarray, sinal: float) -> None:
+        X = np.atleast_2d(np.asarray(x, dtype=float))
+        self.n += int(sinal) * X.shape[0]
+        self.s1 += sinal * X.sum(axis=0)
+        self.s11 += sinal * (X.T @ X)
+        if self.incluir_quarto_momento:
+            normas2 = np.einsum('ij,ij->i', X, X)
+            self.s_norma2_x += sinal * (normas2 @ X)
+            self.s_norma4 += sinal * float(normas2 @ normas2)
+
+    def adicionar(self, x: np.ndarray) -> None:
+        """Acrescenta uma observação (n,) ou um bloco (T × n) de observações."""
+        self._acumular(x, 1.0)
+
+    def remover(self, x: np.ndarray) -> None:
+        """Retira observações previamente adicionadas (janela móvel)."""
+        self._acumular(x, -1.0)
+
+    def media(self) -> np.ndarray:
+        return self.s1 / self.n
+
+    def _produto_centrado(self) -> np.ndarray:
+        """C = Σ (x - m)(x - m)' = Σxx' - n·m·m'"""
+        m = self.media()
+        return self.s11 - self.n * np.outer(m, m)
+
+    def covariancia_amostral(self) -> np.ndarray:
+        """Covariância amostral não enviesada (ddof=1), como DataFrame.cov()."""
+        return self._produto_centrado() / (self.n - 1)
+
+    def desvio_padrao(self) -> np.ndarray:
+        """Desvio padrão amostral (ddof=1) de cada ativo."""
+        return np.sqrt(np.maximum(np.diag(self.covariancia_amostral()), 0.0))
+
+    def covariancia_ledoit_wolf(self) -> np.ndarray:
+        """
+        Covariância encolhida de Ledoit-Wolf (alvo de variância constante), com a
+        mesma fórmula de sklearn.covariance.ledoit_wolf_shrinkage.
+
+        O termo de quarto momento Σ_t (Σ_i (x_ti - m_i)²)² é obtido expandindo
+        ||x_t - m||² = ||x_t||² - 2m·x_t + ||m||² sobre as somas guardadas.
+        """
+        if not self.incluir_quarto_momento:
+            raise ValueError("Ledoit-Wolf incremental requer incluir_quarto_momento=True.")
+
+        n, p = self.n, self.n_ativos
+        m = self.media()
+        C = self._produto_centrado()
+        emp_cov = C / n
+        traco_por_ativo = np.diag(emp_cov)
+        mu = traco_por_ativo.sum() / p
+
+        c = float(m @ m)
+        soma_u = float(np.trace(self.s11))
+        soma_v = float(m @ self.s1)
+        soma_uv = float(m @ self.s_norma2_x)
+        soma_v2 = float(m @ self.s11 @ m)
+        beta_ = (self.s_norma4 - 4 * soma_uv + 4 * soma_v2
+                 + 2 * c * soma_u - 4 * c * soma_v + n * c ** 2)
+
+        delta_ = np.sum(C ** 2) / n ** 2
+        beta = (beta_ / n - delta_) / (p * n)
+        delta = (delta_ - 2.0 * mu * traco_por_ativo.sum() + p * mu ** 2) / p
+        beta = min(beta, delta)
+        encolhimento = 0.0 if beta == 0 else beta / delta
+
+        cov = (1.0 - encolhimento) * emp_cov
+        cov[np.diag_indices(p)] += encolhimento * mu
+        return cov
+
+
+class AtualizadorIncremental:
+    """
+    Pipeline de fim de dia em modo incremental.
+
+    Inicializa com o histórico completo (uma única vez) e depois recebe um pregão
+    de cada vez em `atualizar`. A curva de capital acompanha a carteira em produção:
+    as posições derivam com o mercado e, a cada `janela_rebalanceamento` pregões,
+    são rebalanceadas para os pesos ótimos mais recentes.
+
+    Args:
+        precos: DataFrame com preços de fechamento (histórico inicial)
+        perfil: Perfil de risco usado na otimização
+        tolerancia: Variação relativa de μ ou Σ (norma de Frobenius) que dispara a re-otimização
+        janela_movel: Se True mantém o tamanho da janela inicial (descarta o dia mais antigo)
+    """
+
+    def __init__(self, precos: pd.DataFrame, perfil: str = "Moderado",
+                 taxa_livre_risco: float = None, peso_maximo: float = 0.20,
+                 n_ativos_max: Optional[int] = None, tolerancia: float = 0.05,
+                 janela_movel: bool = True, capital_inicial: float = 100000,
+                 janela_rebalanceamento: int = 63):
+        if taxa_livre_risco is None:
+            taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+        self.tickers = precos.columns.tolist()
+        self.perfil = perfil
+        self.taxa_livre_risco = taxa_livre_risco
+        self.peso_maximo = peso_maximo
+        self.n_ativos_max = n_ativos_max
+        self.tolerancia = tolerancia
+        self.janela_movel = janela_movel
+        self.janela_rebalanceamento = janela_rebalanceamento
+
+        retornos = data_loader.calcular_retornos(precos)
+        # Buffer circular dos retornos (a posição mais antiga é self._inicio). Com a
+        # janela expansível só as primeiras self._n linhas são válidas e a capacidade
+        # dobra quando se esgota.
+        self._buffer = np.array(retornos.values, dtype=float)
+        self._n = len(self._buffer)
+        self._datas = list(retornos.index)
+        self._inicio = 0
+        self._ultimo_preco = np.array(precos.iloc[-1].values, dtype=float)
+
+        self.momentos = MomentosIncrementais.de_retornos(self._buffer)
+        self.n_reotimizacoes = 0
+        self._otimizar()
+
+        # Curva de capital inicial (uma única passagem completa)
+        bt = backtesting.backtesting_pesos_fixos(
+            precos=precos, pesos=dict(zip(self.tickers, self.resultado.pesos)),
+            janela_rebalanceamento=janela_rebalanceamento, capital_inicial=capital_inicial,
+            taxa_livre_risco=taxa_livre_risco
+        )
+        self._valores = list(bt['serie_carteira'].values)
+        self._datas_carteira = list(bt['serie_carteira'].index)
+        self._pico = float(np.max(self._valores))
+        self.max_drawdown = float(bt['max_drawdown'])
+
+        # Posições atuais: pesos do último rebalanceamento derivados até hoje
+        self._dias_desde_rebalanceamento = len(retornos) % janela_rebalanceamento
+        idx_rebal = len(precos) - 1 - self._dias_desde_rebalanceamento
+        crescimento = self._ultimo_preco / np.array(precos.iloc[idx_rebal].values, dtype=float)
+        posicoes = self.resultado.pesos * crescimento
+        self._posicoes = posicoes / posicoes.sum() * self._valores[-1] if posicoes.sum() > 0 else posicoes
+
+    # ---------- Estatísticas correntes ----------
+
+    @property
+    def retornos_medios(self) -> pd.Series:
+        return pd.Series(self.momentos.media() * 252, index=self.tickers)
+
+    @property
+    def matriz_cov(self) -> pd.DataFrame:
+        try:
+            cov = self.momentos.covariancia_ledoit_wolf()
+        except Exception as e:
+            logger.warning(f"Falha ao usar Ledoit-Wolf incremental ({e}). Usando covariância amostral.")
+            cov = self.momentos.covariancia_amostral()
+        return pd.DataFrame(cov * 252, index=self.tickers, columns=self.tickers)
+
+    @property
+    def metricas(self) -> pd.DataFrame:
+        """Equivalente a data_loader.calcular_metricas_ativo, calculado a partir dos momentos."""
+        retornos_anuais = self.retornos_medios
+        volatilidade_anual = pd.Series(self.momentos.desvio_padrao() * np.sqrt(252), index=self.tickers)
+        sharpe = (retornos_anuais - self.taxa_livre_risco) / volatilidade_anual
+        metricas = pd.DataFrame({
+            'Retorno Anual (%)': (retornos_anuais * 100).round(2),
+            'Volatilidade (%)': (volatilidade_anual * 100).round(2),
+            'Sharpe': sharpe.round(3)
+        })
+        return metricas.sort_values('Sharpe', ascending=False)
+
+    @property
+    def retornos(self) -> pd.DataFrame:
+        """Matriz de retornos corrente em ordem cronológica (materializada sob pedido)."""
+        ordem = np.r_[self._inicio:self._n, 0:self._inicio]
+        return pd.DataFrame(self._buffer[ordem], index=[self._datas[i] for i in ordem], columns=self.tickers)
+
+    @property
+    def serie_carteira(self) -> pd.Series:
+        return pd.Series(self._valores, index=self._datas_carteira)
+
+    # ---------- Passos do pipeline ----------
+
+    def _otimizar(self) -> None:
+        mu, cov = self.retornos_medios, self.matriz_cov
+        self.resultado = optimizer.otimizar_por_perfil(
+            perfil=self.perfil, retornos_medios=mu, matriz_cov=cov,
+            taxa_livre_risco=self.taxa_livre_risco, peso_maximo=self.peso_maximo,
+            n_ativos_max=self.n_ativos_max
+        )
+        self._mu_ref = mu.values.copy()
+        self._cov_ref = cov.values.copy()
+        self.n_reotimizacoes += 1
+
+    def variacao_estatisticas(self) -> float:
+        """Maior variação relativa de μ e Σ desde a última otimização."""
+        mu, cov = self.retornos_medios.values, self.matriz_cov.values
+        var_mu = np.linalg.norm(mu - self._mu_ref) / max(np.linalg.norm(self._mu_ref), 1e-12)
+        var_cov = np.linalg.norm(cov - self._cov_ref) / max(np.linalg.norm(self._cov_ref), 1e-12)
+        return float(max(var_mu, var_cov))
+
+    def atualizar(self, data, precos_dia: pd.Series) -> Dict:
+        """
+        Incorpora um novo pregão.
+
+        Args:
+            data: Data do pregão
+            precos_dia: Preços de fechamento do dia (ativos ausentes repetem o último preço)
+
+        Returns:
+            Dict com a data, o valor da carteira, a variação das estatísticas e se houve re-otimização
+        """
+        novo_preco = np.array(precos_dia.reindex(self.tickers).values, dtype=float)
+        novo_preco = np.where(np.isnan(novo_preco) | (novo_preco <= 0), self._ultimo_preco, novo_preco)
+
+        # 1. Retorno logarítmico do dia e atualização dos momentos
+        r = np.log(novo_preco / self._ultimo_preco)
+        if self.janela_movel:
+            self.momentos.remover(self._buffer[self._inicio])
+            self._buffer[self._inicio] = r
+            self._datas[self._inicio] = data
+            self._inicio = (self._inicio + 1) % self._n
+        else:
+            if self._n == len(self._buffer):
+                novo = np.empty((max(2 * self._n, 1), self._buffer.shape[1]))
+                novo[:self._n] = self._buffer
+                self._buffer = novo
+            self._buffer[self._n] = r
+            self._n += 1
+            self._datas.append(data)
+        self.momentos.adicionar(r)
+
+        # 2. Um passo da curva de capital (retornos simples, com drift das posições)
+        retorno_simples = novo_preco / self._ultimo_preco - 1
+        self._posicoes = self._posicoes * (1 + retorno_simples)
+        valor = float(self._posicoes.sum())
+        self._valores.append(valor)
+        self._datas_carteira.append(data)
+        self._pico = max(self._pico, valor)
+        self.max_drawdown = min(self.max_drawdown, (valor - self._pico) / self._pico)
+        self._ultimo_preco = novo_preco
+
+        # 3. Re-otimiza apenas se as estatísticas se moveram além da tolerância
+        variacao = self.variacao_estatisticas()
+        reotimizado = variacao > self.tolerancia
+        if reotimizado:
+            logger.info(f"Estatísticas variaram {variacao:.2%} (> {self.tolerancia:.2%}). Re-otimizando.")
+            self._otimizar()
+
+        # 4. Rebalanceamento periódico para os pesos ótimos correntes
+        self._dias_desde_rebalanceamento += 1
+        if self._dias_desde_rebalanceamento >= self.janela_rebalanceamento:
+            self._posicoes = self.resultado.pesos * valor
+            self._dias_desde_rebalanceamento = 0
+
+        return {
+            'data': data,
+            'valor_carteira': valor,
+            'variacao_estatisticas': variacao,
+            'reotimizado': reotimizado,
+            'resultado': self.resultado
+        }
@@ -0,0 +1,340 @@
+"""
+intraday.py - Barras intradiárias fora da memória (memory-mapped)
+TCC: Otimização de Carteiras de Investimentos
+
+Cinco anos de barras de um minuto dos 195 ativos são cerca de 100 milhões de linhas:
+não cabem num painel pandas como os do data_loader. Aqui cada ticker tem uma pasta
+com um ficheiro binário por coluna (timestamp + OHLCV), lido com np.memmap, e tudo o
+que o otimizador e os backtests precisam sai de leituras em blocos:
+- fechos_reamostrados / precos_reamostrados: último fecho por hora, dia ou semana
+- iterar_retornos: retornos logarítmicos por período, em blocos de tempo
+- estatisticas_intraday: média e covariância (amostral ou Ledoit-Wolf) acumuladas bloco a
+  bloco em MomentosIncrementais, com a saída de data_loader.calcular_estatisticas
+
+Em memória fica apenas um bloco de barras de cada vez e os resultados já reamostrados.
+"""
+
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache import DIRETORIO_PADRAO
+from incremental import MomentosIncrementais
+from profiling import ModuloPreguicoso
+
+yf = ModuloPreguicoso("yfinance")
+
+logger = logging.getLogger(__name__)
+
+NS = 1_000_000_000
+COLUNAS = {"timestamp": np.int64, "abertura": np.float64, "maxima": np.float64,
+           "minima": np.float64, "fechamento": np.float64, "volume": np.float64}
+NOMES_YFINANCE = {"Open": "abertura", "High": "maxima", "Low": "minima", "Close": "fechamento", "Volume": "volume"}
+FUSO_B3 = "America/Sao_Paulo"
+
+# Frequências de reamostragem: duração do período (s) e períodos por ano para anualizar
+FREQUENCIAS = {"h": 3600, "D": 86400, "W": 7 * 86400}
+PERIODOS_POR_ANO = {"h": 252 * 7, "D": 252, "W": 52}   # Pregão regular da B3: 10h-17h
+# 01/01/1970 foi uma quinta-feira: deslocar dois dias alinha as semanas de sábado a sexta (W-FRI)
+_DESLOCAMENTO_SEMANA = 2 * 86400 * NS
+ESTIMADORES_INCREMENTAIS = ("amostral", "ledoit_wolf")
+
+
+# ============== ARMAZÉM EM DISCO ==============
+
+class ArmazemIntraday:
+    """
+    Barras intradiárias em disco: <diretorio>/<ticker>/<coluna>.bin (arrays contíguos, sem
+    cabeçalho) e meta.json com o número de barras válidas. As leituras são np.memmap, pelo
+    que só as páginas tocadas são carregadas.
+
+    Cada gravação acrescenta apenas barras posteriores à última guardada. O meta.json é
+    escrito por último (ficheiro temporário + rename): bytes de uma gravação interrompida
+    ficam fora do tamanho registado e são descartados na gravação seguinte.
+
+    Args:
+        diretorio: Pasta do armazém (omissão: <CACHE_DIR>/intraday)
+        buscar: Função (tickers, intervalo, periodo) -> {ticker: barras} usada por atualizar
+                (omissão: baixar_barras_yfinance)
+    """
+
+    def __init__(self, diretorio: Optional[Path] = None, buscar: Optional[Callable] = None):
+        base = Path(os.environ.get("CACHE_DIR", DIRETORIO_PADRAO))
+        self.diretorio = Path(diretorio) if diretorio else base / "intraday"
+        self.buscar = buscar or baixar_barras_yfinance
+        self._lock = threading.Lock()
+
+    def _pasta(self, ticker: str) -> Path:
+        return self.diretorio / ticker
+
+    def n_barras(self, ticker: str) -> int:
+        try:
+            with open(self._pasta(ticker) / "meta.json", encoding="utf-8") as f:
+                return int(json.load(f)["n"])
+        except (FileNotFoundError, KeyError, ValueError):
+            return 0
+
+    def tickers(self) -> List[str]:
+        if not self.diretorio.exists():
+            return []
+        return sorted(p.name for p in self.diretorio.iterdir() if (p / "meta.json").exists())
+
+    def coluna(self, ticker: str, nome: str) -> np.ndarray:
+        """Coluna completa de um ticker como np.memmap só de leitura (array vazio sem dados)."""
+        n = self.n_barras(ticker)
+        if n == 0:
+            return np.empty(0, dtype=COLUNAS[nome])
+        return np.memmap(self._pasta(ticker) / f"{nome}.bin", dtype=COLUNAS[nome], mode="r", shape=(n,))
+
+    def intervalo(self, ticker: str) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """Primeira e última barra guardadas (None sem dados)."""
+        ts = self.coluna(ticker, "timestamp")
+        if len(ts) == 0:
+            return None, None
+        return pd.Timestamp(int(ts[0])), pd.Timestamp(int(ts[-1]))
+
+    def posicoes(self, ticker: str, inicio_ns: Optional[int] = None, fim_ns: Optional[int] = None) -> Tuple[int, int]:
+        """Índices [i0, i1) das barras com inicio_ns <= timestamp < fim_ns (pesquisa binária no memmap)."""
+        ts = self.coluna(ticker, "timestamp")
+        i0 = 0 if inicio_ns is None else int(np.searchsorted(ts, inicio_ns, side="left"))
+        i1 = len(ts) if fim_ns is None else int(np.searchsorted(ts, fim_ns, side="left"))
+        return i0, max(i0, i1)
+
+    def ler(self, ticker: str, inicio=None, fim=None) -> pd.DataFrame:
+        """Barras de [inicio, fim) como DataFrame; para intervalos curtos."""
+        i0, i1 = self.posicoes(ticker, _ns(inicio), _ns(fim))
+        ts = self.coluna(ticker, "timestamp")
+        return pd.DataFrame({nome: np.array(self.coluna(ticker, nome)[i0:i1]) for nome in COLUNAS if nome != "timestamp"},
+                            index=pd.DatetimeIndex(np.array(ts[i0:i1]).astype("datetime64[ns]"), name="timestamp"))
+
+    def gravar(self, ticker: str, barras: pd.DataFrame) -> int:
+        """
+        Acrescenta barras (índice de datas, colunas OHLCV em português ou com os nomes do
+        yfinance). Datas com fuso são convertidas para a hora local da B3. Barras sem fecho
+        ou não posteriores à última guardada são ignoradas. Devolve o número gravado.
+        """
+        barras = _normalizar_barras(barras)
+        with self._lock:
+            pasta = self._pasta(ticker)
+            n = self.n_barras(ticker)
+            if n:
+                barras = barras[barras.index.asi8 > int(self.coluna(ticker, "timestamp")[-1])]
+            if barras.empty:
+                return 0
+
+            pasta.mkdir(parents=True, exist_ok=True)
+            for nome, dtype in COLUNAS.items():
+                valores = barras.index.asi8 if nome == "timestamp" else barras[nome].to_numpy()
+                caminho = pasta / f"{nome}.bin"
+                with open(caminho, "ab") as f:
+                    f.truncate(n * np.dtype(dtype).itemsize)   # Descarta restos de uma gravação interrompida
+                    f.write(np.ascontiguousarray(valores, dtype=dtype).tobytes())
+
+            temporario = pasta / f"meta.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump({"n": n + len(barras)}, f)
+            os.replace(temporario, pasta / "meta.json")
+        return len(barras)
+
+    def atualizar(self, tickers: List[str], intervalo: str = "1m", periodo: str = "7d") -> Dict[str, int]:
+        """
+        Descarrega as barras recentes e acrescenta as novas ao armazém. O yfinance só serve
+        7 dias de barras de 1 minuto: corrido todos os dias, o armazém acumula o histórico.
+        """
+        novas = {}
+        for ticker, barras in self.buscar(tickers, intervalo, periodo).items():
+            novas[ticker] = self.gravar(ticker, barras)
+        logger.info(f"Intraday: {sum(novas.values())} barras novas em {sum(1 for v in novas.values() if v)} ativos")
+        return novas
+
+
+def _ns(data) -> Optional[int]:
+    return None if data is None else int(pd.Timestamp(data).value)
+
+
+def _normalizar_barras(barras: pd.DataFrame) -> pd.DataFrame:
+    barras = barras.rename(columns=NOMES_YFINANCE)
+    faltam = [nome for nome in COLUNAS if nome != "timestamp" and nome not in barras.columns]
+    if faltam:
+        raise ValueError(f"Barras sem as colunas: {', '.join(faltam)}")
+    indice = pd.DatetimeIndex(barras.index)
+    if indice.tz is not None:
+        indice = indice.tz_convert(FUSO_B3).tz_localize(None)
+    barras = barras.set_axis(indice.as_unit("ns")).dropna(subset=["fechamento"]).sort_index()
+    return barras[~barras.index.duplicated(keep="last")]
+
+
+def baixar_barras_yfinance(tickers: List[str], intervalo: str = "1m", periodo: str = "7d") -> Dict[str, pd.DataFrame]:
+    """Barras intradiárias recentes do yfinance, por ticker (tickers sem dados são omitidos)."""
+    dados = yf.download(tickers, period=periodo, interval=intervalo, group_by="ticker",
+                        auto_adjust=False, progress=False, threads=False)
+    barras = {}
+    for ticker in tickers:
+        try:
+            tabela = dados[ticker] if isinstance(dados.columns, pd.MultiIndex) else dados
+        except KeyError:
+            continue
+        tabela = tabela.dropna(subset=["Close"])
+        if not tabela.empty:
+            barras[ticker] = tabela
+    return barras
+
+
+def gerar_barras_sinteticas(tickers: List[str], dias: int = 20, barras_por_dia: int = 420,
+                            inicio: str = "2024-01-02", semente: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    Barras de um minuto sintéticas e determinísticas (um fator + ruído), das 10h em diante
+    em dias úteis. Substituto local do yfinance para testes e benchmarks do armazém.
+    """
+    rng = np.random.default_rng(semente)
+    datas = pd.bdate_range(inicio, periods=dias)
+    minutos = pd.to_timedelta(np.arange(barras_por_dia), unit="min") + pd.Timedelta(hours=10)
+    indice = pd.DatetimeIndex((datas.values[:, None] + minutos.values[None, :]).ravel())
+    t = len(indice)
+    fator = rng.normal(0.0, 0.0006, t)
+    barras = {}
+    for ticker in tickers:
+        beta = rng.uniform(0.5, 1.5)
+        retornos = beta * fator + rng.normal(0.0, 0.0008, t)
+        fecho = rng.uniform(10, 100) * np.exp(np.cumsum(retornos))
+        abertura = np.concatenate([[fecho[0]], fecho[:-1]])
+        amplitude = np.abs(rng.normal(0.0, 0.0005, t)) * fecho
+        barras[ticker] = pd.DataFrame({
+            "abertura": abertura, "maxima": np.maximum(abertura, fecho) + amplitude,
+            "minima": np.minimum(abertura, fecho) - amplitude, "fechamento": fecho,
+            "volume": rng.integers(100, 10_000, t).astype(float)
+        }, index=indice)
+    return barras
+
+
+# ============== REAMOSTRAGEM EM BLOCOS ==============
+
+def _periodos(ts_ns: np.ndarray, frequencia: str) -> np.ndarray:
+    """Número do período (hora, dia ou semana sábado-sexta) de cada timestamp."""
+    if frequencia not in FREQUENCIAS:
+        raise ValueError(f"Frequência desconhecida: {frequencia}. Opções: {', '.join(FREQUENCIAS)}")
+    deslocamento = _DESLOCAMENTO_SEMANA if frequencia == "W" else 0
+    return (ts_ns - deslocamento) // (FREQUENCIAS[frequencia] * NS)
+
+
+def _rotulos(periodos: np.ndarray, frequencia: str) -> pd.DatetimeIndex:
+    """Rótulos como os do pandas: início da hora/dia; na semana, a sexta-feira (W-FRI)."""
+    passo = FREQUENCIAS[frequencia] * NS
+    if frequencia == "W":
+        inicio = periodos * passo + _DESLOCAMENTO_SEMANA + 6 * 86400 * NS
+    else:
+        inicio = periodos * passo
+    return pd.DatetimeIndex(inicio.astype("datetime64[ns]"))
+
+
+def _fechos_periodo(armazem: ArmazemIntraday, ticker: str, frequencia: str, inicio_ns: Optional[int],
+                    fim_ns: Optional[int], tamanho_bloco: int) -> pd.Series:
+    ts, fecho = armazem.coluna(ticker, "timestamp"), armazem.coluna(ticker, "fechamento")
+    i0, i1 = armazem.posicoes(ticker, inicio_ns, fim_ns)
+    periodos, fechos = [], []
+    for a in range(i0, i1, tamanho_bloco):
+        b = min(a + tamanho_bloco, i1)
+        p = _periodos(np.asarray(ts[a:b]), frequencia)
+        ultimos = np.append(np.flatnonzero(p[1:] != p[:-1]), len(p) - 1)
+        periodos.append(p[ultimos])
+        fechos.append(np.asarray(fecho[a:b])[ultimos])
+    if not periodos:
+        return pd.Series(dtype=np.float64, name=ticker, index=pd.DatetimeIndex([]))
+    p, f = np.concatenate(periodos), np.concatenate(fechos)
+    # Um período cortado entre dois blocos aparece duas vezes: fica o último fecho
+    manter = np.append(p[1:] != p[:-1], True)
+    return pd.Series(f[manter], index=_rotulos(p[manter], frequencia), name=ticker)
+
+
+def fechos_reamostrados(armazem: ArmazemIntraday, ticker: str, frequencia: str = "D",
+                        inicio=None, fim=None, tamanho_bloco: int = 1_000_000) -> pd.Series:
+    """
+    Último fecho de cada período de um ticker (como resample(frequencia).last().dropna()),
+    lendo as barras em blocos de `tamanho_bloco`, no intervalo [inicio, fim).
+    """
+    return _fechos_periodo(armazem, ticker, frequencia, _ns(inicio), _ns(fim), tamanho_bloco)
+
+
+def precos_reamostrados(armazem: ArmazemIntraday, tickers: List[str], frequencia: str = "D",
+                        inicio=None, fim=None) -> pd.DataFrame:
+    """Painel de fechos por período (ex.: diário para backtesting.py); só o resultado fica em memória."""
+    return pd.DataFrame({t: fechos_reamostrados(armazem, t, frequencia, inicio, fim) for t in tickers},
+                        columns=tickers)
+
+
+def iterar_retornos(armazem: ArmazemIntraday, tickers: List[str], frequencia: str = "D",
+                    inicio=None, fim=None, dias_bloco: int = 28) -> Iterator[pd.DataFrame]:
+    """
+    Retornos logarítmicos por período do painel de tickers em [inicio, fim), em blocos de
+    `dias_bloco` dias (múltiplo de 7, alinhados às semanas, para nenhum período ficar dividido).
+
+    Cada bloco continua do último fecho do anterior. Um ativo sem negócios num período
+    repete o fecho anterior (retorno zero); períodos em que algum ativo ainda não tem
+    cotação são descartados, como em data_loader.calcular_retornos.
+    """
+    if dias_bloco % 7:
+        raise ValueError("dias_bloco tem de ser múltiplo de 7.")
+    extremos = [armazem.intervalo(t) for t in tickers]
+    extremos = [e for e in extremos if e[0] is not None]
+    if not extremos:
+        return
+    inicio_ns = _ns(inicio) if inicio is not None else min(int(e[0].value) for e in extremos)
+    fim_ns = _ns(fim) if fim is not None else max(int(e[1].value) for e in extremos) + 1
+
+    passo = dias_bloco * 86400 * NS
+    semana = 7 * 86400 * NS
+    t0 = (inicio_ns - _DESLOCAMENTO_SEMANA) // semana * semana + _DESLOCAMENTO_SEMANA
+    ultimo = np.full(len(tickers), np.nan)
+    while t0 < fim_ns:
+        a, b = max(t0, inicio_ns), min(t0 + passo, fim_ns)
+        painel = pd.DataFrame({t: _fechos_periodo(armazem, t, frequencia, a, b, 1_000_000) for t in tickers},
+                              columns=tickers)
+        t0 += passo
+        if painel.empty:
+            continue
+        valores = pd.DataFrame(np.vstack([ultimo, painel.to_numpy(dtype=np.float64)])).ffill().to_numpy()
+        ultimo = valores[-1]
+        retornos = np.log(valores[1:] / valores[:-1])
+        validas = ~np.isnan(retornos).any(axis=1)
+        if validas.any():
+            yield pd.DataFrame(retornos[validas], index=painel.index[validas], columns=tickers)
+
+
+# ============== ESTATÍSTICAS EM BLOCOS ==============
+
+def momentos_intraday(armazem: ArmazemIntraday, tickers: List[str], frequencia: str = "D", inicio=None,
+                      fim=None, dias_bloco: int = 28, incluir_quarto_momento: bool = True) -> MomentosIncrementais:
+    """Somas de MomentosIncrementais acumuladas bloco a bloco (nunca com o painel inteiro)."""
+    momentos = MomentosIncrementais(len(tickers), incluir_quarto_momento)
+    for bloco in iterar_retornos(armazem, tickers, frequencia, inicio, fim, dias_bloco):
+        momentos.adicionar(bloco.to_numpy())
+    return momentos
+
+
+def estatisticas_intraday(armazem: ArmazemIntraday, tickers: List[str], frequencia: str = "D",
+                          inicio=None, fim=None, metodo_covariancia: str = "ledoit_wolf",
+                          dias_bloco: int = 28) -> Tuple[pd.Series, pd.DataFrame]:
+    """
+    Retorno médio e covariância anualizados (PERIODOS_POR_ANO[frequencia]) a partir das barras
+    intradiárias, no formato de data_loader.calcular_estatisticas (entrada direta do optimizer).
+    Só os estimadores exatos a partir das somas ("amostral", "ledoit_wolf") estão disponíveis.
+    """
+    if metodo_covariancia not in ESTIMADORES_INCREMENTAIS:
+        raise ValueError(f"Estimador '{metodo_covariancia}' requer o painel completo. "
+                         f"Opções em blocos: {', '.join(ESTIMADORES_INCREMENTAIS)}")
+    momentos = momentos_intraday(armazem, tickers, frequencia, inicio, fim, dias_bloco,
+                                 incluir_quarto_momento=metodo_covariancia == "ledoit_wolf")
+    if momentos.n < 2:
+        raise ValueError("Períodos insuficientes nas barras intradiárias para estimar a covariância.")
+
+    fator = PERIODOS_POR_ANO[frequencia]
+    cov = momentos.covariancia_ledoit_wolf() if metodo_covariancia == "ledoit_wolf" else momentos.covariancia_amostral()
+    logger.info(f"Estatísticas intraday ({frequencia}): {momentos.n} períodos, {len(tickers)} ativos")
+    return (pd.Series(momentos.media() * fator, index=tickers),
+            pd.DataFrame(cov * fator, index=tickers, columns=tickers))
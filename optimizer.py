@@ -3,13 +3,19 @@ optimizer.py - Motor de Otimização de Carteiras (Convexidade Estrita)
 TCC: Otimização de Carteiras de Investimentos
 """
 
+import os
 import numpy as np
 import pandas as pd
 import logging
-import cvxpy as cp
-from typing import Optional, List, Tuple
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Iterator
 from dataclasses import dataclass
 import risk_profiles
+from profiling import ModuloPreguicoso
+
+# O cvxpy (e o scipy.stats que ele carrega) custa ~1,3 s de import: só é importado na
+# primeira otimização, não no arranque do dashboard nem nos caminhos que não o usam
+cp = ModuloPreguicoso("cvxpy")
 
 # Configuração de logging para debug
 logger = logging.getLogger(__name__)
@@ -44,7 +50,103 @@ def calcular_sharpe(pesos: np.ndarray, retornos_medios: np.ndarray, matriz_cov:
     return float((ret - taxa_livre_risco) / vol) if vol > 0 else 0.0
 
 
-def _selecionar_melhores_ativos(pesos: np.ndarray, n_max: int) -> List[int]:
+# ============== AVALIAÇÃO VETORIZADA (LOTES DE CARTEIRAS) ==============
+
+@dataclass
+class AvaliacaoLote:
+    """Métricas de k carteiras avaliadas em simultâneo (uma linha por carteira)."""
+    retornos: np.ndarray           # (k,)
+    volatilidades: np.ndarray      # (k,)
+    sharpes: np.ndarray            # (k,)
+    contribuicoes_risco: Optional[np.ndarray] = None  # (k × n), soma de cada linha = σp
+
+
+def calcular_fator_cholesky(matriz_cov: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Fator triangular inferior L tal que Σ = L·L'.
+    Permite calcular σp = ||L'w|| sem formar Σ·w para cada carteira.
+    Retorna None se a matriz não for numericamente definida positiva.
+    """
+    try:
+        return np.linalg.cholesky(np.asarray(matriz_cov, dtype=float))
+    except np.linalg.LinAlgError:
+        return None
+
+
+def calcular_retornos_lote(pesos: np.ndarray, retornos_medios: np.ndarray) -> np.ndarray:
+    """E(Rp) para cada linha da matriz de pesos W (k × n): W·μ"""
+    return np.atleast_2d(pesos) @ np.asarray(retornos_medios, dtype=float)
+
+
+def calcular_volatilidades_lote(pesos: np.ndarray, matriz_cov: Optional[np.ndarray] = None,
+                                fator_cholesky: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    σp = √diag(W·Σ·W') para cada linha de W (k × n), sem loops em Python.
+    Com o fator de Cholesky pré-calculado basta uma multiplicação W·L.
+    """
+    W = np.atleast_2d(pesos)
+    if fator_cholesky is not None:
+        Y = W @ fator_cholesky
+        variancias = np.einsum('ij,ij->i', Y, Y)
+    else:
+        variancias = np.einsum('ij,ij->i', W @ np.asarray(matriz_cov, dtype=float), W)
+    # Ruído de ponto flutuante pode gerar variâncias ligeiramente negativas
+    return np.sqrt(np.maximum(variancias, 0.0))
+
+
+def calcular_sharpe_lote(pesos: np.ndarray, retornos_medios: np.ndarray, matriz_cov: Optional[np.ndarray],
+                         taxa_livre_risco: float, fator_cholesky: Optional[np.ndarray] = None) -> np.ndarray:
+    """Sharpe = (E(Rp) - Rf) / σp para cada linha de W; 0 quando σp = 0."""
+    ret = calcular_retornos_lote(pesos, retornos_medios)
+    vol = calcular_volatilidades_lote(pesos, matriz_cov, fator_cholesky)
+    return np.divide(ret - taxa_livre_risco, vol, out=np.zeros_like(ret), where=vol > 0)
+
+
+def calcular_contribuicoes_risco_lote(pesos: np.ndarray, matriz_cov: Optional[np.ndarray] = None,
+                                      fator_cholesky: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Contribuição marginal de risco de Euler: RC_i = w_i * (Σw)_i / σp.
+    Retorna matriz (k × n) cuja soma de cada linha é a volatilidade da carteira.
+    """
+    W = np.atleast_2d(pesos)
+    if fator_cholesky is not None:
+        sigma_w = (W @ fator_cholesky) @ fator_cholesky.T
+    else:
+        sigma_w = W @ np.asarray(matriz_cov, dtype=float)
+    vol = np.sqrt(np.maximum(np.einsum('ij,ij->i', W, sigma_w), 0.0))
+    rc = W * sigma_w
+    return np.divide(rc, vol[:, None], out=np.zeros_like(rc), where=vol[:, None] > 0)
+
+
+def avaliar_portfolios_lote(pesos: np.ndarray, retornos_medios: np.ndarray, matriz_cov: Optional[np.ndarray],
+                            taxa_livre_risco: float = None, fator_cholesky: Optional[np.ndarray] = None,
+                            incluir_contribuicoes: bool = False) -> AvaliacaoLote:
+    """
+    Avalia retorno, volatilidade e Sharpe de k carteiras de uma só vez.
+    Reutilizado pelas varreduras da fronteira e do Sharpe e por nuvens Monte Carlo.
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+    W = np.atleast_2d(np.asarray(pesos, dtype=float))
+    ret = calcular_retornos_lote(W, retornos_medios)
+    vol = calcular_volatilidades_lote(W, matriz_cov, fator_cholesky)
+    sharpe = np.divide(ret - taxa_livre_risco, vol, out=np.zeros_like(ret), where=vol > 0)
+    contribuicoes = calcular_contribuicoes_risco_lote(W, matriz_cov, fator_cholesky) if incluir_contribuicoes else None
+    return AvaliacaoLote(retornos=ret, volatilidades=vol, sharpes=sharpe, contribuicoes_risco=contribuicoes)
+
+
+def _montar_resultado(pesos: np.ndarray, ret_medio: np.ndarray, cov_matrix: np.ndarray, taxa_livre_risco: float,
+                      tickers: List[str], sucesso: bool, mensagem: str) -> ResultadoOtimizacao:
+    """Constrói o ResultadoOtimizacao avaliando a carteira numa única passagem vetorizada."""
+    av = avaliar_portfolios_lote(pesos, ret_medio, cov_matrix, taxa_livre_risco)
+    return ResultadoOtimizacao(
+        pesos=pesos, retorno_esperado=float(av.retornos[0]), volatilidade=float(av.volatilidades[0]),
+        sharpe=float(av.sharpes[0]), tickers=tickers, sucesso=sucesso, mensagem=mensagem
+    )
+
+
+def _selecionar_melhores_ativos(pesos: np.ndarray, n_max: int, ordenados: bool = False) -> List[int]:
     """
     OBSERVAÇÃO TÉCNICA (Heurística de Cardinalidade):
     A restrição estrita de cardinalidade transforma o QP em MIQP (Mixed-Integer QP),
@@ -52,16 +154,48 @@ def _selecionar_melhores_ativos(pesos: np.ndarray, n_max: int) -> List[int]:
     1. Resolvemos o QP relaxado.
     2. Selecionamos os 'n_max' ativos com maior alocação teórica.
     3. Resolvemos um novo QP estrito apenas para este subconjunto.
+    Com ordenados=True os índices vêm por ordem crescente: o mesmo conjunto de ativos dá
+    sempre a mesma chave no ContextoOtimizacao, independentemente da ordem dos pesos.
     """
-    return np.argsort(pesos)[::-1][:n_max].tolist()
+    indices = np.argsort(pesos)[::-1][:n_max]
+    return sorted(indices.tolist()) if ordenados else indices.tolist()
 
 
-def _resolver_problema(prob: cp.Problem, warm_start: bool = False) -> None:
+def _melhor_sharpe(candidatos: List[np.ndarray], mu: np.ndarray, cov: np.ndarray,
+                   taxa_livre_risco: float) -> Optional[np.ndarray]:
+    """Devolve o candidato de maior Sharpe, avaliando toda a varredura num só lote."""
+    if not candidatos:
+        return None
+    W = np.vstack(candidatos)
+    sharpes = calcular_sharpe_lote(W, mu, cov, taxa_livre_risco, calcular_fator_cholesky(cov))
+    return W[int(np.argmax(sharpes))].copy()
+
+
+def _resolver_problema(prob: "cp.Problem", warm_start: Optional[bool] = None,
+                       contexto: Optional["ContextoOtimizacao"] = None, **opcoes_osqp) -> None:
     """
     Orquestrador de Solvers Institucional. 
     Tenta OSQP (nativo para Quadratic Programming), faz fallback para ECOS (SOCP) 
     e finalmente SCS. Inclui controlo restrito de tolerância para alta performance.
+    Com um contexto, o solver arranca da solução anterior (salvo warm_start=False explícito)
+    e as iterações são registadas.
+    Um ProblemaOSQP vai diretamente ao OSQP; só passa pelo cvxpy se não chegar ao ótimo.
     """
+    if contexto is not None:
+        if warm_start is None:
+            warm_start = contexto.warm_start
+        try:
+            _resolver_problema(prob, warm_start, check_termination=contexto.intervalo_verificacao)
+        finally:
+            contexto.registar(prob)
+        return
+    warm_start = bool(warm_start)
+    if isinstance(prob, ProblemaOSQP):
+        prob.resolver(warm_start, **opcoes_osqp)
+        if prob.status not in ["optimal", "optimal_inaccurate"]:
+            logger.debug(f"OSQP nativo terminou com '{prob.status}', a resolver pelo cvxpy...")
+            prob.resolver_cvxpy(warm_start)
+        return
     try:
         # OSQP é o padrão ouro da indústria para problemas de Markowitz.
         # Adicionamos tolerância estrita (1e-6) para evitar loops infinitos em matrizes singulares.
@@ -70,19 +204,25 @@ def _resolver_problema(prob: cp.Problem, warm_start: bool = False) -> None:
             warm_start=warm_start, 
             eps_abs=1e-6, 
             eps_rel=1e-6, 
-            max_iter=4000
+            max_iter=4000,
+            **opcoes_osqp
         )
         if prob.status not in ["optimal", "optimal_inaccurate"]:
             raise ValueError(f"OSQP não convergiu. Status: {prob.status}")
     except Exception as e_osqp:
         logger.debug(f"OSQP falhou ({e_osqp}), a tentar ECOS...")
-        try:
-            prob.solve(solver=cp.ECOS, warm_start=warm_start)
-            if prob.status not in ["optimal", "optimal_inaccurate"]:
-                raise ValueError(f"ECOS não convergiu. Status: {prob.status}")
-        except Exception as e_ecos:
-            logger.debug(f"ECOS falhou ({e_ecos}), a tentar SCS como último recurso...")
-            prob.solve(solver=cp.SCS, warm_start=warm_start)
+        _resolver_sem_osqp(prob, warm_start)
+
+
+def _resolver_sem_osqp(prob: "cp.Problem", warm_start: bool = False) -> None:
+    """Resto da cadeia de _resolver_problema quando o OSQP falha: ECOS (SOCP) e, por fim, SCS."""
+    try:
+        prob.solve(solver=cp.ECOS, warm_start=warm_start)
+        if prob.status not in ["optimal", "optimal_inaccurate"]:
+            raise ValueError(f"ECOS não convergiu. Status: {prob.status}")
+    except Exception as e_ecos:
+        logger.debug(f"ECOS falhou ({e_ecos}), a tentar SCS como último recurso...")
+        prob.solve(solver=cp.SCS, warm_start=warm_start)
 
 
 def _preparar_matriz_covariancia(matriz_cov: pd.DataFrame) -> np.ndarray:
@@ -100,9 +240,343 @@ def _preparar_matriz_covariancia(matriz_cov: pd.DataFrame) -> np.ndarray:
     return cov_matrix
 
 
+# ============== PROBLEMAS REUTILIZÁVEIS (WARM START) ==============
+
+class ProblemaCarteira:
+    """
+    Problema convexo de carteira (simplex com teto por ativo) num dos formatos do otimizador:
+    - "min_vol": min w'Σw
+    - "max_ret": max μ'w  s.a. w'Σw <= vol_maxima²
+    - "fronteira": min w'Σw  s.a. μ'w >= alvo (alvo é um cp.Parameter)
+    - "max_mu": max μ'w (limite superior de retorno)
+
+    Sem parametrização os dados entram como constantes (quad_form). Com parametrizado=True,
+    μ e o fator L' (Σ = L·L') são cp.Parameter e o risco é ||L'w||² (forma DPP): o mesmo
+    objeto é resolvido de novo para outros dados, e o OSQP arranca do primal/dual anterior.
+    """
+
+    TIPOS = ("min_vol", "max_ret", "fronteira", "max_mu")
+
+    def __init__(self, tipo: str, mu: np.ndarray, cov: np.ndarray, peso_maximo: float,
+                 vol_maxima: Optional[float] = None, parametrizado: bool = False):
+        if tipo not in self.TIPOS:
+            raise ValueError(f"Formato de problema desconhecido: {tipo}")
+        n = len(mu)
+        self.tipo = tipo
+        self.n = n
+        self.w = cp.Variable(n)
+        self.alvo = cp.Parameter()
+        self.parametrizado = parametrizado
+
+        if parametrizado:
+            self._mu = cp.Parameter(n)
+            self._fator = cp.Parameter((n, n))
+            retorno = self._mu @ self.w
+            risco = cp.sum_squares(self._fator @ self.w)
+            self.definir_dados(mu, cov)
+        else:
+            retorno = mu.T @ self.w
+            risco = cp.quad_form(self.w, cov)
+
+        restricoes = [cp.sum(self.w) == 1, self.w >= 0, self.w <= peso_maximo]
+        if tipo == "min_vol":
+            objetivo = cp.Minimize(risco)
+        elif tipo == "max_ret":
+            objetivo = cp.Maximize(retorno)
+            restricoes.append(risco <= vol_maxima**2)
+        elif tipo == "fronteira":
+            objetivo = cp.Minimize(risco)
+            restricoes.append(retorno >= self.alvo)
+        else:
+            objetivo = cp.Maximize(retorno)
+        self.prob = cp.Problem(objetivo, restricoes)
+
+    def definir_dados(self, mu: np.ndarray, cov: np.ndarray) -> None:
+        """Atualiza μ e Σ de um problema parametrizado (a estrutura do solver é mantida)."""
+        self._mu.value = np.asarray(mu, dtype=float)
+        if self.tipo != "max_mu":
+            L = calcular_fator_cholesky(cov)
+            if L is None:
+                # Raiz simétrica via decomposição espectral (Σ semi-definida)
+                valores, vetores = np.linalg.eigh(cov)
+                L = vetores * np.sqrt(np.clip(valores, 0.0, None))
+            self._fator.value = L.T
+
+
+# ============== BACKEND OSQP NATIVO ==============
+
+class _Valor:
+    """Recipiente com `.value`, no lugar de cp.Variable / cp.Parameter no ProblemaOSQP."""
+    __slots__ = ("value",)
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+@dataclass
+class EstatisticasSolver:
+    """Subconjunto de cvxpy.SolverStats lido por ContextoOtimizacao.registar."""
+    num_iters: int
+    solve_time: float
+
+
+class ProblemaOSQP:
+    """
+    Os formatos sem restrições cónicas ("min_vol", "fronteira", "max_mu") montados diretamente
+    nas matrizes do OSQP, sem a canonicalização do cvxpy:
+
+        min ½x'Px + q'x   s.a.   l <= Ax <= u
+        P = 2Σ (triângulo superior) ou 0 em "max_mu";  q = 0 ou -μ
+        A = [1' ; I ; μ' (só "fronteira")],  l = [1 ; 0 ; alvo],  u = [1 ; teto ; +inf]
+
+    P e A têm padrão de esparsidade fixo: um novo alvo de retorno só muda l, e a fatorização
+    KKT é mantida entre pontos da fronteira. definir_dados volta a montar o solver (novo
+    escalonamento e ρ inicial; a fatorização teria de ser refeita de qualquer forma), que
+    parte da última solução (primal e dual) obtida com os dados anteriores.
+    Cada varredura da fronteira guarda as soluções por alvo, e iniciar_varredura arranca a
+    varredura seguinte (ex.: a da janela seguinte) da mais próxima.
+    Expõe a interface de ProblemaCarteira que o otimizador usa (w.value, alvo.value e
+    prob.status / value / solver_stats). Se o OSQP não chegar a uma solução ótima, o mesmo
+    problema é resolvido pelo cvxpy com os solvers seguintes da cadeia (ECOS, SCS).
+    """
+
+    TIPOS = ("min_vol", "fronteira", "max_mu")
+    STATUS = {1: "optimal", 2: "optimal_inaccurate", 3: "infeasible", 4: "infeasible_inaccurate",
+              5: "unbounded", 6: "unbounded_inaccurate", 7: "user_limit", 8: "user_limit"}
+    OPCOES = dict(verbose=False, eps_abs=1e-6, eps_rel=1e-6, max_iter=4000)   # As de _resolver_problema
+
+    def __init__(self, tipo: str, mu: np.ndarray, cov: np.ndarray, peso_maximo: float):
+        if tipo not in self.TIPOS:
+            raise ValueError(f"Formato sem backend OSQP nativo: {tipo}")
+        n = len(mu)
+        self.tipo = tipo
+        self.n = n
+        self.peso_maximo = peso_maximo
+        self.w = _Valor()
+        self.alvo = _Valor()
+        self.prob = self          # As funções de otimização resolvem `qp.prob`
+        self.status: Optional[str] = None
+        self.value: Optional[float] = None
+        self.solver_stats: Optional[EstatisticasSolver] = None
+        self._varredura: List[tuple] = []            # (alvo, x, y) da varredura em curso
+        self._varredura_anterior: List[tuple] = []
+        self._x = self._y = None                     # Última solução (ponto de partida seguinte)
+
+        # A em CSC: cada coluna j tem as linhas [orçamento, caixa j, (retorno)]
+        por_coluna = 3 if tipo == "fronteira" else 2
+        linhas_a = np.empty((n, por_coluna), dtype=np.int64)
+        linhas_a[:, 0] = 0
+        linhas_a[:, 1] = 1 + np.arange(n)
+        if tipo == "fronteira":
+            linhas_a[:, 2] = n + 1
+        self._por_coluna = por_coluna
+        self._estrutura_a = (linhas_a.ravel(), np.arange(0, n * por_coluna + 1, por_coluna))
+        self._l = np.concatenate([[1.0], np.zeros(n), [-np.inf] * (por_coluna - 2)])
+        self._u = np.concatenate([[1.0], np.full(n, peso_maximo), [np.inf] * (por_coluna - 2)])
+
+        # Triângulo superior de P em CSC, ordenado por coluna (padrão denso; os zeros ficam explícitos)
+        if tipo == "max_mu":
+            self._triu = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+            self._indptr_p = np.zeros(n + 1, dtype=np.int64)
+        else:
+            colunas, linhas = np.tril_indices(n)
+            self._triu = (linhas, colunas)
+            self._indptr_p = np.concatenate([[0], np.cumsum(np.arange(1, n + 1))])
+
+        self.definir_dados(mu, cov)
+
+    def definir_dados(self, mu: np.ndarray, cov: np.ndarray) -> None:
+        """
+        Novos μ e Σ. O solver é montado de novo: atualizar Px/Ax no mesmo solver manteria o
+        escalonamento e o ρ adaptado aos dados antigos, o que atrasava as janelas seguintes.
+        """
+        from scipy import sparse
+        import osqp
+
+        self._mu = np.asarray(mu, dtype=float)
+        self._cov = np.asarray(cov, dtype=float)
+        self._q = -self._mu if self.tipo == "max_mu" else np.zeros(self.n)
+        self._px = 2.0 * self._cov[self._triu]
+        colunas_a = [np.ones(self.n), np.ones(self.n)] + ([self._mu] if self.tipo == "fronteira" else [])
+        self._ax = np.column_stack(colunas_a).ravel()
+
+        n, por_coluna = self.n, self._por_coluna
+        P = sparse.csc_matrix((self._px, self._triu[0], self._indptr_p), shape=(n, n))
+        A = sparse.csc_matrix((self._ax, *self._estrutura_a), shape=(n + por_coluna - 1, n))
+        self._solver = osqp.OSQP()
+        self._solver.setup(P, self._q, A, self._l, self._u, polishing=True, **self.OPCOES)
+        self._polir = True
+        if self._x is not None:
+            self._solver.warm_start(x=self._x, y=self._y)
+
+    def resolver(self, warm_start: bool = False, **opcoes_osqp) -> None:
+        """Resolve com o OSQP (arrancando da solução anterior se warm_start) e preenche w/status/value."""
+        if self.tipo == "fronteira":
+            self._l[-1] = self.alvo.value
+            self._solver.update(l=self._l)
+        self._solver.update_settings(polishing=self._polir, **opcoes_osqp)
+        if not warm_start:
+            self._solver.warm_start(x=np.zeros(self.n), y=np.zeros(len(self._l)))
+        resultado = self._solver.solve(raise_error=False)
+        self._polir = False
+
+        self.status = self.STATUS.get(resultado.info.status_val, "solver_error")
+        self.solver_stats = EstatisticasSolver(int(resultado.info.iter), float(resultado.info.run_time))
+        if self.status in ("optimal", "optimal_inaccurate"):
+            self.w.value = resultado.x
+            self.value = -resultado.info.obj_val if self.tipo == "max_mu" else resultado.info.obj_val
+            self._x, self._y = resultado.x.copy(), resultado.y.copy()
+            if self.tipo == "fronteira":
+                self._varredura.append((self.alvo.value, self._x, self._y))
+        else:
+            self.w.value = self.value = None
+
+    def iniciar_varredura(self, alvo: float) -> bool:
+        """
+        Marca o início de uma varredura da fronteira cujo primeiro alvo é `alvo`: o solver
+        parte da solução (primal e dual) da varredura anterior com o alvo mais próximo.
+        Retorna False se não houver varredura anterior (o primeiro alvo deve partir do zero).
+        """
+        if self._varredura:
+            self._varredura_anterior, self._varredura = self._varredura, []
+        if not self._varredura_anterior:
+            return False
+        _, x, y = min(self._varredura_anterior, key=lambda s: abs(s[0] - alvo))
+        self._solver.warm_start(x=x, y=y)
+        return True
+
+    def resolver_cvxpy(self, warm_start: bool = False) -> None:
+        """Resolve o mesmo problema pelo cvxpy com os solvers seguintes ao OSQP e copia a solução."""
+        qp = ProblemaCarteira(self.tipo, self._mu, self._cov, self.peso_maximo)
+        qp.alvo.value = self.alvo.value
+        try:
+            _resolver_sem_osqp(qp.prob, warm_start)
+        finally:
+            self.status, self.value, self.w.value = qp.prob.status, qp.prob.value, qp.w.value
+            stats = qp.prob.solver_stats
+            if stats is not None:
+                self.solver_stats = EstatisticasSolver(int(stats.num_iters or 0), float(stats.solve_time or 0.0))
+
+
+BACKENDS_QP = ("osqp", "cvxpy")
+_backend_qp = os.environ.get("QP_BACKEND", "osqp")
+
+
+def configurar_backend_qp(backend: str = "osqp") -> None:
+    """
+    "osqp": formatos sem restrições cónicas vão diretamente ao OSQP (ProblemaOSQP), e o
+    formato "max_ret" (teto de volatilidade, cónico) continua no cvxpy;
+    "cvxpy": tudo pelo cvxpy (referência). Também via variável de ambiente QP_BACKEND.
+    """
+    global _backend_qp
+    if backend not in BACKENDS_QP:
+        raise ValueError(f"Backend de QP desconhecido: {backend}. Opções: {', '.join(BACKENDS_QP)}")
+    _backend_qp = backend
+
+
+def criar_problema(tipo: str, mu: np.ndarray, cov: np.ndarray, peso_maximo: float,
+                   vol_maxima: Optional[float] = None, parametrizado: bool = False):
+    """ProblemaOSQP quando o backend e o formato o permitem; senão ProblemaCarteira (cvxpy)."""
+    if _backend_qp == "osqp" and tipo in ProblemaOSQP.TIPOS:
+        try:
+            return ProblemaOSQP(tipo, mu, cov, peso_maximo)
+        except ImportError as e:
+            logger.warning(f"OSQP indisponível ({e}); a usar o cvxpy.")
+    return ProblemaCarteira(tipo, mu, cov, peso_maximo, vol_maxima, parametrizado)
+
+
+class ContextoOtimizacao:
+    """
+    Estado partilhado entre otimizações sucessivas com dados próximos (ex.: janelas do walk-forward).
+
+    Guarda ProblemaCarteira parametrizados por formato, etapa e dimensão; cada nova otimização
+    atualiza os parâmetros e o solver parte da solução (primal e dual) anterior.
+    Os subproblemas da 2.ª etapa (cardinalidade) são guardados por subconjunto de ativos,
+    num LRU de até max_problemas entradas: subconjuntos que se repetem (pontos vizinhos da
+    fronteira, janelas seguidas) não voltam a ser compilados.
+
+    Args:
+        warm_start: Se False, cada chamada constrói problemas novos com dados constantes
+                    (referência "a frio"), mantendo o registo de iterações para comparação
+        intervalo_verificacao: Iterações OSQP entre testes de convergência (omissão do OSQP: 25).
+                               Um intervalo curto deixa o solver parar assim que o ponto
+                               inicial herdado já está perto do ótimo
+        max_problemas: Número máximo de problemas compilados guardados
+    """
+
+    def __init__(self, warm_start: bool = True, intervalo_verificacao: int = 5, max_problemas: int = 64):
+        self.warm_start = warm_start
+        self.intervalo_verificacao = intervalo_verificacao
+        self.max_problemas = max_problemas
+        self._problemas: "OrderedDict[tuple, ProblemaCarteira]" = OrderedDict()
+        self._janela = self._contadores()
+        self.historico: List[dict] = []
+
+    @staticmethod
+    def _contadores() -> dict:
+        return {'resolucoes': 0, 'iteracoes': 0, 'tempo_solver_ms': 0.0,
+                'problemas_reaproveitados': 0, 'problemas_novos': 0}
+
+    def problema(self, tipo: str, mu: np.ndarray, cov: np.ndarray, peso_maximo: float,
+                 vol_maxima: Optional[float] = None, subconjunto: Optional[List[int]] = None) -> ProblemaCarteira:
+        """Problema do formato pedido com os dados atualizados (reaproveitado quando possível)."""
+        self._janela['problemas_novos'] += 1
+        if not self.warm_start:
+            return criar_problema(tipo, mu, cov, peso_maximo, vol_maxima)
+
+        identidade = tuple(subconjunto) if subconjunto is not None else len(mu)
+        chave = (tipo, peso_maximo, vol_maxima, identidade)
+        problema = self._problemas.get(chave)
+        if problema is not None:
+            self._problemas.move_to_end(chave)
+            problema.definir_dados(mu, cov)
+            self._janela['problemas_novos'] -= 1
+            self._janela['problemas_reaproveitados'] += 1
+            return problema
+
+        problema = criar_problema(tipo, mu, cov, peso_maximo, vol_maxima, parametrizado=True)
+        self._problemas[chave] = problema
+        while len(self._problemas) > self.max_problemas:
+            self._problemas.popitem(last=False)
+        return problema
+
+    def registar(self, prob: "cp.Problem") -> None:
+        """Acumula as estatísticas do solver da última resolução."""
+        stats = prob.solver_stats
+        self._janela['resolucoes'] += 1
+        if stats is not None:
+            self._janela['iteracoes'] += int(stats.num_iters or 0)
+            self._janela['tempo_solver_ms'] += float(stats.solve_time or 0.0) * 1000
+
+    def fechar_janela(self, **identificacao) -> dict:
+        """Fecha a janela corrente: devolve (e guarda no histórico) os contadores e reinicia-os."""
+        registo = dict(identificacao, **self._janela)
+        self.historico.append(registo)
+        self._janela = self._contadores()
+        return registo
+
+
+def _iniciar_varredura(qp, alvo: float) -> bool:
+    """
+    Ponto de partida do primeiro alvo de uma varredura (ver ProblemaOSQP.iniciar_varredura).
+    Com o cvxpy o primeiro alvo parte sempre do zero.
+    """
+    return qp.iniciar_varredura(alvo) if isinstance(qp, ProblemaOSQP) else False
+
+
+def _problema(contexto: Optional[ContextoOtimizacao], tipo: str, mu: np.ndarray, cov: np.ndarray,
+              peso_maximo: float, vol_maxima: Optional[float] = None,
+              subconjunto: Optional[List[int]] = None) -> ProblemaCarteira:
+    """Problema com dados constantes (sem contexto) ou o problema parametrizado do contexto."""
+    if contexto is None:
+        return criar_problema(tipo, mu, cov, peso_maximo, vol_maxima)
+    return contexto.problema(tipo, mu, cov, peso_maximo, vol_maxima, subconjunto)
+
+
 def otimizar_min_volatilidade(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
                               taxa_livre_risco: float = None, peso_maximo: float = 0.20,
-                              n_ativos_max: Optional[int] = None) -> ResultadoOtimizacao:
+                              n_ativos_max: Optional[int] = None,
+                              contexto: Optional[ContextoOtimizacao] = None) -> ResultadoOtimizacao:
     """Otimiza a carteira minimizando estritamente a variância."""
     if taxa_livre_risco is None:
         taxa_livre_risco = risk_profiles.TAXA_SELIC
@@ -112,12 +586,11 @@ def otimizar_min_volatilidade(retornos_medios: pd.Series, matriz_cov: pd.DataFra
     ret_medio = retornos_medios.values
     cov_matrix = _preparar_matriz_covariancia(matriz_cov)
 
-    w = cp.Variable(n)
-    risco = cp.quad_form(w, cov_matrix)
-    prob = cp.Problem(cp.Minimize(risco), [cp.sum(w) == 1, w >= 0, w <= peso_maximo])
+    qp = _problema(contexto, "min_vol", ret_medio, cov_matrix, peso_maximo)
+    w, prob = qp.w, qp.prob
     
     try:
-        _resolver_problema(prob)
+        _resolver_problema(prob, contexto=contexto)
     except Exception as e:
         return ResultadoOtimizacao(np.zeros(n), 0, 0, 0, tickers, False, f"Falha sistémica de solvers: {e}")
 
@@ -128,15 +601,14 @@ def otimizar_min_volatilidade(retornos_medios: pd.Series, matriz_cov: pd.DataFra
     
     # 2ª ETAPA: Heurística de Cardinalidade
     if n_ativos_max and n_ativos_max < n and sucesso:
-        indices_top = _selecionar_melhores_ativos(pesos, n_ativos_max)
-        n_filtrado = len(indices_top)
+        indices_top = _selecionar_melhores_ativos(pesos, n_ativos_max, contexto is not None)
         cov_filtrada = cov_matrix[np.ix_(indices_top, indices_top)]
         
-        w_filt = cp.Variable(n_filtrado)
-        prob_filt = cp.Problem(cp.Minimize(cp.quad_form(w_filt, cov_filtrada)), 
-                               [cp.sum(w_filt) == 1, w_filt >= 0, w_filt <= peso_maximo])
+        qp_filt = _problema(contexto, "min_vol", ret_medio[indices_top], cov_filtrada, peso_maximo,
+                            subconjunto=indices_top)
+        w_filt, prob_filt = qp_filt.w, qp_filt.prob
         try:
-            _resolver_problema(prob_filt)
+            _resolver_problema(prob_filt, contexto=contexto)
             sucesso_filt = prob_filt.status in ["optimal", "optimal_inaccurate"]
             
             if sucesso_filt and w_filt.value is not None:
@@ -148,27 +620,24 @@ def otimizar_min_volatilidade(retornos_medios: pd.Series, matriz_cov: pd.DataFra
                 for i, idx in enumerate(indices_top):
                     pesos_finais[idx] = pesos_limpos[i]
                 
-                return ResultadoOtimizacao(
-                    pesos=pesos_finais, retorno_esperado=calcular_retorno_portfolio(pesos_finais, ret_medio),
-                    volatilidade=calcular_volatilidade_portfolio(pesos_finais, cov_matrix),
-                    sharpe=calcular_sharpe(pesos_finais, ret_medio, cov_matrix, taxa_livre_risco),
-                    tickers=tickers, sucesso=True, mensagem="Convergência Global OSQP (2 Etapas)"
+                return _montar_resultado(
+                    pesos_finais, ret_medio, cov_matrix, taxa_livre_risco,
+                    tickers, True, "Convergência Global OSQP (2 Etapas)"
                 )
         except Exception as e:
             logger.warning(f"Filtro heurístico falhou: {e}. A retornar resultado da 1ª etapa.")
 
     msg = "Convergência Global OSQP" if sucesso else str(prob.status)
-    return ResultadoOtimizacao(
-        pesos=pesos, retorno_esperado=calcular_retorno_portfolio(pesos, ret_medio),
-        volatilidade=calcular_volatilidade_portfolio(pesos, cov_matrix),
-        sharpe=calcular_sharpe(pesos, ret_medio, cov_matrix, taxa_livre_risco),
-        tickers=tickers, sucesso=sucesso, mensagem=msg
+    return _montar_resultado(
+        pesos, ret_medio, cov_matrix, taxa_livre_risco,
+        tickers, sucesso, msg
     )
 
 
 def otimizar_max_retorno(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
                          taxa_livre_risco: float = None, peso_maximo: float = 0.20,
-                         vol_maxima: float = 0.40, n_ativos_max: Optional[int] = None) -> ResultadoOtimizacao:
+                         vol_maxima: float = 0.40, n_ativos_max: Optional[int] = None,
+                         contexto: Optional[ContextoOtimizacao] = None) -> ResultadoOtimizacao:
     """Maximiza retorno sujeito a um teto restrito de volatilidade."""
     if taxa_livre_risco is None:
         taxa_livre_risco = risk_profiles.TAXA_SELIC
@@ -178,17 +647,16 @@ def otimizar_max_retorno(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
     ret_medio = retornos_medios.values
     cov_matrix = _preparar_matriz_covariancia(matriz_cov)
 
-    w = cp.Variable(n)
-    risco = cp.quad_form(w, cov_matrix)
-    restricoes = [cp.sum(w) == 1, w >= 0, w <= peso_maximo, risco <= vol_maxima**2]
-    prob = cp.Problem(cp.Maximize(ret_medio.T @ w), restricoes)
+    qp = _problema(contexto, "max_ret", ret_medio, cov_matrix, peso_maximo, vol_maxima)
+    w, prob = qp.w, qp.prob
     
     try:
-        _resolver_problema(prob)
+        _resolver_problema(prob, contexto=contexto)
     except Exception as e:
         # Fallback de viabilidade: Se a restrição de volatilidade for excessivamente baixa
         logger.warning(f"Otimização max_retorno inviável ou falhou ({e}). Fallback para min_volatilidade.")
-        return otimizar_min_volatilidade(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max)
+        return otimizar_min_volatilidade(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max,
+                                         contexto)
 
     sucesso = prob.status in ["optimal", "optimal_inaccurate"]
     pesos = np.clip(w.value, 0, 1) if sucesso and w.value is not None else np.zeros(n)
@@ -197,22 +665,16 @@ def otimizar_max_retorno(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
     
     # 2ª ETAPA: Heurística de Cardinalidade
     if n_ativos_max and n_ativos_max < n and sucesso:
-        indices_top = _selecionar_melhores_ativos(pesos, n_ativos_max)
-        n_filtrado = len(indices_top)
+        indices_top = _selecionar_melhores_ativos(pesos, n_ativos_max, contexto is not None)
         ret_filtrado = ret_medio[indices_top]
         cov_filtrada = cov_matrix[np.ix_(indices_top, indices_top)]
         
-        w_filt = cp.Variable(n_filtrado)
-        restricoes_filt = [
-            cp.sum(w_filt) == 1, 
-            w_filt >= 0, 
-            w_filt <= peso_maximo, 
-            cp.quad_form(w_filt, cov_filtrada) <= vol_maxima**2
-        ]
-        prob_filt = cp.Problem(cp.Maximize(ret_filtrado.T @ w_filt), restricoes_filt)
+        qp_filt = _problema(contexto, "max_ret", ret_filtrado, cov_filtrada, peso_maximo, vol_maxima,
+                            subconjunto=indices_top)
+        w_filt, prob_filt = qp_filt.w, qp_filt.prob
         
         try:
-            _resolver_problema(prob_filt)
+            _resolver_problema(prob_filt, contexto=contexto)
             if prob_filt.status in ["optimal", "optimal_inaccurate"] and w_filt.value is not None:
                 pesos_finais = np.zeros(n)
                 pesos_limpos = np.clip(w_filt.value, 0, 1)
@@ -222,27 +684,24 @@ def otimizar_max_retorno(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
                 for i, idx in enumerate(indices_top):
                     pesos_finais[idx] = pesos_limpos[i]
                 
-                return ResultadoOtimizacao(
-                    pesos=pesos_finais, retorno_esperado=calcular_retorno_portfolio(pesos_finais, ret_medio),
-                    volatilidade=calcular_volatilidade_portfolio(pesos_finais, cov_matrix),
-                    sharpe=calcular_sharpe(pesos_finais, ret_medio, cov_matrix, taxa_livre_risco),
-                    tickers=tickers, sucesso=True, mensagem="Convergência Global OSQP (2 Etapas)"
+                return _montar_resultado(
+                    pesos_finais, ret_medio, cov_matrix, taxa_livre_risco,
+                    tickers, True, "Convergência Global OSQP (2 Etapas)"
                 )
         except Exception:
              logger.warning("Filtro heurístico falhou na 2ª etapa. A retornar resultado da 1ª etapa.")
 
     msg = "Convergência Global OSQP" if sucesso else str(prob.status)
-    return ResultadoOtimizacao(
-        pesos=pesos, retorno_esperado=calcular_retorno_portfolio(pesos, ret_medio),
-        volatilidade=calcular_volatilidade_portfolio(pesos, cov_matrix),
-        sharpe=calcular_sharpe(pesos, ret_medio, cov_matrix, taxa_livre_risco),
-        tickers=tickers, sucesso=sucesso, mensagem=msg
+    return _montar_resultado(
+        pesos, ret_medio, cov_matrix, taxa_livre_risco,
+        tickers, sucesso, msg
     )
 
 
 def otimizar_max_sharpe(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
                         taxa_livre_risco: float = None, peso_maximo: float = 0.20,
-                        n_ativos_max: Optional[int] = None) -> ResultadoOtimizacao:
+                        n_ativos_max: Optional[int] = None,
+                        contexto: Optional[ContextoOtimizacao] = None) -> ResultadoOtimizacao:
     """
     Maximiza o rácio de Sharpe varrendo a fronteira eficiente estritamente no espaço viável.
     A maximização direta do Sharpe é um problema fracionário; esta abordagem iterativa 
@@ -256,20 +715,22 @@ def otimizar_max_sharpe(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
     ret_medio = retornos_medios.values
     cov_matrix = _preparar_matriz_covariancia(matriz_cov)
     
-    def _calcular_limites_retorno(mu: np.ndarray, cov: np.ndarray, p_max: float) -> Tuple[float, float]:
+    def _calcular_limites_retorno(mu: np.ndarray, cov: np.ndarray, p_max: float,
+                                  subconjunto: Optional[List[int]] = None) -> Tuple[float, float]:
         """Calcula matematicamente o limite inferior e superior de retorno possível no hiperplano."""
-        w_tmp = cp.Variable(len(mu))
         try:
-            p_max_ret = cp.Problem(cp.Maximize(mu.T @ w_tmp), [cp.sum(w_tmp) == 1, w_tmp >= 0, w_tmp <= p_max])
-            _resolver_problema(p_max_ret)
-            r_max = float(p_max_ret.value)
+            # r_max é o último alvo da varredura (fronteira do conjunto viável): resolvido sem
+            # herdar a janela anterior, para não mudar a tolerância com que o LP o atinge
+            qp_max = _problema(contexto, "max_mu", mu, cov, p_max, subconjunto=subconjunto)
+            _resolver_problema(qp_max.prob, warm_start=False, contexto=contexto)
+            r_max = float(qp_max.prob.value)
         except Exception:
             r_max = float(np.max(mu))
 
         try:
-            p_min_vol = cp.Problem(cp.Minimize(cp.quad_form(w_tmp, cov)), [cp.sum(w_tmp) == 1, w_tmp >= 0, w_tmp <= p_max])
-            _resolver_problema(p_min_vol)
-            r_min = float(mu.T @ w_tmp.value)
+            qp_min = _problema(contexto, "min_vol", mu, cov, p_max, subconjunto=subconjunto)
+            _resolver_problema(qp_min.prob, contexto=contexto)
+            r_min = float(mu.T @ qp_min.w.value)
         except Exception:
             r_min = float(np.min(mu))
         
@@ -281,107 +742,97 @@ def otimizar_max_sharpe(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
     # Define os vetores de pesquisa
     target_returns = np.linspace(ret_min, ret_max, 50)
     
-    w = cp.Variable(n)
-    param_retorno = cp.Parameter()
-    prob = cp.Problem(cp.Minimize(cp.quad_form(w, cov_matrix)), 
-                      [cp.sum(w) == 1, w >= 0, w <= peso_maximo, ret_medio.T @ w >= param_retorno])
-    
-    best_sharpe = -np.inf
-    best_pesos = np.zeros(n)
-    sucesso_encontrado = False
+    # Com um contexto o problema (e a fatorização) vem da janela anterior. A varredura encadeia
+    # o warm start entre alvos consecutivos da própria janela; o primeiro alvo (r_min) parte da
+    # solução mais próxima da varredura anterior, não do último ponto dela (perto de r_max)
+    qp = _problema(contexto, "fronteira", ret_medio, cov_matrix, peso_maximo)
+    w, prob, param_retorno = qp.w, qp.prob, qp.alvo
+    semeado = _iniciar_varredura(qp, target_returns[0])
     
-    for target in target_returns:
+    # Acumula as soluções da varredura e avalia todas numa única passagem vetorizada
+    candidatos = []
+    for i, target in enumerate(target_returns):
         param_retorno.value = target
         try:
-            _resolver_problema(prob, warm_start=True)
+            _resolver_problema(prob, warm_start=i > 0 or semeado, contexto=contexto)
             if prob.status in ["optimal", "optimal_inaccurate"] and w.value is not None:
                 p = np.clip(w.value, 0, 1)
                 if np.sum(p) > 0: 
                     p /= np.sum(p)
-                vol = np.sqrt(p.T @ cov_matrix @ p)
-                ret = p.T @ ret_medio
-                sharpe = (ret - taxa_livre_risco) / vol if vol > 0 else 0
-                
-                if sharpe > best_sharpe:
-                    best_sharpe = sharpe
-                    best_pesos = p.copy()
-                    sucesso_encontrado = True
+                candidatos.append(p)
         except Exception:
             continue
 
-    if not sucesso_encontrado:
+    best_pesos = _melhor_sharpe(candidatos, ret_medio, cov_matrix, taxa_livre_risco)
+    if best_pesos is None:
         logger.warning("Falha a maximizar Sharpe ao longo da fronteira. Fallback analítico para min_vol.")
-        return otimizar_min_volatilidade(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max)
+        return otimizar_min_volatilidade(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max,
+                                         contexto)
 
     # 2ª ETAPA: Heurística de Cardinalidade Dinâmica
     if n_ativos_max and n_ativos_max < n:
-        indices_top = _selecionar_melhores_ativos(best_pesos, n_ativos_max)
-        n_filtrado = len(indices_top)
+        indices_top = _selecionar_melhores_ativos(best_pesos, n_ativos_max, contexto is not None)
         ret_filtrado = ret_medio[indices_top]
         cov_filtrada = cov_matrix[np.ix_(indices_top, indices_top)]
         
         # CORREÇÃO CRÍTICA: É absolutamente necessário recalcular o espaço topológico viável do novo subconjunto.
         # Se usarmos os limites de retorno globais, o solver vai rejeitar por impossibilidade matemática.
-        r_min_f, r_max_f = _calcular_limites_retorno(ret_filtrado, cov_filtrada, peso_maximo)
+        r_min_f, r_max_f = _calcular_limites_retorno(ret_filtrado, cov_filtrada, peso_maximo, indices_top)
         target_returns_filt = np.linspace(r_min_f, r_max_f, 50)
         
-        w_filt = cp.Variable(n_filtrado)
-        param_ret_filt = cp.Parameter()
-        prob_filt = cp.Problem(cp.Minimize(cp.quad_form(w_filt, cov_filtrada)), 
-                               [cp.sum(w_filt) == 1, w_filt >= 0, w_filt <= peso_maximo, ret_filtrado.T @ w_filt >= param_ret_filt])
-        
-        best_sharpe_filt = -np.inf
-        best_pesos_filt = None
-        sucesso_filt = False
+        # Um subconjunto que se repete entre janelas reaproveita o problema já montado
+        qp_filt = _problema(contexto, "fronteira", ret_filtrado, cov_filtrada, peso_maximo,
+                            subconjunto=indices_top)
+        w_filt, prob_filt, param_ret_filt = qp_filt.w, qp_filt.prob, qp_filt.alvo
+        semeado_filt = _iniciar_varredura(qp_filt, target_returns_filt[0])
         
-        for target in target_returns_filt:
+        candidatos_filt = []
+        for i, target in enumerate(target_returns_filt):
             param_ret_filt.value = target
             try:
-                _resolver_problema(prob_filt, warm_start=True)
+                _resolver_problema(prob_filt, warm_start=i > 0 or semeado_filt, contexto=contexto)
                 if prob_filt.status in ["optimal", "optimal_inaccurate"] and w_filt.value is not None:
                     p = np.clip(w_filt.value, 0, 1)
                     if np.sum(p) > 0: 
                         p /= np.sum(p)
-                    vol = np.sqrt(p.T @ cov_filtrada @ p)
-                    ret = p.T @ ret_filtrado
-                    sharpe = (ret - taxa_livre_risco) / vol if vol > 0 else 0
-                    
-                    if sharpe > best_sharpe_filt:
-                        best_sharpe_filt = sharpe
-                        best_pesos_filt = p.copy()
-                        sucesso_filt = True
+                    candidatos_filt.append(p)
             except Exception:
                 continue
 
-        if sucesso_filt and best_pesos_filt is not None:
+        best_pesos_filt = _melhor_sharpe(candidatos_filt, ret_filtrado, cov_filtrada, taxa_livre_risco)
+        if best_pesos_filt is not None:
             pesos_finais = np.zeros(n)
             for i, idx in enumerate(indices_top):
                 pesos_finais[idx] = best_pesos_filt[i]
             
-            return ResultadoOtimizacao(
-                pesos=pesos_finais, retorno_esperado=calcular_retorno_portfolio(pesos_finais, ret_medio),
-                volatilidade=calcular_volatilidade_portfolio(pesos_finais, cov_matrix),
-                sharpe=calcular_sharpe(pesos_finais, ret_medio, cov_matrix, taxa_livre_risco),
-                tickers=tickers, sucesso=True, mensagem="Max Sharpe Heurístico (2 Etapas Resolvidas)"
+            return _montar_resultado(
+                pesos_finais, ret_medio, cov_matrix, taxa_livre_risco,
+                tickers, True, "Max Sharpe Heurístico (2 Etapas Resolvidas)"
             )
         else:
             logger.warning("Filtro heurístico falhou na varredura sub-dimensional. A retornar resultado da 1ª etapa.")
             
-    return ResultadoOtimizacao(
-        pesos=best_pesos, retorno_esperado=calcular_retorno_portfolio(best_pesos, ret_medio),
-        volatilidade=calcular_volatilidade_portfolio(best_pesos, cov_matrix),
-        sharpe=calcular_sharpe(best_pesos, ret_medio, cov_matrix, taxa_livre_risco),
-        tickers=tickers, sucesso=True, mensagem="Max Sharpe Global Encontrado"
+    return _montar_resultado(
+        best_pesos, ret_medio, cov_matrix, taxa_livre_risco,
+        tickers, True, "Max Sharpe Global Encontrado"
     )
 
 def gerar_fronteira_eficiente(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
                                taxa_livre_risco: float = None, n_pontos: int = 50,
                                peso_maximo: float = 0.20,
-                               n_ativos_max: Optional[int] = None) -> pd.DataFrame:
+                               n_ativos_max: Optional[int] = None,
+                               contexto: Optional[ContextoOtimizacao] = None,
+                               retornar_pesos: bool = False):
     """
     Constrói a fronteira eficiente dinamicamente através de warm-start no solver convexo.
     Quando n_ativos_max é fornecido, aplica a heurística de cardinalidade em duas etapas
     para que a fronteira reflita as mesmas restrições da otimização real.
+    Com um contexto (ex.: fronteiras de janelas sucessivas), a varredura e os subproblemas
+    da 2.ª etapa reaproveitam os problemas compilados e partem da solução anterior.
+
+    Returns:
+        DataFrame (retorno, volatilidade, sharpe) por ponto; com retornar_pesos=True, o par
+        (DataFrame, matriz de pesos n_pontos x n_ativos) para análises posteriores (stress, etc.)
     """
     if taxa_livre_risco is None:
         taxa_livre_risco = risk_profiles.TAXA_SELIC
@@ -391,19 +842,18 @@ def gerar_fronteira_eficiente(retornos_medios: pd.Series, matriz_cov: pd.DataFra
     cov_matrix = _preparar_matriz_covariancia(matriz_cov)
     aplicar_card = n_ativos_max is not None and n_ativos_max < n
 
-    w = cp.Variable(n)
-
     try:
-        p_min = cp.Problem(cp.Minimize(cp.quad_form(w, cov_matrix)), [cp.sum(w) == 1, w >= 0, w <= peso_maximo])
-        _resolver_problema(p_min)
-        ret_min = float(ret_medio.T @ w.value)
+        qp_min = _problema(contexto, "min_vol", ret_medio, cov_matrix, peso_maximo)
+        _resolver_problema(qp_min.prob, contexto=contexto)
+        ret_min = float(ret_medio.T @ qp_min.w.value)
     except Exception:
         ret_min = float(np.min(ret_medio))
 
     try:
-        p_max = cp.Problem(cp.Maximize(ret_medio.T @ w), [cp.sum(w) == 1, w >= 0, w <= peso_maximo])
-        _resolver_problema(p_max)
-        ret_max = float(p_max.value)
+        # Sem herdar a solução anterior, como em otimizar_max_sharpe
+        qp_max = _problema(contexto, "max_mu", ret_medio, cov_matrix, peso_maximo)
+        _resolver_problema(qp_max.prob, warm_start=False, contexto=contexto)
+        ret_max = float(qp_max.prob.value)
     except Exception:
         ret_max = float(np.max(ret_medio))
 
@@ -413,16 +863,16 @@ def gerar_fronteira_eficiente(retornos_medios: pd.Series, matriz_cov: pd.DataFra
     retornos_alvo = np.linspace(ret_min, ret_max, n_pontos)
     fronteira = []
 
-    param_retorno = cp.Parameter()
-    prob = cp.Problem(
-        cp.Minimize(cp.quad_form(w, cov_matrix)),
-        [cp.sum(w) == 1, w >= 0, w <= peso_maximo, ret_medio.T @ w >= param_retorno]
-    )
+    # O primeiro alvo parte da solução mais próxima da varredura anterior (ou do zero);
+    # os seguintes encadeiam a partir do alvo anterior
+    qp = _problema(contexto, "fronteira", ret_medio, cov_matrix, peso_maximo)
+    w, prob, param_retorno = qp.w, qp.prob, qp.alvo
+    semeado = _iniciar_varredura(qp, retornos_alvo[0])
 
-    for ret_alvo in retornos_alvo:
+    for i, ret_alvo in enumerate(retornos_alvo):
         param_retorno.value = ret_alvo
         try:
-            _resolver_problema(prob, warm_start=True)
+            _resolver_problema(prob, warm_start=i > 0 or semeado, contexto=contexto)
             if prob.status in ["optimal", "optimal_inaccurate"] and w.value is not None:
                 p = np.clip(w.value, 0, 1)
                 if np.sum(p) > 0:
@@ -430,58 +880,378 @@ def gerar_fronteira_eficiente(retornos_medios: pd.Series, matriz_cov: pd.DataFra
 
                 # Etapa 2: heurística de cardinalidade (mesmas restrições da otimização real)
                 if aplicar_card:
-                    indices_top = _selecionar_melhores_ativos(p, n_ativos_max)
-                    n_filt = len(indices_top)
+                    indices_top = _selecionar_melhores_ativos(p, n_ativos_max, contexto is not None)
                     cov_filt = cov_matrix[np.ix_(indices_top, indices_top)]
                     ret_filt = ret_medio[indices_top]
 
-                    w_filt = cp.Variable(n_filt)
-                    prob_filt = cp.Problem(
-                        cp.Minimize(cp.quad_form(w_filt, cov_filt)),
-                        [cp.sum(w_filt) == 1, w_filt >= 0, w_filt <= peso_maximo,
-                         ret_filt.T @ w_filt >= ret_alvo]
-                    )
+                    # Pontos vizinhos selecionam quase sempre o mesmo subconjunto: com contexto,
+                    # o subproblema é reaproveitado enquanto o subconjunto não muda
+                    qp_filt = _problema(contexto, "fronteira", ret_filt, cov_filt, peso_maximo,
+                                        subconjunto=indices_top)
+                    w_filt, prob_filt = qp_filt.w, qp_filt.prob
+                    qp_filt.alvo.value = ret_alvo
                     try:
-                        _resolver_problema(prob_filt)
+                        _resolver_problema(prob_filt, contexto=contexto)
                         if prob_filt.status in ["optimal", "optimal_inaccurate"] and w_filt.value is not None:
                             p2 = np.clip(w_filt.value, 0, 1)
                             if np.sum(p2) > 0: p2 /= np.sum(p2)
 
                             pesos_finais = np.zeros(n)
-                            for i, idx in enumerate(indices_top):
-                                pesos_finais[idx] = p2[i]
-
-                            vol = np.sqrt(pesos_finais.T @ cov_matrix @ pesos_finais)
-                            ret = pesos_finais.T @ ret_medio
-                            sharpe = (ret - taxa_livre_risco) / vol if vol > 0 else 0
-                            fronteira.append({'retorno': float(ret), 'volatilidade': float(vol), 'sharpe': float(sharpe)})
+                            pesos_finais[indices_top] = p2
+                            fronteira.append(pesos_finais)
                     except Exception:
                         pass  # Ponto inviável com cardinalidade
                     # CORREÇÃO: Sempre avança quando cardinalidade está ativa.
                     # Impede fallthrough para ponto sem restrição de cardinalidade.
                     continue
 
-                vol = np.sqrt(p.T @ cov_matrix @ p)
-                ret = p.T @ ret_medio
-                sharpe = (ret - taxa_livre_risco) / vol if vol > 0 else 0
-                fronteira.append({'retorno': float(ret), 'volatilidade': float(vol), 'sharpe': float(sharpe)})
+                fronteira.append(p)
         except Exception:
             continue
 
-    return pd.DataFrame(fronteira)
+    if not fronteira:
+        return (pd.DataFrame(), np.empty((0, n))) if retornar_pesos else pd.DataFrame()
+
+    # Avaliação vetorizada de todos os pontos da fronteira (um único einsum)
+    pesos_fronteira = np.vstack(fronteira)
+    av = avaliar_portfolios_lote(pesos_fronteira, ret_medio, cov_matrix, taxa_livre_risco,
+                                 fator_cholesky=calcular_fator_cholesky(cov_matrix))
+    df_fronteira = pd.DataFrame({'retorno': av.retornos, 'volatilidade': av.volatilidades, 'sharpe': av.sharpes})
+    return (df_fronteira, pesos_fronteira) if retornar_pesos else df_fronteira
+
+
+# ============== NUVEM DE CARTEIRAS VIÁVEIS (MONTE CARLO) ==============
+
+def _projetar_simplex_limitado(pesos: np.ndarray, peso_maximo: float, max_iter: int = 50) -> np.ndarray:
+    """
+    Projeta cada linha (vetorizado) no simplex limitado {w >= 0, Σw = 1, w <= peso_maximo}.
+    O excesso acima do teto é redistribuído proporcionalmente pelos ativos ainda livres
+    (water-filling), repetindo até nenhuma linha violar o limite. Cada iteração só
+    trabalha nas linhas que ainda têm excesso por distribuir.
+    """
+    W = np.minimum(pesos, peso_maximo)
+    ativas = np.flatnonzero(1.0 - W.sum(axis=1) >= 1e-12)
+    for _ in range(max_iter):
+        if len(ativas) == 0:
+            break
+        Wa = W[ativas]
+        excesso = 1.0 - Wa.sum(axis=1)
+        livres = Wa < peso_maximo - 1e-12
+        base = np.where(livres, Wa, 0.0)
+        soma_livres = base.sum(axis=1, keepdims=True)
+        # Linhas sem massa livre recebem o excesso em partes iguais pelos ativos abaixo do teto
+        n_livres = livres.sum(axis=1, keepdims=True)
+        distrib = np.where(soma_livres > 0, base / np.where(soma_livres > 0, soma_livres, 1.0),
+                           livres / np.maximum(n_livres, 1))
+        Wa = np.minimum(Wa + distrib * excesso[:, None], peso_maximo)
+        W[ativas] = Wa
+        ativas = ativas[1.0 - Wa.sum(axis=1) >= 1e-12]
+    return W / W.sum(axis=1, keepdims=True)
+
+
+def _dirichlet_subconjuntos(rng: np.random.Generator, n_ativos: int, m: int,
+                            peso_maximo: float) -> np.ndarray:
+    """
+    m carteiras uniformes (Dirichlet α = 1) sobre subconjuntos aleatórios de ativos. Cada
+    linha inclui cada ativo com probabilidade p, log-uniforme entre ~1/(peso_maximo·n) e 1:
+    subconjuntos pequenos levam a amostra para os vértices do simplex limitado.
+    """
+    p_min = min(1.0, 1.0 / (peso_maximo * n_ativos))
+    p = np.exp(rng.uniform(np.log(p_min), 0.0, size=(m, 1)))
+    E = rng.exponential(size=(m, n_ativos)) * (rng.random((m, n_ativos)) < p)
+    somas = E.sum(axis=1, keepdims=True)
+    # Linhas sem nenhum ativo sorteado ficam em 1/N
+    return np.divide(E, somas, out=np.full_like(E, 1.0 / n_ativos), where=somas > 0)
+
+
+def _misturar_ancoras(rng: np.random.Generator, ancoras: np.ndarray, W: np.ndarray) -> np.ndarray:
+    """
+    Combinações convexas λ·âncora + (1 − λ)·W, com uma âncora sorteada por linha (ex.: pontos
+    da fronteira) e λ ~ U(0, 1): preenchem o espaço entre as âncoras e o interior da região
+    viável. Se âncoras e W respeitam o teto, o resultado também respeita (conjunto convexo).
+    """
+    lam = rng.random((len(W), 1))
+    return lam * ancoras[rng.integers(len(ancoras), size=len(W))] + (1.0 - lam) * W
+
+
+def amostrar_portfolios_viaveis(n_ativos: int, n_amostras: int = 200_000, peso_maximo: float = 0.20,
+                                tamanho_lote: int = 20_000, semente: Optional[int] = None,
+                                taxa_minima_aceitacao: float = 0.05, fracao_esparsa: float = 0.3,
+                                ancoras: Optional[np.ndarray] = None,
+                                fracao_ancoras: float = 0.3) -> Iterator[np.ndarray]:
+    """
+    Gerador de lotes (m × n) de carteiras long-only com Σw = 1 e w <= peso_maximo.
+
+    Amostragem uniforme no simplex (Dirichlet com α = 1) com rejeição das linhas que
+    violam o teto. Quando a taxa de aceitação cai abaixo de `taxa_minima_aceitacao`
+    (tetos apertados para poucos ativos), os lotes passam a ser projetados no simplex
+    limitado em vez de rejeitados, mantendo o custo por amostra constante.
+
+    Com muitos ativos a Dirichlet uniforme concentra-se perto de 1/N e não chega à
+    fronteira. Por isso uma `fracao_esparsa` de cada lote vem de subconjuntos aleatórios
+    de ativos (_dirichlet_subconjuntos, projetados no simplex limitado) e, com `ancoras`
+    (k × n viáveis, ex.: os pesos da fronteira), uma `fracao_ancoras` é misturada com elas
+    (_misturar_ancoras).
+    """
+    if n_ativos * peso_maximo < 1.0 - 1e-9:
+        logger.warning(f"Região viável vazia: {n_ativos} ativos com teto {peso_maximo:.0%} não somam 100%.")
+        return
+
+    rng = np.random.default_rng(semente)
+    alpha = np.ones(n_ativos)
+    if ancoras is None or len(ancoras) == 0:
+        ancoras, fracao_ancoras = None, 0.0
+    gerados = 0
+    projetar = False
+
+    while gerados < n_amostras:
+        m = min(tamanho_lote, n_amostras - gerados)
+        m_esparsas = int(round(m * fracao_esparsa))
+        m_ancoras = int(round(m * fracao_ancoras))
+        W = rng.dirichlet(alpha, size=max(m - m_esparsas - m_ancoras, 0))
+        if projetar:
+            W = _projetar_simplex_limitado(W, peso_maximo)
+        elif len(W):
+            aceites = W.max(axis=1) <= peso_maximo
+            if aceites.mean() < taxa_minima_aceitacao:
+                projetar = True
+                W = _projetar_simplex_limitado(W, peso_maximo)
+            else:
+                W = W[aceites]
+        if m_esparsas or m_ancoras:
+            esparsas = _projetar_simplex_limitado(
+                _dirichlet_subconjuntos(rng, n_ativos, m_esparsas + m_ancoras, peso_maximo), peso_maximo)
+            if m_ancoras:
+                esparsas[m_esparsas:] = _misturar_ancoras(rng, ancoras, esparsas[m_esparsas:])
+            W = np.vstack([W, esparsas])
+        if len(W) == 0:
+            continue
+        gerados += len(W)
+        yield W
+
+
+def gerar_nuvem_portfolios(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
+                           taxa_livre_risco: float = None, n_amostras: int = 200_000,
+                           peso_maximo: float = 0.20, n_bins: int = 60,
+                           tamanho_lote: int = 20_000, semente: Optional[int] = 42,
+                           ancoras: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Resume a região viável risco x retorno por densidade.
+
+    As carteiras são amostradas e avaliadas em lotes (avaliar_portfolios_lote) e
+    acumuladas num histograma 2D de (volatilidade, retorno); apenas as células
+    ocupadas são devolvidas, pelo que o tamanho do gráfico fica limitado a n_bins²
+    pontos independentemente do número de amostras.
+
+    Com `ancoras` (ex.: os pesos de gerar_fronteira_eficiente(..., retornar_pesos=True)) parte
+    das amostras é sorteada à volta delas, para a nuvem chegar à fronteira mesmo com
+    centenas de ativos (ver amostrar_portfolios_viaveis).
+
+    A grelha é fixada pelo primeiro lote, com 25% de margem em cada eixo. Amostras
+    posteriores fora da grelha são descartadas (não desenhadas na borda) e contadas em
+    nuvem.attrs['fora_da_grelha']; nuvem.attrs['n_amostras'] conta só as desenhadas.
+
+    Returns:
+        DataFrame com colunas volatilidade, retorno (centro da célula), contagem e
+        sharpe_medio. Vazio se a região viável for vazia.
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+    ret_medio = retornos_medios.values
+    cov_matrix = _preparar_matriz_covariancia(matriz_cov)
+    fator = calcular_fator_cholesky(cov_matrix)
+
+    contagens = np.zeros((n_bins, n_bins))
+    soma_sharpe = np.zeros((n_bins, n_bins))
+    bordas_vol = bordas_ret = None
+    total = fora = 0
+
+    for W in amostrar_portfolios_viaveis(len(ret_medio), n_amostras, peso_maximo, tamanho_lote, semente,
+                                         ancoras=ancoras):
+        av = avaliar_portfolios_lote(W, ret_medio, cov_matrix, taxa_livre_risco, fator_cholesky=fator)
+        if bordas_vol is None:
+            # A grelha é fixada pelo primeiro lote (com margem); pontos fora dela são descartados
+            margem_vol = 0.25 * np.ptp(av.volatilidades) + 1e-9
+            margem_ret = 0.25 * np.ptp(av.retornos) + 1e-9
+            bordas_vol = np.linspace(av.volatilidades.min() - margem_vol, av.volatilidades.max() + margem_vol, n_bins + 1)
+            bordas_ret = np.linspace(av.retornos.min() - margem_ret, av.retornos.max() + margem_ret, n_bins + 1)
+        iv = np.searchsorted(bordas_vol, av.volatilidades, side='right') - 1
+        ir = np.searchsorted(bordas_ret, av.retornos, side='right') - 1
+        dentro = (iv >= 0) & (iv < n_bins) & (ir >= 0) & (ir < n_bins)
+        np.add.at(contagens, (iv[dentro], ir[dentro]), 1)
+        np.add.at(soma_sharpe, (iv[dentro], ir[dentro]), av.sharpes[dentro])
+        total += int(dentro.sum())
+        fora += len(W) - int(dentro.sum())
+
+    if fora:
+        logger.debug(f"Nuvem: {fora} amostras fora da grelha descartadas")
+    if total == 0:
+        return pd.DataFrame(columns=['volatilidade', 'retorno', 'contagem', 'sharpe_medio'])
+
+    iv, ir = np.nonzero(contagens)
+    centros_vol = (bordas_vol[:-1] + bordas_vol[1:]) / 2
+    centros_ret = (bordas_ret[:-1] + bordas_ret[1:]) / 2
+    nuvem = pd.DataFrame({
+        'volatilidade': centros_vol[iv],
+        'retorno': centros_ret[ir],
+        'contagem': contagens[iv, ir].astype(int),
+        'sharpe_medio': soma_sharpe[iv, ir] / contagens[iv, ir]
+    })
+    nuvem.attrs['n_amostras'] = total
+    nuvem.attrs['fora_da_grelha'] = fora
+    return nuvem
+
+
+# ============== PARIDADE DE RISCO (ERC) ==============
+
+def _newton_orcamento_risco(cov: np.ndarray, orcamentos: np.ndarray, lam: float, teto: float,
+                            w: np.ndarray, tol: float, max_iter: int = 50) -> Tuple[np.ndarray, int]:
+    """
+    Newton projetado para min ½·wᵀΣw − λ·Σ b_i·ln(w_i) com 0 < w_i ≤ teto.
+    Os ativos no teto cujo gradiente ainda pede mais peso ficam fixos; o passo de Newton
+    é calculado no bloco livre, limitado para manter w > 0 e com busca de Armijo.
+    Critério de paragem: |w_i·∂f/∂w_i| = |w_i·(Σw)_i − λ·b_i| < tol·λ nos ativos livres.
+    """
+    def objetivo(x):
+        return 0.5 * x @ cov @ x - lam * (orcamentos @ np.log(x))
+
+    f_atual = objetivo(w)
+    for iteracao in range(max_iter):
+        grad = cov @ w - lam * orcamentos / w
+        livres = ~((w >= teto * (1 - 1e-12)) & (grad < 0))
+        if np.max(np.abs(grad[livres] * w[livres]), initial=0.0) < tol * lam:
+            return w, iteracao
+        H = cov[np.ix_(livres, livres)]
+        H[np.diag_indices_from(H)] += lam * orcamentos[livres] / w[livres] ** 2
+        d = np.zeros_like(w)
+        d[livres] = -np.linalg.solve(H, grad[livres])
+
+        negativos = d < 0
+        passo = min(1.0, 0.95 * np.min(-w[negativos] / d[negativos], initial=np.inf))
+        for _ in range(40):
+            candidato = np.minimum(w + passo * d, teto)
+            f_candidato = objetivo(candidato)
+            if f_candidato <= f_atual + 1e-4 * grad @ (candidato - w):
+                break
+            passo *= 0.5
+        else:
+            return w, iteracao
+        w, f_atual = candidato, f_candidato
+    return w, max_iter
+
+
+def resolver_paridade_risco(matriz_cov: np.ndarray, peso_maximo: float = 1.0,
+                            orcamentos: Optional[np.ndarray] = None, tol: float = 1e-10,
+                            max_iter: int = 50) -> Tuple[np.ndarray, int, bool]:
+    """
+    Carteira de contribuições de risco iguais (ERC) ou proporcionais a `orcamentos`,
+    com 0 ≤ w ≤ peso_maximo e Σw = 1 (Richard & Roncalli, 2019).
+    
+    Para cada λ resolve-se o problema com barreira logarítmica (convexo, ver
+    _newton_orcamento_risco); sem teto a solução escala com √λ, pelo que λ é ajustado
+    por secante em escala log-log até Σw = 1, reaproveitando a solução anterior.
+    Nos ativos abaixo do teto as contribuições de risco ficam proporcionais a b_i; os
+    ativos no teto contribuem menos. Em 195 ativos converge em poucos milissegundos.
+    
+    Returns:
+        (pesos, iterações de Newton, convergiu)
+    """
+    cov = np.asarray(matriz_cov, dtype=float)
+    n = len(cov)
+    b = np.full(n, 1.0 / n) if orcamentos is None else np.asarray(orcamentos, dtype=float) / np.sum(orcamentos)
+    if peso_maximo * n < 1 - 1e-12:
+        raise ValueError(f"Inviável: {n} ativos com peso máximo {peso_maximo:.2%} não somam 100%.")
+    if peso_maximo * n <= 1 + 1e-12:
+        return np.full(n, 1.0 / n), 0, True
+
+    # Arranque: inverso da volatilidade (a solução ERC exata quando as correlações são iguais)
+    inv_vol = 1.0 / np.sqrt(np.diag(cov))
+    w = np.minimum(inv_vol / inv_vol.sum(), peso_maximo)
+    lam = float(w @ cov @ w)     # Na solução ERC sem teto, λ = σ²
+    iteracoes = 0
+    anterior = None
+    for _ in range(max_iter):
+        w, it = _newton_orcamento_risco(cov, b, lam, peso_maximo, w, tol)
+        iteracoes += it
+        soma = w.sum()
+        if abs(soma - 1.0) < tol:
+            return w / soma, iteracoes, True
+        # Elasticidade d ln Σw / d ln λ: 1/2 sem teto, menor quando há ativos no teto
+        k = 0.5
+        if anterior is not None and soma != anterior[1]:
+            k = float(np.clip(np.log(soma / anterior[1]) / np.log(lam / anterior[0]), 1e-3, 0.5))
+        anterior = (lam, soma)
+        fator = soma ** (-1.0 / k)
+        w = np.minimum(w * np.sqrt(fator), peso_maximo)
+        lam *= fator
+    return w / w.sum(), iteracoes, False
+
+
+def otimizar_paridade_risco(retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
+                            taxa_livre_risco: float = None, peso_maximo: float = 0.20,
+                            n_ativos_max: Optional[int] = None,
+                            orcamentos_risco: Optional[np.ndarray] = None) -> ResultadoOtimizacao:
+    """
+    Paridade de risco (Equal Risk Contribution) sem cvxpy: cada ativo contribui com a
+    mesma parcela da volatilidade da carteira, respeitando peso_maximo.
+    Com n_ativos_max usa a mesma heurística de duas etapas dos outros perfis.
+    """
+    if taxa_livre_risco is None:
+        taxa_livre_risco = risk_profiles.TAXA_SELIC
+
+    n = len(retornos_medios)
+    tickers = retornos_medios.index.tolist()
+    ret_medio = retornos_medios.values
+    cov_matrix = _preparar_matriz_covariancia(matriz_cov)
+
+    try:
+        pesos, iteracoes, sucesso = resolver_paridade_risco(cov_matrix, peso_maximo, orcamentos_risco)
+    except Exception as e:
+        return ResultadoOtimizacao(np.zeros(n), 0, 0, 0, tickers, False, f"Paridade de risco falhou: {e}")
+
+    # 2ª ETAPA: Heurística de Cardinalidade
+    if n_ativos_max and n_ativos_max < n and sucesso:
+        indices_top = _selecionar_melhores_ativos(pesos, n_ativos_max, ordenados=True)
+        orcamentos_filt = None if orcamentos_risco is None else np.asarray(orcamentos_risco)[indices_top]
+        try:
+            pesos_filt, it_filt, sucesso_filt = resolver_paridade_risco(
+                cov_matrix[np.ix_(indices_top, indices_top)], peso_maximo, orcamentos_filt
+            )
+            if sucesso_filt:
+                pesos_finais = np.zeros(n)
+                pesos_finais[indices_top] = pesos_filt
+                return _montar_resultado(
+                    pesos_finais, ret_medio, cov_matrix, taxa_livre_risco, tickers, True,
+                    f"Paridade de risco (2 Etapas, {iteracoes + it_filt} iterações de Newton)"
+                )
+        except Exception as e:
+            logger.warning(f"Filtro heurístico falhou: {e}. A retornar resultado da 1ª etapa.")
+
+    msg = f"Paridade de risco ({iteracoes} iterações de Newton)" if sucesso else "Paridade de risco não convergiu"
+    return _montar_resultado(pesos, ret_medio, cov_matrix, taxa_livre_risco, tickers, sucesso, msg)
 
 
 def otimizar_por_perfil(perfil: str, retornos_medios: pd.Series, matriz_cov: pd.DataFrame,
                         taxa_livre_risco: float = None, peso_maximo: float = 0.20,
-                        n_ativos_max: Optional[int] = None) -> ResultadoOtimizacao:
-    """Orquestrador base que delega a lógica dependendo do risco do perfil selecionado."""
+                        n_ativos_max: Optional[int] = None,
+                        contexto: Optional[ContextoOtimizacao] = None) -> ResultadoOtimizacao:
+    """
+    Orquestrador base que delega a lógica dependendo do risco do perfil selecionado.
+    Um ContextoOtimizacao partilhado entre chamadas ativa o warm start (ver backtesting_walk_forward).
+    """
     if taxa_livre_risco is None:
         taxa_livre_risco = risk_profiles.TAXA_SELIC
 
     perfil_config = risk_profiles.get_perfil(perfil)
 
     if perfil == "Conservador":
-        return otimizar_min_volatilidade(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max)
+        return otimizar_min_volatilidade(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max,
+                                         contexto)
     elif perfil == "Agressivo":
-        return otimizar_max_retorno(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, perfil_config.volatilidade_maxima, n_ativos_max)
-    return otimizar_max_sharpe(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max)
\ No newline at end of file
+        return otimizar_max_retorno(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo,
+                                    perfil_config.volatilidade_maxima, n_ativos_max, contexto)
+    elif perfil == "Paridade de Risco":
+        # Solver dedicado em NumPy: não usa o contexto de warm start do cvxpy
+        return otimizar_paridade_risco(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max)
+    return otimizar_max_sharpe(retornos_medios, matriz_cov, taxa_livre_risco, peso_maximo, n_ativos_max, contexto)
\ No newline at end of file
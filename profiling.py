@@ -0,0 +1,298 @@
+"""
+profiling.py - Perfil de memória do pipeline (tracemalloc) e tempos de arranque
+TCC: Otimização de Carteiras de Investimentos
+
+Opt-in: sem um perfil ativo, `etapa()` não faz nada e o custo é desprezável. Os
+módulos marcam as etapas do pipeline (download, retornos, estatísticas, otimização,
+fronteira, backtests, gráficos) e o perfil é ativado por quem os chama:
+
+    with perfilar_memoria() as perfil:
+        dados = data_loader.carregar_dados_completos(tickers)
+    print(perfil.relatorio())
+
+Na CLI: `python -m cli optimize --perfil-memoria` (grava memoria.csv). No dashboard:
+opção "Perfil de memoria" nas configurações avançadas.
+
+Por etapa regista:
+- retido: bytes alocados na etapa que continuam vivos no fim (o que a sessão acumula)
+- pico: máximo rastreado durante a etapa acima do nível de entrada (temporários incluídos)
+- locais: linhas de código com mais memória retida (Snapshot.compare_to)
+
+O tracemalloc é global ao processo: com várias sessões do dashboard a correr em
+simultâneo, o pico de uma etapa inclui as alocações das outras sessões.
+
+Arranque a frio: os pacotes pesados (cvxpy, yfinance, scipy.stats, plotly.express)
+só são importados quando uma funcionalidade precisa deles (ModuloPreguicoso ou
+imports locais). tempos_importacao mede o import de cada módulo num processo novo
+(`python -m cli arranque`) e o dashboard regista o tempo até à primeira renderização.
+"""
+
+import os
+import sys
+import time
+import logging
+import importlib
+import threading
+import contextlib
+import subprocess
+import tracemalloc
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+# Perfil ativo no contexto atual (cada sessão do Streamlit corre na sua thread)
+_perfil_atual: ContextVar[Optional["PerfilMemoria"]] = ContextVar("perfil_memoria", default=None)
+
+# O tracemalloc só é parado quando o último perfil que o ligou termina
+_lock = threading.Lock()
+_utilizadores = 0
+_iniciado_aqui = False
+
+
+@dataclass
+class RegistoEtapa:
+    """Medição de uma etapa do pipeline."""
+    nome: str
+    nivel: int              # Profundidade (0 = etapa de topo)
+    retido_bytes: int
+    pico_bytes: int
+    duracao_s: float
+    locais: List[str] = field(default_factory=list)
+
+
+def _ligar_tracemalloc(n_frames: int) -> None:
+    global _utilizadores, _iniciado_aqui
+    with _lock:
+        if _utilizadores == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(n_frames)
+            _iniciado_aqui = True
+        _utilizadores += 1
+
+
+def _desligar_tracemalloc() -> None:
+    global _utilizadores, _iniciado_aqui
+    with _lock:
+        _utilizadores -= 1
+        if _utilizadores == 0 and _iniciado_aqui:
+            tracemalloc.stop()
+            _iniciado_aqui = False
+
+
+class PerfilMemoria:
+    """
+    Acumula as medições das etapas executadas enquanto está ativo.
+
+    Args:
+        n_locais: Locais de alocação reportados por etapa (0 dispensa os snapshots, mais rápido)
+        n_frames: Profundidade da pilha guardada pelo tracemalloc em cada alocação
+    """
+
+    def __init__(self, n_locais: int = 5, n_frames: int = 1):
+        self.n_locais = n_locais
+        self.n_frames = n_frames
+        self.etapas: List[RegistoEtapa] = []
+        self._picos_filhos: List[int] = []
+        self._filtros = [tracemalloc.Filter(False, tracemalloc.__file__),
+                         tracemalloc.Filter(False, __file__)]
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        if not self.n_locais:
+            return None
+        return tracemalloc.take_snapshot().filter_traces(self._filtros)
+
+    def _locais_retidos(self, antes: tracemalloc.Snapshot, depois: tracemalloc.Snapshot) -> List[str]:
+        diferencas = [d for d in depois.compare_to(antes, 'lineno') if d.size_diff > 0]
+        return [f"{d.traceback[0].filename}:{d.traceback[0].lineno} (+{d.size_diff / MB:.2f} MB, {d.count_diff:+d} blocos)"
+                for d in diferencas[:self.n_locais]]
+
+    @contextlib.contextmanager
+    def etapa(self, nome: str) -> Iterator[None]:
+        """Mede o bloco `with`. Etapas aninhadas são medidas à parte e contam para o pico da etapa mãe."""
+        antes = self._snapshot()
+        atual_antes, pico_ate_agora = tracemalloc.get_traced_memory()
+        if self._picos_filhos:
+            # O reset_peak apaga o pico que a etapa mãe já atingiu: guarda-o antes
+            self._picos_filhos[-1] = max(self._picos_filhos[-1], pico_ate_agora)
+        tracemalloc.reset_peak()
+        self._picos_filhos.append(0)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            atual_depois, pico = tracemalloc.get_traced_memory()
+            pico = max(pico, self._picos_filhos.pop())
+            if self._picos_filhos:
+                self._picos_filhos[-1] = max(self._picos_filhos[-1], pico)
+            depois = self._snapshot()
+            self.etapas.append(RegistoEtapa(
+                nome=nome,
+                nivel=len(self._picos_filhos),
+                retido_bytes=atual_depois - atual_antes,
+                pico_bytes=max(pico - atual_antes, 0),
+                duracao_s=duracao,
+                locais=self._locais_retidos(antes, depois) if antes is not None else []
+            ))
+
+    def relatorio(self) -> pd.DataFrame:
+        """Uma linha por etapa (pela ordem de conclusão), com retido/pico em MB."""
+        return pd.DataFrame([{
+            'etapa': e.nome,
+            'nivel': e.nivel,
+            'retido_mb': e.retido_bytes / MB,
+            'pico_mb': e.pico_bytes / MB,
+            'duracao_s': e.duracao_s,
+            'locais': '; '.join(e.locais)
+        } for e in self.etapas], columns=['etapa', 'nivel', 'retido_mb', 'pico_mb', 'duracao_s', 'locais'])
+
+    def resumo(self) -> str:
+        """Texto curto para o log (uma linha por etapa e o local principal de cada uma)."""
+        linhas = []
+        for e in self.etapas:
+            linha = (f"{'  ' * e.nivel}{e.nome}: retido {e.retido_bytes / MB:+.2f} MB, "
+                     f"pico {e.pico_bytes / MB:.2f} MB, {e.duracao_s:.2f}s")
+            if e.locais:
+                linha += f" [{e.locais[0]}]"
+            linhas.append(linha)
+        return "\n".join(linhas)
+
+
+@contextlib.contextmanager
+def perfilar_memoria(n_locais: int = 5, n_frames: int = 1, ativo: bool = True) -> Iterator[Optional[PerfilMemoria]]:
+    """
+    Ativa um PerfilMemoria no contexto atual e devolve-o (None se ativo=False).
+    O tracemalloc é ligado à entrada e desligado à saída, se não estava já ligado.
+    """
+    if not ativo:
+        yield None
+        return
+    perfil = PerfilMemoria(n_locais=n_locais, n_frames=n_frames)
+    _ligar_tracemalloc(n_frames)
+    token = _perfil_atual.set(perfil)
+    try:
+        yield perfil
+    finally:
+        _perfil_atual.reset(token)
+        _desligar_tracemalloc()
+
+
+def perfil_ativo() -> Optional[PerfilMemoria]:
+    """PerfilMemoria ativo no contexto atual, se houver."""
+    return _perfil_atual.get()
+
+
+@contextlib.contextmanager
+def etapa(nome: str) -> Iterator[None]:
+    """Marca uma etapa do pipeline; só mede quando há um perfil ativo."""
+    perfil = _perfil_atual.get()
+    if perfil is None or not tracemalloc.is_tracing():
+        yield
+        return
+    with perfil.etapa(nome):
+        yield
+
+
+# ============== ARRANQUE (IMPORTAÇÕES PREGUIÇOSAS E TEMPOS DE IMPORTAÇÃO) ==============
+
+# Pacotes cujo import domina o arranque a frio de um worker
+PACOTES_PESADOS = ("cvxpy", "scipy.stats", "sklearn", "plotly.express", "yfinance", "streamlit")
+
+# Módulos importados pelo dashboard (app.py), pela ordem em que este os importa
+MODULOS_APP = ("streamlit", "assets", "risk_profiles", "data_loader", "covariance", "profiling",
+               "stress_test", "optimizer", "visualizations", "backtesting")
+
+# Tempos de arranque do processo (segundos), registados só na primeira vez
+_arranque: dict = {}
+
+
+class ModuloPreguicoso:
+    """
+    Substituto de um módulo pesado que só é importado no primeiro acesso a um atributo:
+
+        cp = ModuloPreguicoso("cvxpy")   # nada é importado aqui
+        cp.Variable(3)                   # importa o cvxpy (uma vez) e delega
+
+    Depois do primeiro acesso os atributos do módulo ficam no próprio objeto, sem custo extra.
+    """
+
+    def __init__(self, nome: str):
+        self._nome = nome
+
+    def __getattr__(self, atributo: str):
+        if atributo.startswith('__'):
+            raise AttributeError(atributo)
+        modulo = importlib.import_module(self._nome)
+        self.__dict__.update(modulo.__dict__)
+        self.__dict__['_carregado'] = True
+        return getattr(modulo, atributo)
+
+    @property
+    def carregado(self) -> bool:
+        return self.__dict__.get('_carregado', False)
+
+    def __repr__(self) -> str:
+        return f"<ModuloPreguicoso {self._nome} ({'carregado' if self.carregado else 'por carregar'})>"
+
+
+def tempos_importacao(modulos: Sequence[str] = MODULOS_APP, diretorio: Optional[str] = None) -> pd.DataFrame:
+    """
+    Importa `modulos` num processo Python novo com `-X importtime` (arranque a frio, como um
+    worker novo do Streamlit) e devolve uma linha por módulo carregado.
+
+    Returns:
+        DataFrame com modulo, nivel (profundidade), proprio_ms, acumulado_ms e origem
+        (o módulo pedido cujo import o carregou), pela ordem de conclusão
+    """
+    codigo = "; ".join(f"import {m}" for m in modulos)
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo], capture_output=True,
+                              text=True, cwd=diretorio or os.path.dirname(os.path.abspath(__file__)))
+    if processo.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {list(modulos)}: {processo.stderr.strip().splitlines()[-1:]}")
+
+    linhas, pendentes = [], []
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        registo = {'modulo': nome.strip(), 'nivel': nivel, 'proprio_ms': int(proprio) / 1000,
+                   'acumulado_ms': int(acumulado) / 1000}
+        pendentes.append(registo)
+        if nivel == 0:
+            for r in pendentes:
+                r['origem'] = registo['modulo']
+            linhas.extend(pendentes)
+            pendentes = []
+    return pd.DataFrame(linhas, columns=['modulo', 'nivel', 'proprio_ms', 'acumulado_ms', 'origem'])
+
+
+def resumo_importacoes(tempos: pd.DataFrame, modulos: Sequence[str] = MODULOS_APP) -> pd.DataFrame:
+    """
+    Tempo de cada módulo pedido (acumulado, só a parte que ainda não tinha sido carregada)
+    e a origem de cada pacote de PACOTES_PESADOS que foi importado. Os módulos do próprio
+    arranque do interpretador (site, encodings...) ficam de fora do total.
+    """
+    topo = tempos[(tempos['nivel'] == 0) & tempos['modulo'].isin(modulos)]
+    topo = topo[['modulo', 'acumulado_ms']].assign(tipo='pedido', origem='')
+    pesados = tempos[tempos['modulo'].isin(PACOTES_PESADOS)][['modulo', 'acumulado_ms', 'origem']].assign(tipo='pesado')
+    resumo = pd.concat([topo, pesados], ignore_index=True)
+    total = pd.DataFrame([{'modulo': 'TOTAL', 'acumulado_ms': topo['acumulado_ms'].sum(), 'tipo': 'total', 'origem': ''}])
+    return pd.concat([resumo, total], ignore_index=True)[['tipo', 'modulo', 'acumulado_ms', 'origem']]
+
+
+def registar_arranque(nome: str, inicio: float) -> None:
+    """Regista o tempo desde `inicio` (time.perf_counter) até agora, só na primeira vez por processo."""
+    if nome not in _arranque:
+        _arranque[nome] = time.perf_counter() - inicio
+        logger.info(f"Arranque: {nome} em {_arranque[nome]:.2f}s")
+
+
+def tempos_arranque() -> dict:
+    """Tempos de arranque registados neste processo ({nome: segundos})."""
+    return dict(_arranque)
@@ -7,10 +7,9 @@ Baseado na Teoria Moderna do Portfólio de Markowitz
 """
 
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Optional
 import logging
-import requests
-import streamlit as st
+from cache import cache_data
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +17,7 @@ logger = logging.getLogger(__name__)
 _TAXA_SELIC_FALLBACK = 0.1475  # 14.75% a.a. (Março 2026)
 
 
-@st.cache_data(ttl=86400)  # Cache de 24 horas
+@cache_data(ttl=86400)  # Cache de 24 horas
 def obter_taxa_selic() -> float:
     """
     Busca a taxa Selic Meta atual via API pública do Banco Central do Brasil.
@@ -29,6 +28,8 @@ def obter_taxa_selic() -> float:
     Returns:
         Taxa Selic anual em formato decimal (ex: 0.1475 para 14.75%)
     """
+    import requests  # Import local: só este pedido usa a rede
+
     try:
         url = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.432/dados/ultimos/1?formato=json"
         resp = requests.get(url, timeout=5)
@@ -42,8 +43,22 @@ def obter_taxa_selic() -> float:
         return _TAXA_SELIC_FALLBACK
 
 
-# Taxa livre de risco (Selic atual, obtida dinamicamente)
-TAXA_SELIC = obter_taxa_selic()
+def _taxa_selic_processo() -> float:
+    """Selic consultada uma vez por processo, no primeiro uso, e depois fixa em TAXA_SELIC."""
+    global TAXA_SELIC
+    if "TAXA_SELIC" not in globals():
+        TAXA_SELIC = obter_taxa_selic()
+    return TAXA_SELIC
+
+
+def __getattr__(nome: str):
+    """
+    Taxa livre de risco (Selic atual, obtida dinamicamente): `risk_profiles.TAXA_SELIC`
+    consulta o BCB no primeiro acesso, não no import do módulo.
+    """
+    if nome == "TAXA_SELIC":
+        return _taxa_selic_processo()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
 
 @dataclass
@@ -51,8 +66,8 @@ class PerfilRisco:
     """Classe que define um perfil de risco do investidor."""
     nome: str
     descricao: str
-    volatilidade_maxima: float
-    objetivo: str  # 'min_volatility', 'max_sharpe', 'max_return'
+    volatilidade_maxima: Optional[float]  # None = sem teto de volatilidade
+    objetivo: str  # 'min_volatility', 'max_sharpe', 'max_return', 'risk_parity'
     cor_primaria: str
     cor_secundaria: str
     icone: str
@@ -85,6 +100,16 @@ PERFIS_RISCO: Dict[str, PerfilRisco] = {
         cor_primaria="#FF5252",
         cor_secundaria="#B71C1C",
         icone="🚀"
+    ),
+    "Paridade de Risco": PerfilRisco(
+        nome="Paridade de Risco",
+        descricao="Diversifica o risco: cada ativo contribui com a mesma parcela da volatilidade da carteira. "
+                  "Sem teto de volatilidade: o risco resulta da própria alocação.",
+        volatilidade_maxima=None,
+        objetivo="risk_parity",
+        cor_primaria="#B388FF",
+        cor_secundaria="#4527A0",
+        icone="🧩"
     )
 }
 
@@ -104,7 +129,7 @@ def get_parametros_otimizacao(perfil: PerfilRisco) -> dict:
     return {
         "objetivo": perfil.objetivo,
         "volatilidade_maxima": perfil.volatilidade_maxima,
-        "taxa_livre_risco": TAXA_SELIC,
+        "taxa_livre_risco": _taxa_selic_processo(),
         "peso_maximo_ativo": 0.20,
         "peso_minimo_ativo": 0.0
     }
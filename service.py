@@ -0,0 +1,321 @@
+"""
+service.py - Serviço HTTP/JSON local de otimização
+TCC: Otimização de Carteiras de Investimentos
+
+Expõe otimizar_por_perfil, gerar_fronteira_eficiente e backtesting_walk_forward a
+outras ferramentas internas, sem passar pelo dashboard:
+- O trabalho corre num pool de processos limitado (a fila também é limitada: 503 quando cheia)
+- Pedidos idênticos em curso são agrupados (coalescing) e partilham o mesmo resultado
+- GET /metricas reporta profundidade da fila e percentis de latência
+
+Endpoints:
+    POST /otimizar   POST /fronteira   POST /backtest   GET /metricas   GET /saude
+
+O corpo dos POST segue o formato de configuração da CLI (cli.CONFIG_PADRAO).
+Com --provedor sintetico os dados são gerados localmente, permitindo testes de carga offline:
+
+    python -m service --porta 8765 --workers 4 --provedor sintetico
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from cache import cache_data
+
+logger = logging.getLogger(__name__)
+
+OPERACOES = ("otimizar", "fronteira", "backtest")
+
+
+# ============== PROVEDORES DE DADOS (executados nos workers) ==============
+
+@cache_data(ttl=3600)
+def _dados_sinteticos(tickers: list, anos: int, compacto: bool = False,
+                      metodo_covariancia: str = "ledoit_wolf") -> dict:
+    """Painel sintético determinístico por lista de tickers (substituto local do yfinance)."""
+    import data_loader
+
+    semente = zlib.crc32(",".join(tickers).encode())
+    return data_loader.processar_precos(data_loader.gerar_precos_sinteticos(tickers, anos, semente),
+                                        compacto=compacto, metodo_covariancia=metodo_covariancia)
+
+
+def _carregar_dados(config: dict, provedor: str) -> dict:
+    """Obtém o painel processado do provedor pedido (memorizado por processo via cache.py)."""
+    import cli
+    import data_loader
+
+    tickers = cli.resolver_tickers(config)
+    if provedor == "sintetico":
+        return _dados_sinteticos(tickers, config["anos"], config["compacto"], config["metodo_covariancia"])
+
+    dados = data_loader.carregar_dados_universo(tickers, anos=config["anos"], compacto=config["compacto"],
+                                                metodo_covariancia=config["metodo_covariancia"])
+    if dados is None:
+        raise RuntimeError("Não foi possível carregar os dados históricos.")
+    return dados
+
+
+def validar_parametros(parametros: dict) -> None:
+    """Recusa (ValueError) chaves que não existem em cli.CONFIG_PADRAO, incluindo as de "backtest"."""
+    import cli
+
+    desconhecidas = sorted(set(parametros) - set(cli.CONFIG_PADRAO))
+    backtest = parametros.get("backtest", {})
+    if not isinstance(backtest, dict):
+        raise ValueError('"backtest" deve ser um objeto JSON')
+    desconhecidas += [f"backtest.{k}" for k in sorted(set(backtest) - set(cli.CONFIG_PADRAO["backtest"]))]
+    if desconhecidas:
+        raise ValueError(f"Parâmetros desconhecidos: {', '.join(desconhecidas)}")
+
+
+def executar_operacao(operacao: str, parametros: dict, provedor: str = "yahoo") -> dict:
+    """
+    Executa uma operação do pipeline e devolve um resultado serializável em JSON.
+    Função de nível de módulo para poder ser enviada ao ProcessPoolExecutor.
+    """
+    import cli
+    import optimizer
+    import backtesting
+    import risk_profiles
+
+    config = cli.carregar_config(None)
+    backtest_cfg = parametros.pop("backtest", {}) if isinstance(parametros.get("backtest"), dict) else {}
+    config.update(parametros)
+    config["backtest"].update(backtest_cfg)
+
+    dados = _carregar_dados(config, provedor)
+    taxa = risk_profiles.TAXA_SELIC if config["taxa_livre_risco"] is None else float(config["taxa_livre_risco"])
+
+    if operacao == "otimizar":
+        res = optimizer.otimizar_por_perfil(
+            perfil=config["perfil"], retornos_medios=dados['retornos_medios'], matriz_cov=dados['matriz_cov'],
+            taxa_livre_risco=taxa, peso_maximo=config["peso_maximo"], n_ativos_max=config["n_ativos_max"]
+        )
+        return {
+            'pesos': {t: float(p) for t, p in zip(res.tickers, res.pesos) if p > 0.001},
+            'retorno_esperado': res.retorno_esperado,
+            'volatilidade': res.volatilidade,
+            'sharpe': res.sharpe,
+            'sucesso': res.sucesso,
+            'mensagem': res.mensagem
+        }
+
+    if operacao == "fronteira":
+        fronteira = optimizer.gerar_fronteira_eficiente(
+            dados['retornos_medios'], dados['matriz_cov'], taxa, n_pontos=config["n_pontos"],
+            peso_maximo=config["peso_maximo"], n_ativos_max=config["n_ativos_max"]
+        )
+        return {'fronteira': fronteira.to_dict(orient='records')}
+
+    if operacao == "backtest":
+        cfg_bt = config["backtest"]
+        bt = backtesting.backtesting_walk_forward(
+            precos=dados['precos'], perfil=config["perfil"], janela_treino=cfg_bt["janela_treino"],
+            janela_teste=cfg_bt["janela_teste"], capital_inicial=cfg_bt["capital_inicial"],
+            taxa_livre_risco=taxa, n_ativos_max=config["n_ativos_max"], peso_maximo=config["peso_maximo"],
+            metodo_covariancia=config["metodo_covariancia"]
+        )
+        serie = bt['serie_carteira']
+        metricas = {k: float(v) for k, v in bt.items() if isinstance(v, (float, int, np.floating, np.integer))}
+        return {
+            'metricas': metricas,
+            'serie_carteira': {'datas': [d.strftime('%Y-%m-%d') for d in serie.index],
+                               'valores': serie.round(2).tolist()}
+        }
+
+    raise ValueError(f"Operação desconhecida: {operacao}")
+
+
+# ============== NÚCLEO DO SERVIÇO ==============
+
+class FilaCheia(Exception):
+    """A fila de trabalho atingiu o limite configurado."""
+
+
+class ServicoOtimizacao:
+    """
+    Pool de processos limitado com agrupamento de pedidos idênticos em curso.
+
+    Args:
+        max_workers: Processos no pool
+        max_fila: Máximo de tarefas distintas em curso (em execução + à espera)
+        provedor: "yahoo" (data_loader) ou "sintetico" (offline)
+    """
+
+    def __init__(self, max_workers: int = 2, max_fila: int = 32, provedor: str = "yahoo",
+                 janela_latencias: int = 1000):
+        self.provedor = provedor
+        self.max_fila = max_fila
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.max_workers = max_workers
+        self._em_curso: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._latencias: Dict[str, deque] = {op: deque(maxlen=janela_latencias) for op in OPERACOES}
+        self.contadores = {'pedidos': 0, 'agrupados': 0, 'rejeitados': 0, 'erros': 0}
+
+    @staticmethod
+    def chave_pedido(operacao: str, parametros: dict) -> str:
+        """Chave canónica do pedido (JSON ordenado) usada no agrupamento."""
+        conteudo = json.dumps({'op': operacao, 'params': parametros}, sort_keys=True, default=str)
+        return hashlib.sha256(conteudo.encode()).hexdigest()
+
+    def submeter(self, operacao: str, parametros: dict) -> Tuple[Future, bool]:
+        """Retorna (future, agrupado). Lança FilaCheia quando o limite é atingido."""
+        if operacao not in OPERACOES:
+            raise ValueError(f"Operação desconhecida: {operacao}")
+        chave = self.chave_pedido(operacao, parametros)
+        with self._lock:
+            self.contadores['pedidos'] += 1
+            existente = self._em_curso.get(chave)
+            if existente is not None:
+                self.contadores['agrupados'] += 1
+                return existente, True
+            if len(self._em_curso) >= self.max_fila:
+                self.contadores['rejeitados'] += 1
+                raise FilaCheia()
+            future = self._pool.submit(executar_operacao, operacao, dict(parametros), self.provedor)
+            self._em_curso[chave] = future
+
+        def _libertar(_):
+            with self._lock:
+                self._em_curso.pop(chave, None)
+        future.add_done_callback(_libertar)
+        return future, False
+
+    def executar(self, operacao: str, parametros: dict, timeout: Optional[float] = None) -> dict:
+        """Submete (ou junta-se a um pedido idêntico) e espera pelo resultado, registando a latência."""
+        inicio = time.perf_counter()
+        future, agrupado = self.submeter(operacao, parametros)
+        try:
+            resultado = future.result(timeout=timeout)
+        except Exception:
+            with self._lock:
+                self.contadores['erros'] += 1
+            raise
+        finally:
+            latencia = time.perf_counter() - inicio
+            with self._lock:
+                self._latencias[operacao].append(latencia)
+        return {'resultado': resultado, 'agrupado': agrupado}
+
+    def metricas(self) -> dict:
+        """Profundidade da fila, contadores e percentis de latência (ms) por operação."""
+        with self._lock:
+            em_curso = len(self._em_curso)
+            a_executar = sum(1 for f in self._em_curso.values() if f.running())
+            contadores = dict(self.contadores)
+            # Cópias tiradas sob o lock: os percentis calculam-se fora dele
+            copias = {op: list(valores) for op, valores in self._latencias.items()}
+        latencias = {}
+        for op, valores in copias.items():
+            if valores:
+                arr = np.array(valores) * 1000
+                latencias[op] = {'n': len(arr), 'p50': float(np.percentile(arr, 50)),
+                                 'p90': float(np.percentile(arr, 90)), 'p99': float(np.percentile(arr, 99)),
+                                 'max': float(arr.max())}
+        return {
+            'fila': {'em_curso': em_curso, 'a_executar': a_executar,
+                     'em_espera': em_curso - a_executar, 'limite': self.max_fila},
+            'workers': self.max_workers,
+            'provedor': self.provedor,
+            'contadores': contadores,
+            'latencia_ms': latencias
+        }
+
+    def encerrar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ============== CAMADA HTTP ==============
+
+def criar_servidor(servico: ServicoOtimizacao, host: str = "127.0.0.1", porta: int = 8765,
+                   timeout: Optional[float] = 300) -> ThreadingHTTPServer:
+    """Cria o servidor HTTP (uma thread por ligação; o trabalho pesado vai para o pool)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, status: int, corpo: dict, cabecalhos: Optional[dict] = None) -> None:
+            dados = json.dumps(corpo, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(dados)))
+            for k, v in (cabecalhos or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path == '/saude':
+                self._responder(200, {'estado': 'ok'})
+            elif self.path == '/metricas':
+                self._responder(200, servico.metricas())
+            else:
+                self._responder(404, {'erro': 'Rota inexistente'})
+
+        def do_POST(self):
+            operacao = self.path.strip('/')
+            if operacao not in OPERACOES:
+                self._responder(404, {'erro': 'Rota inexistente'})
+                return
+            try:
+                tamanho = int(self.headers.get('Content-Length', 0))
+                parametros = json.loads(self.rfile.read(tamanho) or b'{}')
+                if not isinstance(parametros, dict):
+                    raise ValueError("O corpo deve ser um objeto JSON")
+            except ValueError as e:
+                self._responder(400, {'erro': f'JSON inválido: {e}'})
+                return
+            try:
+                validar_parametros(parametros)
+            except ValueError as e:
+                self._responder(400, {'erro': str(e)})
+                return
+            try:
+                self._responder(200, servico.executar(operacao, parametros, timeout=timeout))
+            except FilaCheia:
+                self._responder(503, {'erro': 'Fila cheia, tente novamente'}, {'Retry-After': '1'})
+            except Exception as e:
+                self._responder(500, {'erro': str(e)})
+
+        def log_message(self, formato, *args):
+            logger.debug("%s - %s", self.address_string(), formato % args)
+
+    return ThreadingHTTPServer((host, porta), Handler)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m service", description="Serviço local de otimização")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="Processos no pool de trabalho")
+    parser.add_argument("--max-fila", type=int, default=32, help="Máximo de tarefas distintas em curso")
+    parser.add_argument("--provedor", choices=["yahoo", "sintetico"], default="yahoo",
+                        help="Origem dos dados (sintetico = offline, para testes de carga)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    servico = ServicoOtimizacao(args.workers, args.max_fila, args.provedor)
+    servidor = criar_servidor(servico, args.host, args.porta)
+    logger.info(f"Serviço em http://{args.host}:{args.porta} ({args.workers} workers, provedor {args.provedor})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servico.encerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+streamlit_compat.py - Ponte opcional para o Streamlit
+TCC: Otimização de Carteiras de Investimentos
+
+Os módulos de análise (data_loader, risk_profiles, ...) não importam o Streamlit:
+só o utilizam quando ele já foi carregado pelo dashboard (app.py) e existe um
+runtime ativo. Em execução headless (CLI, servidores batch) as mensagens seguem
+para o logging. O cache vive em cache.py, onde o Streamlit é um dos backends.
+"""
+
+import sys
+import logging
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+
+def streamlit_ativo() -> bool:
+    """True quando o processo corre dentro do dashboard (Streamlit importado e com runtime)."""
+    st = sys.modules.get('streamlit')
+    if st is None:
+        return False
+    try:
+        from streamlit import runtime
+        return runtime.exists()
+    except Exception:
+        return False
+
+
+@contextlib.contextmanager
+def spinner(mensagem: str):
+    """st.spinner no dashboard; registo no logging em modo headless."""
+    if streamlit_ativo():
+        import streamlit as st
+        with st.spinner(mensagem):
+            yield
+    else:
+        logger.info(mensagem)
+        yield
+
+
+def erro(mensagem: str) -> None:
+    """Reporta um erro ao utilizador (st.error) ou ao log."""
+    logger.error(mensagem)
+    if streamlit_ativo():
+        import streamlit as st
+        st.error(mensagem)
+
+
+def aviso(mensagem: str) -> None:
+    """Reporta um aviso ao utilizador (st.warning) ou ao log."""
+    logger.warning(mensagem)
+    if streamlit_ativo():
+        import streamlit as st
+        st.warning(mensagem)
@@ -0,0 +1,158 @@
+"""
+stress_test.py - Cenários de stress históricos (vetorizados)
+TCC: Otimização de Carteiras de Investimentos
+
+Cada cenário é um intervalo de datas de uma crise real. O MotorStress guarda, para
+todos os cenários com dados, o crescimento acumulado de cada ativo desde o início
+do cenário (uma matriz empilhada ΣT x n). O valor de k carteiras buy-and-hold em
+todos os dias de todos os cenários sai então de um único produto matricial
+(ΣT x n) @ (n x k), o que permite avaliar todos os pontos da fronteira de uma vez.
+
+Por cenário e carteira: P&L acumulado, pior dia e drawdown máximo.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CenarioStress:
+    """Janela histórica de crise (datas inclusivas)."""
+    nome: str
+    inicio: str
+    fim: str
+    descricao: str = ""
+
+
+# Datas aproximadas de pico a vale do Ibovespa em cada episódio
+CENARIOS_HISTORICOS: Dict[str, CenarioStress] = {c.nome: c for c in [
+    CenarioStress("Crise de 2008", "2008-05-20", "2008-10-27", "Falência do Lehman Brothers e crise de crédito global"),
+    CenarioStress("Recessão de 2015", "2015-05-05", "2016-01-26", "Recessão, perda do grau de investimento e crise política"),
+    CenarioStress("Joesley Day", "2017-05-17", "2017-05-18", "Circuit breaker após a divulgação das gravações de Joesley Batista"),
+    CenarioStress("Greve dos caminhoneiros", "2018-05-18", "2018-06-18", "Paralisação nacional e choque de expectativas"),
+    CenarioStress("COVID-19", "2020-02-21", "2020-03-23", "Queda de março de 2020 (seis circuit breakers)"),
+    CenarioStress("Aperto monetário de 2021", "2021-06-08", "2021-11-30", "Ciclo de alta da Selic e risco fiscal"),
+    CenarioStress("Risco fiscal de 2024", "2024-08-28", "2024-12-18", "Desvalorização do real e abertura da curva de juros"),
+]}
+
+
+@dataclass
+class ResultadoStress:
+    """Métricas por cenário (linhas) e carteira (colunas), em fração do capital."""
+    cenarios: List[str]
+    carteiras: List[str]
+    pnl: np.ndarray              # Retorno acumulado no cenário
+    pior_dia: np.ndarray         # Pior retorno diário
+    max_drawdown: np.ndarray     # Drawdown máximo dentro do cenário
+    dias: np.ndarray             # Dias úteis com dados em cada cenário
+    parcial: np.ndarray          # True se o cenário começa antes ou acaba depois dos dados carregados
+
+    def tabela(self, carteira: Union[int, str] = 0) -> pd.DataFrame:
+        """Cenários x métricas de uma carteira (por posição ou nome)."""
+        j = self.carteiras.index(carteira) if isinstance(carteira, str) else carteira
+        return pd.DataFrame({'pnl': self.pnl[:, j], 'pior_dia': self.pior_dia[:, j],
+                             'max_drawdown': self.max_drawdown[:, j], 'dias': self.dias,
+                             'parcial': self.parcial},
+                            index=pd.Index(self.cenarios, name='cenario'))
+
+    def metrica(self, nome: str) -> pd.DataFrame:
+        """Cenários x carteiras de uma métrica ('pnl', 'pior_dia' ou 'max_drawdown')."""
+        return pd.DataFrame(getattr(self, nome), index=pd.Index(self.cenarios, name='cenario'),
+                            columns=self.carteiras)
+
+
+class MotorStress:
+    """
+    Pré-calcula o crescimento acumulado dos ativos em cada cenário e avalia carteiras em lote.
+
+    Args:
+        retornos: DataFrame de retornos diários (datas x ativos)
+        cenarios: Cenários a aplicar (omissão: CENARIOS_HISTORICOS)
+        logaritmicos: True se `retornos` são log-retornos (como data_loader.calcular_retornos)
+        min_dias: Cenários com menos dias de dados no período são ignorados
+
+    Cenários que só se sobrepõem em parte ao período carregado (início antes do primeiro
+    retorno ou fim depois do último) são avaliados no troço disponível e marcados em
+    self.parciais / ResultadoStress.parcial.
+    Ativos sem cotação num dia (ex.: ainda não listados) contam com retorno zero.
+    As carteiras são buy-and-hold desde o primeiro dia do cenário.
+    """
+
+    def __init__(self, retornos: pd.DataFrame, cenarios: Optional[Dict[str, CenarioStress]] = None,
+                 logaritmicos: bool = True, min_dias: int = 1):
+        cenarios = CENARIOS_HISTORICOS if cenarios is None else cenarios
+        self.tickers = list(retornos.columns)
+        valores = retornos.to_numpy(dtype=np.float64)
+        simples = np.expm1(valores) if logaritmicos else valores.copy()
+        np.nan_to_num(simples, copy=False, nan=0.0)
+
+        blocos, self.cenarios, self.ignorados, self.parciais, limites = [], [], [], [], [0]
+        for nome, cenario in cenarios.items():
+            inicio, fim = pd.Timestamp(cenario.inicio), pd.Timestamp(cenario.fim)
+            mascara = (retornos.index >= inicio) & (retornos.index <= fim)
+            if mascara.sum() < min_dias:
+                self.ignorados.append(nome)
+                continue
+            blocos.append(np.cumprod(1.0 + simples[mascara], axis=0))
+            self.cenarios.append(nome)
+            limites.append(limites[-1] + int(mascara.sum()))
+            if inicio < retornos.index[0] or fim > retornos.index[-1]:
+                self.parciais.append(nome)
+
+        n = len(self.tickers)
+        self._crescimento = np.ascontiguousarray(np.vstack(blocos)) if blocos else np.empty((0, n))
+        self._limites = np.array(limites)
+        if self.ignorados:
+            logger.info(f"Cenários sem dados no período carregado: {', '.join(self.ignorados)}")
+        if self.parciais:
+            logger.info(f"Cenários só em parte no período carregado: {', '.join(self.parciais)}")
+
+    def _matriz_pesos(self, pesos) -> np.ndarray:
+        """Converte dict / Series / DataFrame / array em (k x n) alinhado com self.tickers e normalizado."""
+        if isinstance(pesos, dict):
+            pesos = pd.Series(pesos)
+        if isinstance(pesos, pd.Series):
+            pesos = pesos.to_frame().T
+        if isinstance(pesos, pd.DataFrame):
+            W = pesos.reindex(columns=self.tickers, fill_value=0.0).to_numpy(dtype=np.float64)
+        else:
+            W = np.atleast_2d(np.asarray(pesos, dtype=np.float64))
+            if W.shape[1] != len(self.tickers):
+                raise ValueError(f"Pesos com {W.shape[1]} ativos; o motor tem {len(self.tickers)}.")
+        somas = W.sum(axis=1, keepdims=True)
+        return np.divide(W, somas, out=np.zeros_like(W), where=somas != 0)
+
+    def avaliar(self, pesos, nomes: Optional[List[str]] = None) -> ResultadoStress:
+        """
+        Aplica todos os cenários a k carteiras.
+
+        Args:
+            pesos: Vetor (n,), matriz (k x n) na ordem de self.tickers, dict {ticker: peso}
+                   ou DataFrame (k x tickers)
+            nomes: Nomes das carteiras (omissão: índice do DataFrame ou 0..k-1)
+        """
+        W = self._matriz_pesos(pesos)
+        k = W.shape[0]
+        if nomes is None:
+            nomes = list(pesos.index) if isinstance(pesos, pd.DataFrame) else [str(j) for j in range(k)]
+
+        # Valor (base 1) de cada carteira em cada dia de cada cenário: um único produto
+        valor = self._crescimento @ W.T
+
+        c = len(self.cenarios)
+        pnl, pior_dia, max_dd = (np.empty((c, k)) for _ in range(3))
+        for i in range(c):
+            trajeto = np.vstack([np.ones((1, k)), valor[self._limites[i]:self._limites[i + 1]]])
+            pnl[i] = trajeto[-1] - 1.0
+            pior_dia[i] = (trajeto[1:] / trajeto[:-1] - 1.0).min(axis=0)
+            max_dd[i] = (trajeto / np.maximum.accumulate(trajeto, axis=0) - 1.0).min(axis=0)
+
+        return ResultadoStress(cenarios=list(self.cenarios), carteiras=nomes, pnl=pnl, pior_dia=pior_dia,
+                               max_drawdown=max_dd, dias=np.diff(self._limites),
+                               parcial=np.array([nome in self.parciais for nome in self.cenarios], dtype=bool))
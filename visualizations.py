@@ -3,11 +3,13 @@ visualizations.py - Gráficos Plotly para o Dashboard (Rigor Quantitativo)
 TCC: Otimização de Carteiras de Investimentos
 """
 
-import plotly.express as px
 import plotly.graph_objects as go
+from plotly.colors import qualitative
 import pandas as pd
 import numpy as np
-from typing import Dict, Optional
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 # Paleta de cores adaptada para contraste institucional
 CORES = {
@@ -18,22 +20,100 @@ CORES = {
     'conservador': '#00D4AA',
     'moderado': '#FFB74D',
     'agressivo': '#FF5252',
+    'paridade de risco': '#B388FF',
     'azul': '#667EEA',
     'roxo': '#764BA2',
     'alerta': '#FF3366'
 }
 
+# ============== DOWNSAMPLING DE SÉRIES TEMPORAIS (LTTB) ==============
+
+MAX_PONTOS_SERIE = 1500   # Orçamento de pontos por traço nas séries temporais (None = resolução total)
+
+
+def indices_lttb(x: np.ndarray, y: np.ndarray, n_pontos: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013): escolhe n_pontos índices que
+    preservam a forma visual da série. O primeiro e o último ponto são sempre mantidos,
+    e os extremos globais (pico e vale) são acrescentados se o LTTB não os tiver escolhido.
+    
+    Args:
+        x: Abcissas crescentes (float)
+        y: Ordenadas (sem NaN)
+        n_pontos: Orçamento de pontos (>= 3)
+        
+    Returns:
+        Índices ordenados dos pontos selecionados
+    """
+    n = len(x)
+    if n_pontos >= n or n_pontos < 3:
+        return np.arange(n)
+    
+    # n_pontos - 2 baldes interiores; os limites do balde i são [limites[i], limites[i + 1])
+    limites = np.linspace(1, n - 1, n_pontos - 1).astype(np.int64)
+    selecionados = np.empty(n_pontos, dtype=np.int64)
+    selecionados[0], selecionados[-1] = 0, n - 1
+    
+    anterior = 0
+    for i in range(n_pontos - 2):
+        ini, fim = limites[i], limites[i + 1]
+        # Vértice C: média do balde seguinte (o último ponto, no caso do último balde)
+        prox_fim = limites[i + 2] if i + 2 < len(limites) else n
+        cx, cy = x[fim:prox_fim].mean(), y[fim:prox_fim].mean()
+        ax, ay = x[anterior], y[anterior]
+        area = np.abs((ax - cx) * (y[ini:fim] - ay) - (ax - x[ini:fim]) * (cy - ay))
+        anterior = ini + int(np.argmax(area))
+        selecionados[i + 1] = anterior
+    
+    return np.union1d(selecionados, [int(np.argmin(y)), int(np.argmax(y))])
+
+
+def reduzir_serie(serie: pd.Series, max_pontos: Optional[int] = MAX_PONTOS_SERIE) -> pd.Series:
+    """
+    Reduz a série a ~max_pontos pontos com LTTB antes de construir o traço Plotly.
+    Os pontos mantidos são observações reais (hover exato); max_pontos=None devolve a série intacta.
+    """
+    serie = serie.dropna()
+    if max_pontos is None or len(serie) <= max_pontos:
+        return serie
+    if isinstance(serie.index, pd.DatetimeIndex):
+        x = ((serie.index - serie.index[0]) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+    else:
+        x = np.arange(len(serie), dtype=np.float64)
+    return serie.iloc[indices_lttb(x, serie.to_numpy(dtype=np.float64), max_pontos)]
+
+
 def grafico_fronteira_eficiente(fronteira: pd.DataFrame, carteira_otima: dict, 
                                  perfil: str, taxa_livre_risco: float = 0.1075,
-                                 benchmark_1n: dict = None) -> go.Figure:
+                                 benchmark_1n: dict = None,
+                                 nuvem: pd.DataFrame = None) -> go.Figure:
     """
     Gráfico da Fronteira Eficiente.
     Corrigido para aceitar a taxa livre de risco dinamicamente e evitar distorções de escala.
     Inclui ponto de benchmark 1/N (carteira equiponderada) quando fornecido.
+    A região viável (nuvem Monte Carlo) é desenhada por densidade a partir do resumo
+    em células de optimizer.gerar_nuvem_portfolios, nunca amostra a amostra.
     """
     cor_perfil = CORES.get(perfil.lower(), CORES['moderado'])
     fig = go.Figure()
     
+    if nuvem is not None and not nuvem.empty:
+        # Opacidade proporcional à densidade (escala log) para destacar o núcleo da região viável
+        densidade = np.log1p(nuvem['contagem'].values)
+        opacidade = 0.15 + 0.65 * densidade / densidade.max()
+        fig.add_trace(go.Scatter(
+            x=nuvem['volatilidade'] * 100,
+            y=nuvem['retorno'] * 100,
+            mode='markers',
+            name=f"Carteiras Viáveis ({nuvem.attrs.get('n_amostras', nuvem['contagem'].sum()):,})",
+            marker=dict(symbol='square', size=7, color=nuvem['sharpe_medio'], colorscale='Viridis',
+                        opacity=opacidade, showscale=True,
+                        colorbar=dict(title='Sharpe', thickness=12, x=1.02)),
+            customdata=np.column_stack([nuvem['contagem'], nuvem['sharpe_medio']]),
+            hovertemplate='Volatilidade: %{x:.2f}%<br>Retorno: %{y:.2f}%<br>'
+                          'Carteiras: %{customdata[0]:,}<br>Sharpe médio: %{customdata[1]:.3f}<extra></extra>'
+        ))
+    
     if not fronteira.empty:
         fig.add_trace(go.Scatter(
             x=fronteira['volatilidade'] * 100,
@@ -88,6 +168,80 @@ def grafico_fronteira_eficiente(fronteira: pd.DataFrame, carteira_otima: dict,
     
     return fig
 
+def grafico_superficie_fronteira(superficie, taxa_livre_risco: float = None) -> go.Figure:
+    """
+    Evolução da fronteira eficiente ao longo das janelas do walk-forward (animação).
+    Cada quadro é a fronteira de uma janela (cor = Sharpe), com a da janela anterior
+    a tracejado; os eixos e a escala de cor são fixos para que as mudanças sejam comparáveis.
+
+    Args:
+        superficie: backtesting.SuperficieFronteira
+    """
+    ret = superficie.valores[..., 0].astype(np.float64) * 100
+    vol = superficie.valores[..., 1].astype(np.float64) * 100
+    sharpe = superficie.valores[..., 2].astype(np.float64)
+    rotulos = [d.strftime('%Y-%m-%d') for d in superficie.datas]
+    fig = go.Figure()
+    if not np.isfinite(ret).any():
+        return fig
+
+    def _margem(valores: np.ndarray) -> List[float]:
+        minimo, maximo = np.nanmin(valores), np.nanmax(valores)
+        folga = 0.05 * (maximo - minimo or 1.0)
+        return [minimo - folga, maximo + folga]
+
+    sharpe_min, sharpe_max = float(np.nanmin(sharpe)), float(np.nanmax(sharpe))
+
+    def _tracos(i: int) -> List[go.Scatter]:
+        anterior = max(i - 1, 0)
+        return [
+            go.Scatter(x=vol[anterior], y=ret[anterior], mode='lines', name='Janela anterior',
+                       line=dict(color='#888', width=1.5, dash='dash'), hoverinfo='skip'),
+            go.Scatter(x=vol[i], y=ret[i], mode='lines+markers', name='Fronteira',
+                       line=dict(color=CORES['azul'], width=3),
+                       marker=dict(size=7, color=sharpe[i], colorscale='Viridis', cmin=sharpe_min, cmax=sharpe_max,
+                                   showscale=True, colorbar=dict(title='Sharpe', thickness=12)),
+                       customdata=sharpe[i],
+                       hovertemplate='Volatilidade: %{x:.2f}%<br>Retorno: %{y:.2f}%<br>'
+                                     'Sharpe: %{customdata:.3f}<extra></extra>')
+        ]
+
+    for traco in _tracos(0):
+        fig.add_trace(traco)
+    fig.frames = [go.Frame(data=_tracos(i), name=rotulo) for i, rotulo in enumerate(rotulos)]
+
+    if taxa_livre_risco is not None:
+        taxa_pct = taxa_livre_risco * 100
+        fig.add_hline(y=taxa_pct, line_dash="dash", line_color="#888",
+                      annotation_text=f"Taxa Sem Risco ({taxa_pct:.2f}%)", annotation_position="bottom right")
+
+    passos = [dict(method='animate', label=rotulo,
+                   args=[[rotulo], dict(mode='immediate', frame=dict(duration=0, redraw=True),
+                                        transition=dict(duration=0))])
+              for rotulo in rotulos]
+    fig.update_layout(
+        title=dict(text='Evolução da Fronteira Eficiente (Walk-Forward)', font=dict(size=18, color=CORES['texto'])),
+        xaxis=dict(title='Risco / Volatilidade (% a.a.)', range=_margem(vol)),
+        yaxis=dict(title='Retorno Esperado (% a.a.)', range=_margem(ret)),
+        template='plotly_dark',
+        paper_bgcolor=CORES['fundo'],
+        plot_bgcolor=CORES['card'],
+        font=dict(color=CORES['texto']),
+        legend=dict(x=0.02, y=0.98, bgcolor='rgba(0,0,0,0)'),
+        height=550,
+        updatemenus=[dict(type='buttons', showactive=False, x=0.0, y=-0.12, xanchor='left', direction='left',
+                          buttons=[
+                              dict(label='Play', method='animate',
+                                   args=[None, dict(frame=dict(duration=600, redraw=True), fromcurrent=True,
+                                                    transition=dict(duration=300))]),
+                              dict(label='Pausa', method='animate',
+                                   args=[[None], dict(mode='immediate', frame=dict(duration=0, redraw=False))])
+                          ])],
+        sliders=[dict(active=0, x=0.12, y=-0.08, len=0.88, currentvalue=dict(prefix='Janela: '), steps=passos)]
+    )
+    return fig
+
+
 def grafico_composicao_pizza(pesos: dict, orcamento: float) -> go.Figure:
     """Gráfico estático da última alocação recomendada."""
     # Filtro rigoroso: Otimizadores convexos evitam caudas infinitas, limpamos < 0.1%
@@ -98,7 +252,7 @@ def grafico_composicao_pizza(pesos: dict, orcamento: float) -> go.Figure:
     labels = [t.replace('.SA', '') for t in pesos_filtrados.keys()]
     valores = list(pesos_filtrados.values())
     valores_reais = [v * orcamento for v in valores]
-    cores = px.colors.qualitative.Pastel[:len(labels)]
+    cores = qualitative.Pastel[:len(labels)]
     
     fig = go.Figure(data=[go.Pie(
         labels=labels,
@@ -160,11 +314,18 @@ def grafico_barras_alocacao(pesos: dict, orcamento: float, info_tickers: dict) -
     )
     return fig
 
-def grafico_matriz_correlacao(matriz_cov: pd.DataFrame) -> go.Figure:
-    """
-    Heatmap institucional da estrutura de dependência estatística.
-    Inclui salvaguarda contra NaN derivada de matrizes estabilizadas com baixa variância.
-    """
+# ============== MATRIZ DE CORRELAÇÃO (NÍVEL DE DETALHE) ==============
+
+LIMIAR_TEXTO_CELULAS = 20     # Até este nº de ativos os valores são escritos nas células
+LIMIAR_AGREGACAO = 60         # Acima deste nº de ativos a vista inicial agrega em blocos
+MAX_ORDENACOES_CACHE = 32
+
+# Impressão digital da covariância -> (tickers ordenados, rótulo de cluster por ticker)
+_cache_ordenacao: "OrderedDict[str, Tuple[List[str], Dict[str, int]]]" = OrderedDict()
+
+
+def _matriz_correlacao(matriz_cov: pd.DataFrame) -> np.ndarray:
+    """Correlação a partir da covariância, com salvaguarda contra NaN (variância nula)."""
     std = np.sqrt(np.diag(matriz_cov))
     # Proteção: Substitui zeros por 1 para a divisão para evitar runtime warnings/NaNs
     std_safe = np.where(std == 0, 1.0, std) 
@@ -172,46 +333,162 @@ def grafico_matriz_correlacao(matriz_cov: pd.DataFrame) -> go.Figure:
     corr = matriz_cov.values / np.outer(std_safe, std_safe)
     # Limpeza para assets sem volatilidade real (casos limite de optimização)
     corr = np.where(np.outer(std, std) == 0, 0, corr)
-    corr = np.clip(corr, -1.0, 1.0) 
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _impressao_digital(matriz_cov: pd.DataFrame) -> str:
+    conteudo = hashlib.sha1(np.ascontiguousarray(matriz_cov.to_numpy(dtype=np.float64)).tobytes())
+    conteudo.update("|".join(map(str, matriz_cov.columns)).encode())
+    return conteudo.hexdigest()
+
+
+def ordenar_por_clusters(matriz_cov: pd.DataFrame) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Ordenação dos ativos por clustering hierárquico (ligação média sobre d = sqrt((1 - ρ) / 2)),
+    com ~sqrt(n) clusters planos. Calculada uma vez por covariância (cache por impressão digital).
+    
+    Returns:
+        Tuple com (tickers na ordem das folhas do dendrograma, ticker -> nº do cluster)
+    """
+    chave = _impressao_digital(matriz_cov)
+    if chave in _cache_ordenacao:
+        _cache_ordenacao.move_to_end(chave)
+        return _cache_ordenacao[chave]
     
-    labels = [t.replace('.SA', '') for t in matriz_cov.columns]
+    tickers = list(matriz_cov.columns)
+    if len(tickers) < 3:
+        resultado = (tickers, {t: 1 for t in tickers})
+    else:
+        from scipy.cluster.hierarchy import fcluster, leaves_list, linkage
+        from scipy.spatial.distance import squareform
+        
+        distancia = np.sqrt(np.clip((1.0 - _matriz_correlacao(matriz_cov)) / 2.0, 0.0, None))
+        np.fill_diagonal(distancia, 0.0)
+        ligacao = linkage(squareform(distancia, checks=False), method='average')
+        n_clusters = int(np.clip(round(np.sqrt(len(tickers))), 2, 20))
+        rotulos = fcluster(ligacao, t=n_clusters, criterion='maxclust')
+        resultado = ([tickers[k] for k in leaves_list(ligacao)],
+                     {t: int(c) for t, c in zip(tickers, rotulos)})
     
-    fig = go.Figure(data=go.Heatmap(
-        z=corr,
+    _cache_ordenacao[chave] = resultado
+    while len(_cache_ordenacao) > MAX_ORDENACOES_CACHE:
+        _cache_ordenacao.popitem(last=False)
+    return resultado
+
+
+def blocos_correlacao(matriz_cov: pd.DataFrame, agrupar_por: str = 'setor') -> Dict[str, List[str]]:
+    """
+    Agrupa os ativos em blocos para a vista agregada ('setor' via assets.py ou 'cluster').
+    Os tickers de cada bloco seguem a ordenação hierárquica; os blocos, a ordem da primeira folha.
+    """
+    ordem, clusters = ordenar_por_clusters(matriz_cov)
+    if agrupar_por == 'setor':
+        from assets import get_ticker_info
+        info = get_ticker_info()
+        rotulo = {t: info.get(t, {}).get('setor', 'Outros') for t in ordem}
+    else:
+        rotulo = {t: f"Cluster {clusters[t]}" for t in ordem}
+    
+    blocos: Dict[str, List[str]] = {}
+    for t in ordem:
+        blocos.setdefault(rotulo[t], []).append(t)
+    return blocos
+
+
+def _agregar_blocos(corr: np.ndarray, indices: List[np.ndarray]) -> np.ndarray:
+    """
+    Correlação média entre blocos (G^T C G / n_i n_j); na diagonal, média fora da diagonal
+    do próprio bloco (ou 1 para blocos de um só ativo).
+    """
+    pertenca = np.zeros((corr.shape[0], len(indices)))
+    for k, idx in enumerate(indices):
+        pertenca[idx, k] = 1.0
+    contagem = pertenca.sum(axis=0)
+    somas = pertenca.T @ corr @ pertenca
+    media = somas / np.outer(contagem, contagem)
+    pares_internos = contagem * (contagem - 1)
+    diagonal = np.where(pares_internos > 0, (np.diag(somas) - contagem) / np.maximum(pares_internos, 1), 1.0)
+    np.fill_diagonal(media, diagonal)
+    return media
+
+
+def grafico_matriz_correlacao(matriz_cov: pd.DataFrame, agrupar_por: str = 'cluster',
+                              bloco: Optional[str] = None,
+                              limiar_agregacao: int = LIMIAR_AGREGACAO) -> go.Figure:
+    """
+    Heatmap institucional da estrutura de dependência estatística.
+    Inclui salvaguarda contra NaN derivada de matrizes estabilizadas com baixa variância.
+    
+    Os ativos são ordenados por clustering hierárquico. Acima de `limiar_agregacao` ativos
+    mostra a correlação média entre blocos (setor ou cluster); `bloco` faz o drill-down
+    para os ativos de um bloco. Valores nas células só até LIMIAR_TEXTO_CELULAS ativos,
+    e a matriz segue em float32 (codificação binária compacta do Plotly).
+    """
+    ordem, _ = ordenar_por_clusters(matriz_cov)
+    blocos = blocos_correlacao(matriz_cov, agrupar_por) if len(ordem) > limiar_agregacao or bloco else {}
+    if bloco not in blocos:
+        bloco = None
+    agregado = bloco is None and len(ordem) > limiar_agregacao
+    if bloco is not None:
+        ordem = blocos[bloco]
+    
+    matriz = matriz_cov.loc[ordem, ordem]
+    corr = _matriz_correlacao(matriz)
+    
+    if agregado:
+        posicao = {t: k for k, t in enumerate(ordem)}
+        indices = [np.array([posicao[t] for t in membros]) for membros in blocos.values()]
+        corr = _agregar_blocos(corr, indices)
+        labels = [f"{nome} ({len(membros)})" for nome, membros in blocos.items()]
+        titulo = f'Matriz de Correlacao Media por {"Setor" if agrupar_por == "setor" else "Cluster"}'
+        hover = '%{x}<br>%{y}<br>Correlação média: %{z:.3f}<extra></extra>'
+    else:
+        labels = [t.replace('.SA', '') for t in ordem]
+        titulo = 'Matriz de Correlacao' + (f' - {bloco}' if bloco else '')
+        hover = '%{x} vs %{y}<br>Matriz de Correlação: %{z:.3f}<extra></extra>'
+    
+    z = corr.astype(np.float32)
+    mostrar_texto = len(labels) <= LIMIAR_TEXTO_CELULAS
+    heatmap = dict(
+        z=z,
         x=labels,
         y=labels,
         colorscale='RdBu_r',
         zmid=0,
-        text=np.round(corr, 2),
-        texttemplate='%{text}',
-        textfont=dict(size=10, color='white'),
-        hovertemplate='%{x} vs %{y}<br>Matriz de Correlação: %{z:.3f}<extra></extra>'
-    ))
+        hovertemplate=hover
+    )
+    if mostrar_texto:
+        heatmap.update(text=np.round(corr, 2), texttemplate='%{text}',
+                       textfont=dict(size=10, color='white'))
+    
+    fig = go.Figure(data=go.Heatmap(**heatmap))
     
     fig.update_layout(
-        title=dict(text='Matriz de Correlacao', font=dict(size=18, color=CORES['texto'])),
+        title=dict(text=titulo, font=dict(size=18, color=CORES['texto'])),
         template='plotly_dark',
         paper_bgcolor=CORES['fundo'],
         height=650,
-        xaxis=dict(tickangle=45, title=''),
-        yaxis=dict(title='')
+        xaxis=dict(tickangle=45, title='', showticklabels=len(labels) <= 80),
+        yaxis=dict(title='', showticklabels=len(labels) <= 80)
     )
     return fig
 
-def grafico_evolucao_precos(precos: pd.DataFrame, tickers_selecionados: list) -> go.Figure:
-    """Tracking visual de retorno acumulativo estático."""
+def grafico_evolucao_precos(precos: pd.DataFrame, tickers_selecionados: list,
+                            max_pontos: Optional[int] = MAX_PONTOS_SERIE) -> go.Figure:
+    """Tracking visual de retorno acumulativo estático (cada série reduzida por LTTB)."""
     # Previne divisão por zeros no início da base
     precos_base = precos[tickers_selecionados].copy()
     precos_base = precos_base.replace(0, np.nan).bfill() 
     precos_norm = precos_base / precos_base.iloc[0] * 100
     
     fig = go.Figure()
-    cores = px.colors.qualitative.Bold
+    cores = qualitative.Bold
     
     for i, col in enumerate(precos_norm.columns):
+        serie = reduzir_serie(precos_norm[col], max_pontos)
         fig.add_trace(go.Scatter(
-            x=precos_norm.index,
-            y=precos_norm[col],
+            x=serie.index,
+            y=serie.values,
             mode='lines',
             name=col.replace('.SA', ''),
             line=dict(width=1.5, color=cores[i % len(cores)]),
@@ -233,18 +510,21 @@ def grafico_evolucao_precos(precos: pd.DataFrame, tickers_selecionados: list) ->
     return fig
 
 def grafico_backtesting(serie_carteira: pd.Series, serie_benchmark: pd.Series = None,
-                        nome_benchmark: str = "IBOV", serie_1n: pd.Series = None) -> go.Figure:
+                        nome_benchmark: str = "IBOV", serie_1n: pd.Series = None,
+                        max_pontos: Optional[int] = MAX_PONTOS_SERIE) -> go.Figure:
     """
     A prova visual empírica do motor Out-of-Sample.
     Inclui comparação com Ibovespa e carteira 1/N (equiponderada) conforme Q1 do TCC.
+    Normalização e alinhamento usam a série completa; só os traços são reduzidos (LTTB).
     """
     fig = go.Figure()
 
     carteira_norm = serie_carteira / serie_carteira.iloc[0] * 100
+    carteira_plot = reduzir_serie(carteira_norm, max_pontos)
 
     fig.add_trace(go.Scatter(
-        x=carteira_norm.index,
-        y=carteira_norm.values,
+        x=carteira_plot.index,
+        y=carteira_plot.values,
         mode='lines',
         name='Carteira Otimizada',
         line=dict(color=CORES['azul'], width=2.5),
@@ -257,7 +537,7 @@ def grafico_backtesting(serie_carteira: pd.Series, serie_benchmark: pd.Series =
         datas_comuns = carteira_norm.index.intersection(serie_benchmark.index)
         if len(datas_comuns) > 5:
             benchmark_norm = serie_benchmark.loc[datas_comuns]
-            benchmark_norm = benchmark_norm / benchmark_norm.iloc[0] * 100
+            benchmark_norm = reduzir_serie(benchmark_norm / benchmark_norm.iloc[0] * 100, max_pontos)
 
             fig.add_trace(go.Scatter(
                 x=benchmark_norm.index,
@@ -272,7 +552,7 @@ def grafico_backtesting(serie_carteira: pd.Series, serie_benchmark: pd.Series =
         serie_1n_norm = serie_1n / serie_1n.iloc[0] * 100
         datas_comuns_1n = carteira_norm.index.intersection(serie_1n_norm.index)
         if len(datas_comuns_1n) > 5:
-            serie_1n_plot = serie_1n_norm.loc[datas_comuns_1n]
+            serie_1n_plot = reduzir_serie(serie_1n_norm.loc[datas_comuns_1n], max_pontos)
             fig.add_trace(go.Scatter(
                 x=serie_1n_plot.index,
                 y=serie_1n_plot.values,
@@ -298,13 +578,15 @@ def grafico_backtesting(serie_carteira: pd.Series, serie_benchmark: pd.Series =
     )
     return fig
 
-def grafico_drawdown(drawdown_serie: pd.Series) -> go.Figure:
-    """Grafico de drawdowns (quedas de pico a vale)."""
+def grafico_drawdown(drawdown_serie: pd.Series,
+                     max_pontos: Optional[int] = MAX_PONTOS_SERIE) -> go.Figure:
+    """Grafico de drawdowns (quedas de pico a vale). O vale máximo é sempre mantido na redução LTTB."""
     fig = go.Figure()
+    drawdown_plot = reduzir_serie(drawdown_serie, max_pontos)
     
     fig.add_trace(go.Scatter(
-        x=drawdown_serie.index,
-        y=drawdown_serie.values * 100,
+        x=drawdown_plot.index,
+        y=drawdown_plot.values * 100,
         mode='lines',
         name='Drawdown',
         line=dict(color=CORES['alerta'], width=1.5),
@@ -346,8 +628,9 @@ def grafico_pesos_historicos(df_pesos: pd.DataFrame) -> go.Figure:
     (VISIONÁRIO): Gráfico da evolução dos pesos da carteira durante o Walk-Forward.
     df_pesos deve ter como índice a Data e colunas os Ativos.
     """
+    import plotly.express as px  # Import local: só este gráfico usa o plotly.express
     fig = px.area(df_pesos, 
-                  color_discrete_sequence=px.colors.qualitative.Prism,
+                  color_discrete_sequence=qualitative.Prism,
                   title="🔄 Rebalanceamentos Estruturais (Evolução de Pesos OOS)")
                   
     fig.update_layout(
@@ -402,4 +685,83 @@ def grafico_metricas_risco(metricas: dict) -> go.Figure:
         height=350,
         showlegend=False
     )
-    return fig
\ No newline at end of file
+    return fig
+
+
+def grafico_stress_cenarios(resultado, metrica: str = 'pnl') -> go.Figure:
+    """
+    Barras agrupadas por cenário histórico (stress_test.ResultadoStress), uma cor por carteira.
+    Cada cenário mostra os dias com dados, e os cenários cortados pelo período carregado
+    são marcados como parciais.
+
+    Args:
+        metrica: 'pnl' (retorno acumulado), 'pior_dia' ou 'max_drawdown'
+    """
+    titulos = {'pnl': 'Retorno Acumulado no Cenário', 'pior_dia': 'Pior Dia', 'max_drawdown': 'Drawdown Máximo'}
+    valores = resultado.metrica(metrica) * 100
+    paleta = [CORES['azul'], CORES['moderado'], CORES['conservador'], CORES['roxo'], CORES['agressivo']]
+    rotulos = [f"{nome}<br>{dias} dias" + (" (parcial)" if parcial else "")
+               for nome, dias, parcial in zip(valores.index, resultado.dias, resultado.parcial)]
+
+    fig = go.Figure()
+    for j, carteira in enumerate(valores.columns):
+        fig.add_trace(go.Bar(
+            x=rotulos,
+            y=valores[carteira],
+            name=str(carteira),
+            marker=dict(color=paleta[j % len(paleta)]),
+            text=[f'{v:.1f}%' for v in valores[carteira]],
+            textposition='outside',
+            hovertemplate=f'<b>{carteira}</b><br>%{{x}}: %{{y:.2f}}%<extra></extra>'
+        ))
+
+    fig.add_hline(y=0, line_color='#888', line_width=1)
+    fig.update_layout(
+        title=dict(text=f'Cenários de Stress Históricos — {titulos[metrica]}', font=dict(size=18, color=CORES['texto'])),
+        xaxis_title='',
+        yaxis_title=f'{titulos[metrica]} (%)',
+        barmode='group',
+        template='plotly_dark',
+        paper_bgcolor=CORES['fundo'],
+        plot_bgcolor=CORES['card'],
+        font=dict(color=CORES['texto']),
+        legend=dict(orientation='h', y=1.08, x=0, bgcolor='rgba(0,0,0,0)'),
+        height=420
+    )
+    return fig
+
+def grafico_comparacao_benchmarks(comparacao, max_pontos: Optional[int] = MAX_PONTOS_SERIE) -> go.Figure:
+    """
+    Curvas base 100 da carteira e de todos os benchmarks no calendário comum
+    (backtesting.ComparacaoBenchmarks). A carteira é o primeiro traço, a cheio.
+    """
+    paleta = [CORES['alerta'], CORES['moderado'], CORES['conservador'], CORES['roxo'],
+              CORES['agressivo'], CORES['paridade de risco'], '#90A4AE']
+    fig = go.Figure()
+    for j, nome in enumerate(comparacao.normalizados.columns):
+        serie = reduzir_serie(comparacao.normalizados[nome], max_pontos)
+        carteira = j == 0
+        fig.add_trace(go.Scatter(
+            x=serie.index,
+            y=serie.values,
+            mode='lines',
+            name=str(nome),
+            line=dict(color=CORES['azul'] if carteira else paleta[(j - 1) % len(paleta)],
+                      width=2.5 if carteira else 1.5, dash=None if carteira else 'dot'),
+            hovertemplate=f'{nome}: %{{y:.2f}}<extra></extra>'
+        ))
+
+    fig.add_hline(y=100, line_dash="solid", line_color="#444", line_width=1)
+    fig.update_layout(
+        title=dict(text='Carteira vs Benchmarks (Base 100)', font=dict(size=18, color=CORES['texto'])),
+        xaxis_title='',
+        yaxis_title='Capital Indexado (Base 100)',
+        template='plotly_dark',
+        paper_bgcolor=CORES['fundo'],
+        plot_bgcolor=CORES['card'],
+        font=dict(color=CORES['texto']),
+        height=450,
+        legend=dict(orientation='h', y=-0.15),
+        hovermode='x unified'
+    )
+    return fig